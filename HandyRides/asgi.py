@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
+
+The Procfile serves this with ``gunicorn -k uvicorn_worker.UvicornWorker``, so
+the async road-route endpoints, including the batch one the map uses, keep
+many routing lookups in flight per worker; ``python manage.py
+loadtest_road_route`` compares that with blocking WSGI workers.
 """
 
 import os
@@ -22,6 +22,13 @@ def _env_csv(name, default=""):
     return [item.strip() for item in os.getenv(name, default).split(",") if item.strip()]
 
 
+def _env_int(name, default):
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return int(value)
+
+
 HAS_WHITENOISE = find_spec("whitenoise") is not None
 
 SECRET_KEY = os.getenv("DJANGO_SECRET_KEY", "dev-only-secret-key")
@@ -89,11 +96,16 @@ DATABASES = {
     }
 }
 if dj_database_url and os.getenv("DATABASE_URL"):
+    # Served under ASGI (see Procfile), where Django cannot reuse a
+    # persistent connection across requests: connections are closed after
+    # each request and Postgres ones come from psycopg's pool instead.
     DATABASES["default"] = dj_database_url.config(
         default=os.getenv("DATABASE_URL"),
-        conn_max_age=600,
+        conn_max_age=0,
         ssl_require=not DEBUG,
     )
+    if DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql":
+        DATABASES["default"].setdefault("OPTIONS", {})["pool"] = True
 
 
 # Password validation
@@ -151,3 +163,87 @@ if not DEBUG:
     CSRF_COOKIE_SECURE = True
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Road-route cache: size of the per-worker LRU tier and how long entries live
+# (seconds) in both the LRU and the shared database tier.
+ROUTE_CACHE_MAX_ENTRIES = _env_int("ROUTE_CACHE_MAX_ENTRIES", 2048)
+ROUTE_CACHE_MAX_BYTES = _env_int("ROUTE_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+ROUTE_CACHE_TTL = _env_int("ROUTE_CACHE_TTL", 30 * 24 * 60 * 60)
+# Failed upstream lookups are cached briefly so a struggling routing backend is
+# not hammered, but recover quickly once it is back.
+ROUTE_NEGATIVE_CACHE_TTL = _env_int("ROUTE_NEGATIVE_CACHE_TTL", 60)
+# Browser/CDN caching of road-route API responses (seconds). Routes for a key
+# are effectively immutable; straight-line fallbacks are retried soon.
+ROUTE_RESPONSE_MAX_AGE = _env_int("ROUTE_RESPONSE_MAX_AGE", 7 * 24 * 60 * 60)
+ROUTE_FALLBACK_MAX_AGE = _env_int("ROUTE_FALLBACK_MAX_AGE", 60)
+
+# Where road geometry comes from: "osrm" (the public OSRM server) or "offline"
+# (shortest paths over the bundled road graph, no network; see
+# rides/road_graph.py and the build_road_graph command).
+ROUTING_BACKEND = os.getenv("ROUTING_BACKEND", "osrm")
+ROAD_GRAPH_PATH = os.getenv("ROAD_GRAPH_PATH", str(BASE_DIR / "rides" / "data" / "road_graph.bin"))
+# Endpoints farther than this from every graph node get no offline route.
+ROAD_GRAPH_MAX_SNAP_METERS = _env_int("ROAD_GRAPH_MAX_SNAP_METERS", 25000)
+
+# Place index used to geocode ride cities; rebuild it with build_gazetteer.
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", str(BASE_DIR / "rides" / "data" / "places.bin"))
+
+# Ride list pagination: rides per page (callers may ask for up to the maximum
+# with ?page_size=) and how far the match count is counted exactly before it
+# is shown as "over N".
+RIDES_PAGE_SIZE = _env_int("RIDES_PAGE_SIZE", 24)
+RIDES_MAX_PAGE_SIZE = _env_int("RIDES_MAX_PAGE_SIZE", 100)
+RIDES_COUNT_LIMIT = _env_int("RIDES_COUNT_LIMIT", 1000)
+
+# Typo-tolerant search, used when a keyword search finds nothing: minimum
+# trigram similarity (0-1) of a city or name, and how long (seconds) a
+# worker's in-process trigram index is kept before being rebuilt (SQLite; on
+# Postgres pg_trgm does the matching).
+FUZZY_SEARCH_THRESHOLD = float(os.getenv("FUZZY_SEARCH_THRESHOLD", "0.3"))
+FUZZY_INDEX_TTL = _env_int("FUZZY_INDEX_TTL", 300)
+
+# Per-worker cache of search result pages (entries, bytes, seconds). Entries
+# are keyed by the ride data generation, so any ride write invalidates them.
+SEARCH_CACHE_MAX_ENTRIES = _env_int("SEARCH_CACHE_MAX_ENTRIES", 4096)
+SEARCH_CACHE_MAX_BYTES = _env_int("SEARCH_CACHE_MAX_BYTES", 8 * 1024 * 1024)
+SEARCH_CACHE_TTL = _env_int("SEARCH_CACHE_TTL", 10 * 60)
+
+# Seconds a worker keeps its search-box suggestion index before rebuilding it
+# from the database (its own writes are applied immediately).
+SUGGEST_INDEX_TTL = _env_int("SUGGEST_INDEX_TTL", 300)
+
+# Rendered home and map pages and template fragments (see rides/page_cache.py)
+# are cached in the "pages" cache, keyed by the ride data generation, so every
+# ride write retires them. PAGE_CACHE_BACKEND picks where they live: "locmem"
+# (per worker), "file" (shared by the workers on one host; PAGE_CACHE_LOCATION
+# is a directory) or "redis" (shared by all hosts; PAGE_CACHE_LOCATION is a
+# redis:// URL and the redis package must be installed).
+PAGE_CACHE_TTL = _env_int("PAGE_CACHE_TTL", 300)
+PAGE_CACHE_BACKEND = os.getenv("PAGE_CACHE_BACKEND", "locmem")
+PAGE_CACHE_ALIAS = "pages"
+_PAGE_CACHE_BACKENDS = {
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", "sparkrides-pages"),
+    "file": (
+        "django.core.cache.backends.filebased.FileBasedCache",
+        str(BASE_DIR / ".page_cache"),
+    ),
+    "redis": ("django.core.cache.backends.redis.RedisCache", "redis://127.0.0.1:6379/1"),
+}
+_page_cache_class, _page_cache_location = _PAGE_CACHE_BACKENDS[PAGE_CACHE_BACKEND]
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    PAGE_CACHE_ALIAS: {
+        "BACKEND": _page_cache_class,
+        "LOCATION": os.getenv("PAGE_CACHE_LOCATION", _page_cache_location),
+        "TIMEOUT": PAGE_CACHE_TTL,
+        "KEY_PREFIX": "sparkrides",
+    },
+}
+
+# Ride density and corridor map tiles (rides/tiles.py) are cached as files
+# under this directory, one subdirectory per tile generation; a ride write
+# that changes what tiles draw starts a new generation.
+RIDE_TILE_CACHE_DIR = os.getenv("RIDE_TILE_CACHE_DIR", str(BASE_DIR / ".tile_cache"))
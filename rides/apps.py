@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class RidesConfig(AppConfig):
     name = 'rides'
+
+    def ready(self):
+        from . import signals  # noqa: F401 - connects the Person write hooks.
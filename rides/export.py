@@ -0,0 +1,87 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .search import matching_rides
+from .spatial import rides_near
+
+EXPORT_FORMATS = {
+  "csv": "text/csv; charset=utf-8",
+  "ndjson": "application/x-ndjson",
+}
+
+EXPORT_FIELDS = (
+  "id",
+  "first_name",
+  "origination",
+  "destination_city",
+  "destination_state",
+  "date",
+  "time",
+  "taking_passengers",
+  "seats_available",
+  "age",
+  "relationship_status",
+  "occupation",
+  "interests",
+  "personality_style",
+  "looking_for",
+  "bio",
+  "origin_lat",
+  "origin_lng",
+  "destination_lat",
+  "destination_lng",
+)
+
+# Rows fetched per round trip (a server-side cursor on Postgres).
+EXPORT_CHUNK_SIZE = 2000
+
+
+def export_rows(cleaned_data=None):
+  # Tuples of EXPORT_FIELDS for the rides matching RideForm's cleaned data
+  # (all rides when None), in list order, fetched EXPORT_CHUNK_SIZE at a time
+  # so memory use does not grow with the table.
+  people, _, _ = matching_rides(cleaned_data)
+  near_point = cleaned_data and cleaned_data["near_point"]
+  if near_point:
+    distances = rides_near(
+      *near_point, cleaned_data["radius_km"], cleaned_data["near_side"], people
+    )
+    people = people.filter(pk__in=list(distances))
+  # Keyword rank is dropped: exports are in the ride list's order.
+  people = people.order_by("date", "time", "first_name", "id")
+  return people.values_list(*EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+# Leading characters that make spreadsheet apps read a cell as a formula.
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _csv_cell(value):
+  # Text cells that would run as a formula are quoted with a leading "'".
+  if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+    return "'" + value
+  return value
+
+
+class _Line:
+  # File-like target for csv.writer that hands back each formatted line.
+  def write(self, value):
+    return value
+
+
+def csv_lines(rows):
+  writer = csv.writer(_Line())
+  yield writer.writerow(EXPORT_FIELDS)
+  for row in rows:
+    yield writer.writerow([_csv_cell(value) for value in row])
+
+
+def ndjson_lines(rows):
+  for row in rows:
+    yield json.dumps(dict(zip(EXPORT_FIELDS, row)), cls=DjangoJSONEncoder) + "\n"
+
+
+def export_lines(export_format, rows):
+  return csv_lines(rows) if export_format == "csv" else ndjson_lines(rows)
@@ -1,5 +1,6 @@
 from django import forms
 
+from .geocoding import geocode_place
 from .models import Person
 
 
@@ -17,6 +18,7 @@ class RideForm(forms.Form):
         "placeholder": "e.g. Austin, Dallas, or TX",
         "class": INPUT_CLASS,
         "autocomplete": "off",
+        "list": "search-suggestions",
       }
     ),
   )
@@ -40,6 +42,52 @@ class RideForm(forms.Form):
     initial=True,
     widget=forms.CheckboxInput(attrs={"class": "checkbox-field"}),
   )
+  near = forms.CharField(
+    label="Near",
+    max_length=64,
+    required=False,
+    widget=forms.TextInput(
+      attrs={
+        "placeholder": "e.g. Menlo Park, CA",
+        "class": INPUT_CLASS,
+        "autocomplete": "off",
+      }
+    ),
+  )
+  radius_km = forms.TypedChoiceField(
+    label="Within",
+    choices=[(5, "5 km"), (10, "10 km"), (25, "25 km"), (50, "50 km"), (100, "100 km")],
+    coerce=int,
+    required=False,
+    empty_value=25,
+    initial=25,
+    widget=forms.Select(attrs={"class": SELECT_CLASS}),
+  )
+  near_side = forms.ChoiceField(
+    label="Of the",
+    choices=[
+      ("origin", "Start"),
+      ("destination", "Destination"),
+      ("either", "Start or destination"),
+    ],
+    required=False,
+    initial="origin",
+    widget=forms.Select(attrs={"class": SELECT_CLASS}),
+  )
+
+  def clean(self):
+    cleaned_data = super().clean()
+    cleaned_data["near_side"] = cleaned_data.get("near_side") or "origin"
+    cleaned_data["near_point"] = None
+
+    near = (cleaned_data.get("near") or "").strip()
+    if near:
+      point = geocode_place(near)
+      if point is None:
+        self.add_error("near", "We couldn't find that place. Try \"City, ST\".")
+      else:
+        cleaned_data["near_point"] = point
+    return cleaned_data
 
 
 class NewRideForm(forms.ModelForm):
@@ -0,0 +1,166 @@
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import BooleanField, Case, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest
+
+from .models import Person
+
+# Columns searched for close spellings ("Sna Jose", "Mountian View").
+FUZZY_FIELDS = ("origination", "destination_city", "first_name")
+
+# Most distinct values a fuzzy search expands to.
+FUZZY_MAX_VALUES = 40
+
+
+def trigrams(text):
+  # pg_trgm's trigrams: lowercase alphanumeric words, each padded with two
+  # spaces in front and one behind.
+  grams = set()
+  for word in re.findall(r"[a-z0-9]+", (text or "").lower()):
+    padded = f"  {word} "
+    grams.update(padded[index:index + 3] for index in range(len(padded) - 2))
+  return grams
+
+
+def similarity(first, second):
+  # Shared trigrams over all trigrams, like pg_trgm's similarity().
+  first, second = trigrams(first), trigrams(second)
+  if not first or not second:
+    return 0.0
+  shared = len(first & second)
+  return shared / (len(first) + len(second) - shared)
+
+
+# In-process trigram index over the distinct values of FUZZY_FIELDS. Lookups
+# touch only the posting lists of the query's trigrams, so their cost follows
+# the number of distinct cities and names, not the number of rides.
+class TrigramIndex:
+  def __init__(self, values=()):
+    self._lock = threading.Lock()
+    self._keys = {}
+    self._spellings = []
+    self._sizes = []
+    self._postings = defaultdict(list)
+    self.add(values)
+
+  def __len__(self):
+    return len(self._spellings)
+
+  def add(self, values):
+    with self._lock:
+      for value in values:
+        value = (value or "").strip()
+        key = " ".join(re.findall(r"[a-z0-9]+", value.lower()))
+        if not key:
+          continue
+        position = self._keys.get(key)
+        if position is None:
+          position = self._keys[key] = len(self._spellings)
+          grams = trigrams(key)
+          self._spellings.append(set())
+          self._sizes.append(len(grams))
+          for gram in grams:
+            self._postings[gram].append(position)
+        self._spellings[position].add(value)
+
+  def search(self, text, threshold=0.3, limit=FUZZY_MAX_VALUES):
+    # [(value, similarity)] for stored values at least `threshold` similar to
+    # `text`, most similar first. Every stored spelling of a match is listed.
+    grams = trigrams(text)
+    if not grams:
+      return []
+    with self._lock:
+      shared = Counter()
+      for gram in grams:
+        shared.update(self._postings.get(gram, ()))
+      scored = []
+      for position, count in shared.items():
+        score = count / (len(grams) + self._sizes[position] - count)
+        if score >= threshold:
+          scored.append((score, position))
+      scored.sort(key=lambda item: (-item[0], item[1]))
+      return [
+        (value, score)
+        for score, position in scored[:limit]
+        for value in sorted(self._spellings[position])
+      ]
+
+
+_INDEX = None
+_INDEX_BUILT_AT = 0.0
+_INDEX_LOCK = threading.Lock()
+
+
+def get_fuzzy_index():
+  # Built from the database on first use and again every FUZZY_INDEX_TTL
+  # seconds, so values saved through other workers show up too. Saves in this
+  # worker are added straight away (see signals.py).
+  global _INDEX, _INDEX_BUILT_AT
+  with _INDEX_LOCK:
+    if _INDEX is None or time.monotonic() - _INDEX_BUILT_AT > settings.FUZZY_INDEX_TTL:
+      values = set()
+      for field in FUZZY_FIELDS:
+        values.update(Person.objects.order_by().values_list(field, flat=True).distinct())
+      _INDEX = TrigramIndex(values)
+      _INDEX_BUILT_AT = time.monotonic()
+    return _INDEX
+
+
+def reset_fuzzy_index():
+  global _INDEX
+  with _INDEX_LOCK:
+    _INDEX = None
+
+
+def index_ride_values(ride):
+  with _INDEX_LOCK:
+    index = _INDEX
+  if index is not None:
+    index.add(getattr(ride, field) for field in FUZZY_FIELDS)
+
+
+def fuzzy_search_rides(queryset, text):
+  # `queryset` narrowed to rides whose origin, destination city or first name
+  # is a close spelling of `text`, annotated with `search_rank` (the best
+  # trigram similarity, 0 to 1).
+  phrase = " ".join(re.findall(r"[a-z0-9]+", (text or "").lower()))
+  threshold = settings.FUZZY_SEARCH_THRESHOLD
+  vendor = connections[queryset.db].vendor
+  if not phrase:
+    return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+  if vendor == "postgresql":
+    # `%` is pg_trgm's similarity operator; it can use the GIN trigram
+    # indexes from migration 0010.
+    match = " OR ".join(f"lower({field}) %% %s" for field in FUZZY_FIELDS)
+    score = "GREATEST(" + ", ".join(f"similarity(lower({field}), %s)" for field in FUZZY_FIELDS) + ")"
+    return (
+      queryset.alias(fuzzy_match=RawSQL(f"({match})", (phrase,) * 3, output_field=BooleanField()))
+      .filter(fuzzy_match=True)
+      .annotate(search_rank=RawSQL(score, (phrase,) * 3, output_field=FloatField()))
+      .filter(search_rank__gte=threshold)
+    )
+
+  matches = get_fuzzy_index().search(phrase, threshold)
+  if not matches:
+    return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+  values = [value for value, _ in matches]
+  query = Q()
+  scores = []
+  for field in FUZZY_FIELDS:
+    query |= Q(**{f"{field}__in": values})
+    scores.append(
+      Case(
+        *(When(**{field: value}, then=Value(score)) for value, score in matches),
+        default=Value(0.0),
+        output_field=FloatField(),
+      )
+    )
+  return queryset.filter(query).annotate(search_rank=Greatest(*scores))
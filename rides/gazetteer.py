@@ -0,0 +1,278 @@
+import mmap
+import re
+import struct
+import sys
+import threading
+import unicodedata
+from array import array
+
+# File layout, little-endian:
+#   header   magic b"HGZ1", place count, key bytes, name bytes
+#   int32    latitudes, microdegrees                      [places]
+#   int32    longitudes, microdegrees                     [places]
+#   uint32   key offsets                                  [places + 1]
+#   uint32   display-name offsets                         [places + 1]
+#   uint32   place indexes ordered by name, then state    [places]
+#   bytes    keys, "st|normalized name", sorted
+#   bytes    display names, UTF-8
+# Places are stored in key order, so a state's places are one contiguous run
+# and both exact and prefix lookups are binary searches over the mapped file.
+GAZETTEER_MAGIC = b"HGZ1"
+GAZETTEER_HEADER = struct.Struct("<4sIII")
+COORDINATE_SCALE = 1e6
+
+# Length of the "st|" prefix of every key.
+STATE_PREFIX = 3
+
+# Common abbreviations, expanded so "St. Louis" and "Saint Louis" meet.
+ABBREVIATIONS = {"st": "saint", "ste": "sainte", "ft": "fort", "mt": "mount"}
+
+FUZZY_CACHE_SIZE = 4096
+
+
+def normalize_place_name(name):
+  # Lowercase ASCII words without punctuation, abbreviations spelled out.
+  text = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode("ascii")
+  words = re.sub(r"[^a-z0-9]+", " ", text.lower()).split()
+  return " ".join(ABBREVIATIONS.get(word, word) for word in words)
+
+
+def _place_key(state, name):
+  # States are folded to ASCII like names, so "Ça" looks up "ca" and input
+  # that folds to nothing simply matches no place.
+  state = unicodedata.normalize("NFKD", state or "").encode("ascii", "ignore").decode("ascii")
+  return f"{state.strip().lower()[:2]:<2}|{normalize_place_name(name)}".encode("ascii")
+
+
+def _edit_distance(first, second, limit):
+  # Levenshtein distance, or limit + 1 once it is certain to exceed `limit`.
+  if abs(len(first) - len(second)) > limit:
+    return limit + 1
+
+  previous = list(range(len(second) + 1))
+  for row, first_char in enumerate(first, 1):
+    current = [row]
+    for column, second_char in enumerate(second, 1):
+      current.append(
+        min(
+          previous[column] + 1,
+          current[column - 1] + 1,
+          previous[column - 1] + (first_char != second_char),
+        )
+      )
+    if min(current) > limit:
+      return limit + 1
+    previous = current
+  return previous[-1]
+
+
+def write_gazetteer(path, places):
+  # `places` is an iterable of (state, name, lat, lng). Later duplicates of a
+  # normalized (state, name) are dropped.
+  by_key = {}
+  for state, name, latitude, longitude in places:
+    key = _place_key(state, name)
+    if len(key) > STATE_PREFIX and key not in by_key:
+      by_key[key] = (name.strip(), latitude, longitude)
+
+  keys = sorted(by_key)
+  latitudes = array("i")
+  longitudes = array("i")
+  key_offsets = array("I", [0])
+  name_offsets = array("I", [0])
+  key_blob = bytearray()
+  name_blob = bytearray()
+  for key in keys:
+    name, latitude, longitude = by_key[key]
+    latitudes.append(round(latitude * COORDINATE_SCALE))
+    longitudes.append(round(longitude * COORDINATE_SCALE))
+    key_blob += key
+    key_offsets.append(len(key_blob))
+    name_blob += name.encode("utf-8")
+    name_offsets.append(len(name_blob))
+
+  by_name = array("I", sorted(range(len(keys)), key=lambda index: keys[index][STATE_PREFIX:]))
+  sections = (latitudes, longitudes, key_offsets, name_offsets, by_name)
+  if sys.byteorder != "little":
+    for section in sections:
+      section.byteswap()
+
+  with open(path, "wb") as handle:
+    handle.write(GAZETTEER_HEADER.pack(GAZETTEER_MAGIC, len(keys), len(key_blob), len(name_blob)))
+    for section in sections:
+      section.tofile(handle)
+    handle.write(key_blob)
+    handle.write(name_blob)
+  return len(keys)
+
+
+# Read-only, memory-mapped place index. Nothing is parsed or copied on open, so
+# a worker loads it instantly and forked workers share the same pages.
+class Gazetteer:
+  def __init__(self, path):
+    with open(path, "rb") as handle:
+      self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, count, key_bytes, name_bytes = GAZETTEER_HEADER.unpack_from(self._map)
+    if magic != GAZETTEER_MAGIC:
+      self._map.close()
+      raise ValueError(f"{path} is not a gazetteer file")
+
+    self.count = count
+    view = self._view = memoryview(self._map)
+    position = GAZETTEER_HEADER.size
+    sections = []
+    for code, size in (("i", count), ("i", count), ("I", count + 1), ("I", count + 1), ("I", count)):
+      chunk = view[position:position + 4 * size]
+      if sys.byteorder != "little":
+        chunk = array(code, chunk.tobytes())
+        chunk.byteswap()
+      else:
+        chunk = chunk.cast(code)
+      sections.append(chunk)
+      position += 4 * size
+
+    (
+      self._latitudes,
+      self._longitudes,
+      self._key_offsets,
+      self._name_offsets,
+      self._by_name,
+    ) = sections
+    self._keys_start = position
+    self._names_start = position + key_bytes
+    if len(self._map) < self._names_start + name_bytes:
+      self.close()
+      raise ValueError(f"{path} is truncated")
+
+    self._fuzzy_cache = {}
+    self._fuzzy_lock = threading.Lock()
+
+  def __len__(self):
+    return self.count
+
+  def _key(self, index):
+    start = self._keys_start
+    return self._map[start + self._key_offsets[index]:start + self._key_offsets[index + 1]]
+
+  def _place(self, index):
+    start = self._names_start
+    key = self._key(index).decode("ascii")
+    return {
+      "name": self._map[
+        start + self._name_offsets[index]:start + self._name_offsets[index + 1]
+      ].decode("utf-8"),
+      "state": key[:2].upper(),
+      "lat": self._latitudes[index] / COORDINATE_SCALE,
+      "lng": self._longitudes[index] / COORDINATE_SCALE,
+    }
+
+  def coordinates(self, index):
+    return self._latitudes[index] / COORDINATE_SCALE, self._longitudes[index] / COORDINATE_SCALE
+
+  def _lower_bound(self, target, key_of, low=0, high=None):
+    high = self.count if high is None else high
+    while low < high:
+      middle = (low + high) // 2
+      if key_of(middle) < target:
+        low = middle + 1
+      else:
+        high = middle
+    return low
+
+  def _name_key(self, position):
+    return self._key(self._by_name[position])[STATE_PREFIX:]
+
+  def find(self, name, state):
+    # Index of the place called `name` in `state`, or None.
+    key = _place_key(state, name)
+    index = self._lower_bound(key, self._key)
+    if index < self.count and self._key(index) == key:
+      return index
+    return None
+
+  def find_anywhere(self, name):
+    # Indexes of every place called `name`, in any state.
+    target = normalize_place_name(name).encode("ascii")
+    if not target:
+      return []
+
+    position = self._lower_bound(target, self._name_key)
+    found = []
+    while position < self.count and self._name_key(position) == target:
+      found.append(self._by_name[position])
+      position += 1
+    return found
+
+  def find_fuzzy(self, name, state, max_distance=2):
+    # Closest place name in `state` within `max_distance` edits, or None.
+    # Scans the state's run of keys, so results are cached.
+    key = _place_key(state, name)
+    cache_key = (key, max_distance)
+    with self._fuzzy_lock:
+      if cache_key in self._fuzzy_cache:
+        return self._fuzzy_cache[cache_key]
+
+    prefix = key[:STATE_PREFIX]
+    target = key[STATE_PREFIX:].decode("ascii")
+    low = self._lower_bound(prefix, self._key)
+    high = self._lower_bound(prefix[:2] + b"}", self._key, low)
+    best = None
+    best_distance = max_distance + 1
+    if len(target) > max_distance:
+      for index in range(low, high):
+        candidate = self._key(index)[STATE_PREFIX:].decode("ascii")
+        distance = _edit_distance(target, candidate, best_distance - 1)
+        if distance < best_distance:
+          best = index
+          best_distance = distance
+          if not distance:
+            break
+
+    with self._fuzzy_lock:
+      if len(self._fuzzy_cache) >= FUZZY_CACHE_SIZE:
+        self._fuzzy_cache.clear()
+      self._fuzzy_cache[cache_key] = best
+    return best
+
+  def prefix(self, text, state=None, limit=10):
+    # Places whose normalized name starts with `text`, alphabetically, as
+    # dicts with name, state, lat and lng.
+    target = normalize_place_name(text).encode("ascii")
+    if not target or limit <= 0:
+      return []
+
+    if state:
+      prefix = _place_key(state, "")
+      position = self._lower_bound(prefix + target, self._key)
+      indexes = []
+      while position < self.count and len(indexes) < limit:
+        key = self._key(position)
+        if not key.startswith(prefix + target):
+          break
+        indexes.append(position)
+        position += 1
+    else:
+      position = self._lower_bound(target, self._name_key)
+      indexes = []
+      while position < self.count and len(indexes) < limit:
+        if not self._name_key(position).startswith(target):
+          break
+        indexes.append(self._by_name[position])
+        position += 1
+
+    return [self._place(index) for index in indexes]
+
+  def close(self):
+    sections = (
+      self._latitudes,
+      self._longitudes,
+      self._key_offsets,
+      self._name_offsets,
+      self._by_name,
+    )
+    for section in sections:
+      if isinstance(section, memoryview):
+        section.release()
+    self._view.release()
+    self._map.close()
@@ -0,0 +1,174 @@
+import threading
+
+from django.conf import settings
+
+from .gazetteer import Gazetteer
+from .geometry import geohash_common_cell, geohash_encode
+
+STATE_CENTERS = {
+  "AK": (63.5888, -154.4931),
+  "AL": (32.3182, -86.9023),
+  "AR": (35.2011, -91.8318),
+  "AZ": (34.0489, -111.0937),
+  "CA": (36.7783, -119.4179),
+  "CO": (39.5501, -105.7821),
+  "CT": (41.6032, -73.0877),
+  "DC": (38.9072, -77.0369),
+  "DE": (38.9108, -75.5277),
+  "FL": (27.6648, -81.5158),
+  "GA": (32.1574, -82.9071),
+  "HI": (19.8987, -155.6659),
+  "IA": (41.8780, -93.0977),
+  "ID": (44.0682, -114.7420),
+  "IL": (40.6331, -89.3985),
+  "IN": (40.5512, -85.6024),
+  "KS": (39.0119, -98.4842),
+  "KY": (37.8393, -84.2700),
+  "LA": (31.2448, -92.1450),
+  "MA": (42.4072, -71.3824),
+  "MD": (39.0458, -76.6413),
+  "ME": (45.2538, -69.4455),
+  "MI": (44.3148, -85.6024),
+  "MN": (46.7296, -94.6859),
+  "MO": (37.9643, -91.8318),
+  "MS": (32.3547, -89.3985),
+  "MT": (46.8797, -110.3626),
+  "NC": (35.7596, -79.0193),
+  "ND": (47.5515, -101.0020),
+  "NE": (41.4925, -99.9018),
+  "NH": (43.1939, -71.5724),
+  "NJ": (40.0583, -74.4057),
+  "NM": (34.9727, -105.0324),
+  "NV": (38.8026, -116.4194),
+  "NY": (43.2994, -74.2179),
+  "OH": (40.4173, -82.9071),
+  "OK": (35.0078, -97.0929),
+  "OR": (43.8041, -120.5542),
+  "PA": (41.2033, -77.1945),
+  "RI": (41.5801, -71.4774),
+  "SC": (33.8361, -81.1637),
+  "SD": (43.9695, -99.9018),
+  "TN": (35.5175, -86.5804),
+  "TX": (31.9686, -99.9018),
+  "UT": (39.3210, -111.0937),
+  "VA": (37.4316, -78.6569),
+  "VT": (44.5588, -72.5778),
+  "WA": (47.7511, -120.7401),
+  "WI": (43.7844, -88.7879),
+  "WV": (38.5976, -80.4549),
+  "WY": (43.0760, -107.2903),
+}
+
+_GAZETTEER = None
+_GAZETTEER_LOCK = threading.Lock()
+
+
+def get_gazetteer():
+  # Opened once per process. With `gunicorn --preload` that happens before the
+  # fork, and since the file is memory-mapped the workers share its pages.
+  global _GAZETTEER
+  with _GAZETTEER_LOCK:
+    if _GAZETTEER is None:
+      _GAZETTEER = Gazetteer(settings.GAZETTEER_PATH)
+    return _GAZETTEER
+
+
+def resolve_coordinates(city_name, state_code):
+  # Best guess at a city's coordinates: the place in the given state, else the
+  # only place of that name anywhere (riders often enter their destination's
+  # state for their origin), else a close spelling in the state, else the
+  # state's center.
+  state = (state_code or "").strip().upper()
+  gazetteer = get_gazetteer()
+
+  if (city_name or "").strip():
+    index = gazetteer.find(city_name, state)
+    if index is None:
+      matches = gazetteer.find_anywhere(city_name)
+      if len(matches) == 1:
+        index = matches[0]
+    if index is None and state:
+      index = gazetteer.find_fuzzy(city_name, state)
+    if index is not None:
+      return gazetteer.coordinates(index)
+
+  return STATE_CENTERS.get(state)
+
+
+def geocode_place(text):
+  # Coordinates for free text like "Menlo Park, CA", "Menlo Park CA" or a
+  # unique "Menlo Park", or None. Unlike resolve_coordinates() this never
+  # settles for a state center.
+  text = (text or "").strip()
+  name, _, state = text.rpartition(",")
+  if not name:
+    words = text.split()
+    if len(words) > 1 and len(words[-1]) == 2:
+      name, state = " ".join(words[:-1]), words[-1]
+    else:
+      name, state = text, ""
+  state = state.strip()
+
+  gazetteer = get_gazetteer()
+  index = None
+  if state:
+    index = gazetteer.find(name, state)
+    if index is None:
+      index = gazetteer.find_fuzzy(name, state)
+  else:
+    matches = gazetteer.find_anywhere(name)
+    if len(matches) == 1:
+      index = matches[0]
+
+  return None if index is None else gazetteer.coordinates(index)
+
+
+def geocode_ride_endpoints(ride):
+  # (origin, destination) for a ride, or None when neither side resolves. If
+  # only one side is known it stands in for the other.
+  origin = resolve_coordinates(ride.origination, ride.destination_state)
+  destination = resolve_coordinates(ride.destination_city, ride.destination_state)
+
+  if not origin and destination:
+    origin = destination
+  if not destination and origin:
+    destination = origin
+
+  if not origin or not destination:
+    return None
+  return origin, destination
+
+
+def resolve_ride_endpoints(ride):
+  # Like geocode_ride_endpoints(), but uses the coordinates stored on the ride
+  # when it has them.
+  if ride.origin_lat is not None and ride.destination_lat is not None:
+    return (ride.origin_lat, ride.origin_lng), (ride.destination_lat, ride.destination_lng)
+  return geocode_ride_endpoints(ride)
+
+
+def set_ride_coordinates(ride):
+  # Store the geocoded endpoints and their geohashes on `ride` (not saved).
+  # Returns True when anything changed.
+  endpoints = geocode_ride_endpoints(ride)
+  if endpoints is None:
+    values = (None, None, None, None, "", "", None)
+  else:
+    origin, destination = endpoints
+    origin_geohash = geohash_encode(*origin)
+    destination_geohash = geohash_encode(*destination)
+    values = (
+      *origin,
+      *destination,
+      origin_geohash,
+      destination_geohash,
+      geohash_common_cell(origin_geohash, destination_geohash),
+    )
+
+  current = tuple(getattr(ride, field) for field in ride.COORDINATE_FIELDS)
+  if values == current:
+    return False
+
+  for field, value in zip(ride.COORDINATE_FIELDS, values):
+    setattr(ride, field, value)
+  return True
@@ -0,0 +1,381 @@
+import math
+
+try:
+  import numpy
+except ImportError:  # pragma: no cover - without numpy, decoding falls back to Python.
+  numpy = None
+
+# Web Mercator tile size in pixels; Leaflet's default.
+TILE_SIZE = 256
+
+# Mercator is undefined at the poles; clamp like Leaflet does.
+MAX_MERCATOR_LATITUDE = 85.0511287798
+
+EARTH_RADIUS_KM = 6371.0088
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+
+# A spatial query is answered from at most this many geohash cells; the
+# precision is the finest one that covers the search box within the limit.
+GEOHASH_MAX_CELLS = 16
+
+
+def _project(point):
+  # [lat, lng] -> Web Mercator world coordinates in the 0..1 range.
+  latitude = max(-MAX_MERCATOR_LATITUDE, min(MAX_MERCATOR_LATITUDE, point[0]))
+  x = (point[1] + 180.0) / 360.0
+  sin_latitude = math.sin(math.radians(latitude))
+  y = 0.5 - math.log((1 + sin_latitude) / (1 - sin_latitude)) / (4 * math.pi)
+  return x, y
+
+
+def _unproject(x, y):
+  # Inverse of _project().
+  longitude = x * 360.0 - 180.0
+  latitude = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+  return latitude, longitude
+
+
+def tile_box(zoom, x, y):
+  # (south, west, north, east) of slippy-map tile x/y at `zoom`.
+  scale = 2 ** zoom
+  north, west = _unproject(x / scale, y / scale)
+  south, east = _unproject((x + 1) / scale, (y + 1) / scale)
+  return south, west, north, east
+
+
+def tile_range(box, zoom):
+  # (first x, last x, first y, last y) of the tiles at `zoom` that cover
+  # (south, west, north, east).
+  south, west, north, east = box
+  scale = 2 ** zoom
+  left, top = _project((north, west))
+  right, bottom = _project((south, east))
+  last = scale - 1
+  return (
+    max(0, min(last, int(left * scale))),
+    max(0, min(last, int(right * scale))),
+    max(0, min(last, int(top * scale))),
+    max(0, min(last, int(bottom * scale))),
+  )
+
+
+def pixel_tolerance(zoom, pixels=1.0):
+  # Size of `pixels` screen pixels at `zoom`, in world coordinates.
+  return pixels / (TILE_SIZE * 2 ** zoom)
+
+
+def simplify_path(points, tolerance):
+  # Douglas-Peucker simplification of a [lat, lng] path. `tolerance` is in Web
+  # Mercator world units (see pixel_tolerance), so the result is accurate to a
+  # fixed number of screen pixels at a given zoom level anywhere on the map.
+  if len(points) < 3 or tolerance <= 0:
+    return list(points)
+
+  projected = [_project(point) for point in points]
+  tolerance_squared = tolerance * tolerance
+  keep = [False] * len(points)
+  keep[0] = keep[-1] = True
+  stack = [(0, len(points) - 1)]
+
+  # Iterative rather than recursive so very long routes cannot hit the
+  # recursion limit.
+  while stack:
+    first, last = stack.pop()
+    ax, ay = projected[first]
+    bx, by = projected[last]
+    dx = bx - ax
+    dy = by - ay
+    length_squared = dx * dx + dy * dy
+
+    farthest = None
+    farthest_distance = tolerance_squared
+    for index in range(first + 1, last):
+      px, py = projected[index]
+      if length_squared:
+        t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length_squared))
+        cx = ax + t * dx - px
+        cy = ay + t * dy - py
+      else:
+        cx = ax - px
+        cy = ay - py
+
+      distance = cx * cx + cy * cy
+      if distance > farthest_distance:
+        farthest = index
+        farthest_distance = distance
+
+    if farthest is not None:
+      keep[farthest] = True
+      stack.append((first, farthest))
+      stack.append((farthest, last))
+
+  return [point for point, kept in zip(points, keep) if kept]
+
+
+def _encode_value(value):
+  value = ~(value << 1) if value < 0 else value << 1
+  chunks = []
+  while value >= 0x20:
+    chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+    value >>= 5
+  chunks.append(chr(value + 63))
+  return "".join(chunks)
+
+
+def encode_polyline(points, precision=5):
+  # Google encoded polyline for a [lat, lng] path.
+  factor = 10 ** precision
+  previous_latitude = 0
+  previous_longitude = 0
+  chunks = []
+
+  for latitude, longitude in points:
+    latitude = round(latitude * factor)
+    longitude = round(longitude * factor)
+    chunks.append(_encode_value(latitude - previous_latitude))
+    chunks.append(_encode_value(longitude - previous_longitude))
+    previous_latitude = latitude
+    previous_longitude = longitude
+
+  return "".join(chunks)
+
+
+def _read_value(encoded_path, index):
+  # Decode one zigzag varint starting at `index`; returns (value, next_index).
+  result = 0
+  shift = 0
+  while True:
+    byte = ord(encoded_path[index]) - 63
+    index += 1
+    result |= (byte & 0x1f) << shift
+    shift += 5
+    if byte < 0x20:
+      break
+  return (~(result >> 1) if result & 1 else result >> 1), index
+
+
+def decode_polyline(encoded_path, precision=5):
+  # Decode a Google encoded polyline into [lat, lng] pairs; malformed input
+  # decodes to an empty path.
+  if not encoded_path:
+    return []
+
+  factor = 10 ** precision
+  latitude = 0
+  longitude = 0
+  index = 0
+  points = []
+
+  try:
+    while index < len(encoded_path):
+      delta, index = _read_value(encoded_path, index)
+      latitude += delta
+      delta, index = _read_value(encoded_path, index)
+      longitude += delta
+      points.append([latitude / factor, longitude / factor])
+  except (IndexError, TypeError):
+    return []
+
+  return points
+
+
+def decode_polylines(encoded_paths, precision=5, as_arrays=False):
+  # Decode many polylines at once. With numpy installed every path is decoded
+  # in a single vectorized pass over one concatenated byte buffer; without it
+  # this is a plain loop over decode_polyline(). `as_arrays` returns (n, 2)
+  # numpy arrays instead of lists, skipping the costly conversion back to
+  # Python floats when the caller can work with arrays.
+  encoded_paths = list(encoded_paths)
+  if numpy is None or not encoded_paths:
+    return [decode_polyline(path, precision) for path in encoded_paths]
+
+  try:
+    raw = [(path or "").encode("ascii") for path in encoded_paths]
+  except (AttributeError, UnicodeEncodeError):
+    return [decode_polyline(path, precision) for path in encoded_paths]
+
+  lengths = numpy.fromiter((len(chunk) for chunk in raw), dtype=numpy.int64, count=len(raw))
+  buffer = numpy.frombuffer(b"".join(raw), dtype=numpy.uint8).astype(numpy.int64) - 63
+  results = [[] for _ in raw]
+  if not buffer.size:
+    return results
+
+  # A byte without the 0x20 continuation bit ends a varint; each byte holds the
+  # next 5 bits of its varint, least significant group first. The last byte of
+  # every path also closes a varint so a truncated path cannot bleed into the
+  # next one.
+  path_ends = numpy.cumsum(lengths)
+  path_starts = path_ends - lengths
+  ends = buffer < 0x20
+  boundaries = ends.copy()
+  boundaries[path_ends[lengths > 0] - 1] = True
+  value_starts = numpy.flatnonzero(numpy.concatenate(([True], boundaries[:-1])))
+  value_ids = numpy.cumsum(numpy.concatenate(([0], boundaries[:-1].astype(numpy.int64))))
+  shifts = 5 * (numpy.arange(buffer.size) - value_starts[value_ids])
+  values = numpy.add.reduceat((buffer & 0x1f) << shifts, value_starts)
+  deltas = numpy.where(values & 1, ~(values >> 1), values >> 1)
+
+  # Map each path onto its run of varints. Paths that are malformed (bytes out
+  # of range, a truncated varint, or an odd number of values) decode to an
+  # empty path, like decode_polyline().
+  value_offsets = numpy.searchsorted(value_starts, path_starts)
+  value_counts = numpy.searchsorted(value_starts, path_ends) - value_offsets
+  in_range = (buffer >= 0) & (buffer < 64)
+  bad_bytes = numpy.cumsum(numpy.concatenate(([0], (~in_range).astype(numpy.int64))))
+
+  factor = 10 ** precision
+  for position in range(len(raw)):
+    start, end = path_starts[position], path_ends[position]
+    count = value_counts[position]
+    if (
+      start == end
+      or not ends[end - 1]
+      or count % 2
+      or bad_bytes[end] != bad_bytes[start]
+    ):
+      continue
+
+    offset = value_offsets[position]
+    pairs = deltas[offset:offset + count].reshape(-1, 2).cumsum(axis=0) / factor
+    results[position] = pairs if as_arrays else pairs.tolist()
+
+  return results
+
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+  # Standard base-32 geohash: bits alternate longitude, latitude, so points
+  # that share a prefix share a cell and a prefix is a B-tree range.
+  latitude_range = [-90.0, 90.0]
+  longitude_range = [-180.0, 180.0]
+  chars = []
+  bits = 0
+  value = 0
+  even = True
+  while len(chars) < precision:
+    interval, coordinate = (longitude_range, longitude) if even else (latitude_range, latitude)
+    middle = (interval[0] + interval[1]) / 2
+    value <<= 1
+    if coordinate >= middle:
+      value |= 1
+      interval[0] = middle
+    else:
+      interval[1] = middle
+    even = not even
+    bits += 1
+    if bits == 5:
+      chars.append(GEOHASH_ALPHABET[value])
+      bits = 0
+      value = 0
+  return "".join(chars)
+
+
+def geohash_cell_size(precision):
+  # (height, width) of a geohash cell in degrees.
+  bits = 5 * precision
+  return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def geohash_common_cell(first, second):
+  # Longest common prefix of two geohashes: the smallest cell holding both
+  # points, and with them the box between them.
+  length = 0
+  for first_char, second_char in zip(first, second):
+    if first_char != second_char:
+      break
+    length += 1
+  return first[:length]
+
+
+def geohash_cover(south, west, north, east, max_cells=GEOHASH_MAX_CELLS):
+  # Geohash prefixes whose cells together cover the box, at the finest
+  # precision needing no more than `max_cells` of them. [""] means the box is
+  # too large to narrow down.
+  south, north = max(-90.0, south), min(90.0, north)
+  west, east = max(-180.0, west), min(180.0, east)
+
+  best = [""]
+  for precision in range(1, GEOHASH_PRECISION + 1):
+    height, width = geohash_cell_size(precision)
+    rows = range(int((south + 90) // height), int(min(north + 90, 180 - 1e-9) // height) + 1)
+    columns = range(int((west + 180) // width), int(min(east + 180, 360 - 1e-9) // width) + 1)
+    if len(rows) * len(columns) > max_cells:
+      break
+    best = sorted(
+      {
+        geohash_encode((row + 0.5) * height - 90, (column + 0.5) * width - 180, precision)
+        for row in rows
+        for column in columns
+      }
+    )
+  return best
+
+
+def radius_box(latitude, longitude, radius_km):
+  # (south, west, north, east) bounding a circle of `radius_km`.
+  latitude_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+  cos_latitude = math.cos(math.radians(min(abs(latitude) + latitude_delta, 89.9)))
+  longitude_delta = min(180.0, latitude_delta / max(cos_latitude, 1e-6))
+  return (
+    latitude - latitude_delta,
+    longitude - longitude_delta,
+    latitude + latitude_delta,
+    longitude + longitude_delta,
+  )
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+  # Great-circle distances from one point to many, as a list. Vectorized with
+  # numpy when it is installed.
+  if numpy is not None:
+    phi = numpy.radians(numpy.asarray(latitudes, dtype=float))
+    lambdas = numpy.radians(numpy.asarray(longitudes, dtype=float))
+    phi0 = math.radians(latitude)
+    a = (
+      numpy.sin((phi - phi0) / 2) ** 2
+      + math.cos(phi0) * numpy.cos(phi) * numpy.sin((lambdas - math.radians(longitude)) / 2) ** 2
+    )
+    return (2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))).tolist()
+
+  phi0 = math.radians(latitude)
+  distances = []
+  for other_latitude, other_longitude in zip(latitudes, longitudes):
+    phi = math.radians(other_latitude)
+    a = (
+      math.sin((phi - phi0) / 2) ** 2
+      + math.cos(phi0) * math.cos(phi) * math.sin(math.radians(other_longitude - longitude) / 2) ** 2
+    )
+    distances.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0))))
+  return distances
+
+
+def grid_clusters(points, zoom, cell_pixels):
+  # Groups (key, lat, lng, weight) points by the square cell, `cell_pixels`
+  # screen pixels wide at `zoom`, they fall in. The grid is fixed to the
+  # world, so a point keeps its group as the map pans. Returns one
+  # (keys, lat, lng, total weight, (south, west, north, east)) per occupied
+  # cell, placed at its points' mean position, in cell order.
+  scale = TILE_SIZE * 2 ** zoom / cell_pixels
+  cells = {}
+  for key, latitude, longitude, weight in points:
+    x, y = _project((latitude, longitude))
+    cells.setdefault((int(y * scale), int(x * scale)), []).append(
+      (key, latitude, longitude, weight)
+    )
+
+  clusters = []
+  for cell in sorted(cells):
+    members = cells[cell]
+    latitudes = [member[1] for member in members]
+    longitudes = [member[2] for member in members]
+    clusters.append(
+      (
+        [member[0] for member in members],
+        sum(latitudes) / len(members),
+        sum(longitudes) / len(members),
+        sum(member[3] for member in members),
+        (min(latitudes), min(longitudes), max(latitudes), max(longitudes)),
+      )
+    )
+  return clusters
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rides.geocoding import set_ride_coordinates
+from rides.models import Person
+from rides.search_cache import bump_generation
+from rides.tiles import clear_tile_cache
+
+
+class Command(BaseCommand):
+  help = (
+    "Geocode and store origin/destination coordinates for existing rides. Works "
+    "through rides in id order in batches, one transaction each, so it can be "
+    "stopped at any point and re-run to pick up where it left off. The release "
+    "step runs it after every migrate, so rides that predate the coordinate "
+    "columns are filled in on deploy."
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument(
+      "--all",
+      action="store_true",
+      help="Recompute every ride, e.g. after rebuilding the gazetteer; by default "
+      "only rides without coordinates are visited.",
+    )
+    parser.add_argument("--start-after", type=int, default=0, help="Resume after this ride id.")
+
+  def handle(self, *args, **options):
+    rides = Person.objects.only(
+      "origination", "destination_city", "destination_state", *Person.COORDINATE_FIELDS
+    ).order_by("pk")
+    if not options["all"]:
+      rides = rides.filter(origin_lat__isnull=True)
+
+    last_id = options["start_after"]
+    visited = 0
+    updated = 0
+    while True:
+      # Keyset batches: each query starts after the last id seen, so progress
+      # never depends on an OFFSET and rows updated mid-run are not skipped.
+      batch = list(rides.filter(pk__gt=last_id)[: options["batch_size"]])
+      if not batch:
+        break
+
+      changed = [ride for ride in batch if set_ride_coordinates(ride)]
+      with transaction.atomic():
+        Person.objects.bulk_update(changed, Person.COORDINATE_FIELDS)
+
+      last_id = batch[-1].pk
+      visited += len(batch)
+      updated += len(changed)
+      self.stdout.write(f"through id {last_id}: {visited} visited, {updated} updated")
+
+    if updated:
+      # bulk_update() skips the save signals that invalidate cached searches
+      # and map tiles.
+      bump_generation()
+      clear_tile_cache()
+    self.stdout.write(f"Done: {visited} rides visited, {updated} updated.")
@@ -0,0 +1,86 @@
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from rides.gazetteer import Gazetteer, write_gazetteer
+from rides.geocoding import STATE_CENTERS
+
+SYLLABLES = (
+  "an", "ber", "ca", "del", "el", "fair", "glen", "ham", "il", "ja", "ken", "la",
+  "mon", "nor", "o", "port", "ri", "san", "ta", "ville", "wood", "york", "ford", "ton",
+)
+
+
+def _place_name(generator):
+  words = []
+  for _ in range(generator.choice((1, 1, 2))):
+    word = "".join(generator.choice(SYLLABLES) for _ in range(generator.randint(2, 4)))
+    words.append(word.capitalize())
+  return " ".join(words)
+
+
+class Command(BaseCommand):
+  help = "Time gazetteer lookups over a synthetic place file of a given size."
+
+  def add_arguments(self, parser):
+    parser.add_argument("--places", type=int, default=300000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=401)
+
+  def handle(self, *args, **options):
+    generator = random.Random(options["seed"])
+    states = sorted(STATE_CENTERS)
+    places = []
+    for _ in range(options["places"]):
+      state = generator.choice(states)
+      latitude, longitude = STATE_CENTERS[state]
+      places.append(
+        (
+          state,
+          _place_name(generator),
+          latitude + generator.uniform(-2, 2),
+          longitude + generator.uniform(-2, 2),
+        )
+      )
+
+    handle, path = tempfile.mkstemp(suffix=".bin")
+    os.close(handle)
+    try:
+      started = time.perf_counter()
+      count = write_gazetteer(path, places)
+      self.stdout.write(
+        f"{count} places, {os.path.getsize(path) / 1024 / 1024:.1f} MiB, "
+        f"built in {time.perf_counter() - started:.2f} s"
+      )
+
+      started = time.perf_counter()
+      gazetteer = Gazetteer(path)
+      self.stdout.write(f"open (mmap):         {(time.perf_counter() - started) * 1e6:9.1f} us")
+
+      samples = [generator.choice(places) for _ in range(options["lookups"])]
+
+      def per_call(label, function, arguments):
+        started = time.perf_counter()
+        for argument in arguments:
+          function(*argument)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{label:<20} {elapsed / len(arguments) * 1e6:9.1f} us")
+
+      per_call("exact, hit:", gazetteer.find, [(name, state) for state, name, _, _ in samples])
+      per_call("exact, miss:", gazetteer.find, [(name + "x", state) for state, name, _, _ in samples])
+      per_call("any state:", gazetteer.find_anywhere, [(name,) for _, name, _, _ in samples])
+      per_call(
+        "prefix, 10 results:",
+        gazetteer.prefix,
+        [(name[:3], state) for state, name, _, _ in samples],
+      )
+
+      typos = [(name[:-1], state) for state, name, _, _ in samples[:50]]
+      per_call("fuzzy, cold:", gazetteer.find_fuzzy, typos)
+      per_call("fuzzy, cached:", gazetteer.find_fuzzy, typos)
+      gazetteer.close()
+    finally:
+      os.unlink(path)
@@ -0,0 +1,56 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from rides import geometry
+
+
+class Command(BaseCommand):
+  help = "Compare per-path polyline decoding with the batched decoder."
+
+  def add_arguments(self, parser):
+    parser.add_argument("--paths", type=int, default=1000)
+    parser.add_argument("--points", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=401)
+
+  def handle(self, *args, **options):
+    generator = random.Random(options["seed"])
+    encoded_paths = []
+    for _ in range(options["paths"]):
+      # Random walk shaped like a road route: many short hops.
+      latitude = generator.uniform(25, 48)
+      longitude = generator.uniform(-124, -70)
+      path = []
+      for _ in range(options["points"]):
+        latitude += generator.uniform(-0.002, 0.002)
+        longitude += generator.uniform(-0.002, 0.002)
+        path.append([latitude, longitude])
+      encoded_paths.append(geometry.encode_polyline(path))
+
+    total_bytes = sum(len(path) for path in encoded_paths)
+    self.stdout.write(
+      f"{options['paths']} paths x {options['points']} points, "
+      f"{total_bytes / 1024:.0f} KiB encoded, numpy={'yes' if geometry.numpy else 'no'}"
+    )
+
+    def best_of(function):
+      timings = []
+      for _ in range(options["repeat"]):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+      return min(timings)
+
+    per_path = best_of(lambda: [geometry.decode_polyline(path) for path in encoded_paths])
+    batched = best_of(lambda: geometry.decode_polylines(encoded_paths))
+    arrays = best_of(lambda: geometry.decode_polylines(encoded_paths, as_arrays=True))
+
+    self.stdout.write(f"decode_polyline, per path:       {per_path * 1000:8.1f} ms")
+    self.stdout.write(
+      f"decode_polylines, batched:       {batched * 1000:8.1f} ms ({per_path / batched:.1f}x)"
+    )
+    self.stdout.write(
+      f"decode_polylines, numpy arrays:  {arrays * 1000:8.1f} ms ({per_path / arrays:.1f}x)"
+    )
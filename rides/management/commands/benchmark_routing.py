@@ -0,0 +1,94 @@
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from rides.road_graph import OfflineRouter, haversine_meters, write_road_graph
+
+
+def _grid_graph(size, spacing, drop, generator):
+  # A jittered street grid around central Texas with a fraction of the
+  # segments removed, so paths have to route around gaps.
+  nodes = []
+  for row in range(size):
+    for column in range(size):
+      nodes.append(
+        (
+          30.0 + row * spacing + generator.uniform(-0.2, 0.2) * spacing,
+          -98.0 + column * spacing + generator.uniform(-0.2, 0.2) * spacing,
+        )
+      )
+
+  edges = []
+  for row in range(size):
+    for column in range(size):
+      node = row * size + column
+      for neighbor in (node + 1 if column + 1 < size else None, node + size if row + 1 < size else None):
+        if neighbor is None or generator.random() < drop:
+          continue
+        meters = haversine_meters(*nodes[node], *nodes[neighbor]) * generator.uniform(1.0, 1.3)
+        edges.append((node, neighbor, meters))
+        edges.append((neighbor, node, meters))
+  return nodes, edges
+
+
+class Command(BaseCommand):
+  help = "Time offline shortest-path queries over a road graph file."
+
+  def add_arguments(self, parser):
+    parser.add_argument("--graph", default=None, help="Graph file; a synthetic grid by default.")
+    parser.add_argument("--grid", type=int, default=200, help="Synthetic grid size per side.")
+    parser.add_argument("--spacing", type=float, default=0.005, help="Grid spacing in degrees.")
+    parser.add_argument("--drop", type=float, default=0.1, help="Share of grid segments removed.")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=401)
+
+  def handle(self, *args, **options):
+    generator = random.Random(options["seed"])
+    temporary = None
+    path = options["graph"]
+
+    if path is None:
+      started = time.perf_counter()
+      nodes, edges = _grid_graph(options["grid"], options["spacing"], options["drop"], generator)
+      handle, temporary = tempfile.mkstemp(suffix=".bin")
+      os.close(handle)
+      write_road_graph(temporary, nodes, edges)
+      path = temporary
+      self.stdout.write(
+        f"synthetic grid: {len(nodes)} nodes, {len(edges)} edges, "
+        f"{os.path.getsize(path) / 1024:.0f} KiB, built in {time.perf_counter() - started:.2f} s"
+      )
+
+    try:
+      router = OfflineRouter(path, max_snap_meters=5000)
+      started = time.perf_counter()
+      graph = router.graph
+      self.stdout.write(f"open (mmap):        {(time.perf_counter() - started) * 1000:8.2f} ms")
+
+      started = time.perf_counter()
+      graph.nearest_node(*graph.coordinates(0), max_meters=1)
+      self.stdout.write(f"snap index build:   {(time.perf_counter() - started) * 1000:8.2f} ms")
+
+      timings = []
+      found = 0
+      for _ in range(options["queries"]):
+        origin = graph.coordinates(generator.randrange(graph.node_count))
+        destination = graph.coordinates(generator.randrange(graph.node_count))
+        started = time.perf_counter()
+        found += router.route(origin, destination) is not None
+        timings.append(time.perf_counter() - started)
+
+      timings.sort()
+      self.stdout.write(
+        f"route queries:      {len(timings)} ({found} with a path), "
+        f"p50 {timings[len(timings) // 2] * 1000:.1f} ms, "
+        f"p95 {timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000:.1f} ms, "
+        f"max {timings[-1] * 1000:.1f} ms"
+      )
+      graph.close()
+    finally:
+      if temporary:
+        os.unlink(temporary)
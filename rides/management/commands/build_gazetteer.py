@@ -0,0 +1,51 @@
+import csv
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rides.gazetteer import write_gazetteer
+
+# Legal/statistical area suffixes the Census Bureau appends to place names,
+# e.g. "Jersey City city" or "Stanford CDP". Always lowercase except "CDP",
+# so capitalised names such as "Carson City" are left alone.
+CENSUS_SUFFIX = re.compile(
+  r"\s+(?:city and borough|city|town|village|borough|municipality|CDP|comunidad|zona urbana)"
+  r"(?:\s*\(balance\))?$"
+)
+
+
+class Command(BaseCommand):
+  help = (
+    "Build the geocoding gazetteer from a tab-separated places file with USPS, "
+    "NAME, INTPTLAT and INTPTLONG columns, such as the Census Bureau's national "
+    "places gazetteer."
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument("input")
+    parser.add_argument("--output", default=None, help="Defaults to GAZETTEER_PATH.")
+
+  def handle(self, *args, **options):
+    try:
+      with open(options["input"], encoding="utf-8-sig", newline="") as handle:
+        reader = csv.reader(handle, delimiter="\t")
+        header = [column.strip().upper() for column in next(reader, [])]
+        try:
+          columns = [header.index(name) for name in ("USPS", "NAME", "INTPTLAT", "INTPTLONG")]
+        except ValueError as error:
+          raise CommandError(f"Missing column in {options['input']}: {error}") from error
+
+        places = []
+        for row in reader:
+          try:
+            state, name, latitude, longitude = (row[index].strip() for index in columns)
+            places.append((state, CENSUS_SUFFIX.sub("", name), float(latitude), float(longitude)))
+          except (IndexError, ValueError):
+            continue
+    except OSError as error:
+      raise CommandError(f"Could not read {options['input']}: {error}") from error
+
+    output = options["output"] or settings.GAZETTEER_PATH
+    count = write_gazetteer(output, places)
+    self.stdout.write(f"Wrote {count} places to {output}")
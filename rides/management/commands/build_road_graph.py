@@ -0,0 +1,71 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rides.road_graph import haversine_meters, write_road_graph
+
+# Vertices closer than this (in degrees, ~1 m) are the same graph node, which
+# is how separate LineStrings get joined at intersections.
+NODE_PRECISION = 5
+
+ONEWAY_FORWARD = {"yes", "true", "1", True, 1}
+ONEWAY_REVERSE = {"-1", -1}
+
+
+class Command(BaseCommand):
+  help = (
+    "Build a road graph file for the offline routing backend from a GeoJSON "
+    "file of LineString roads (for example an OSM extract converted with ogr2ogr)."
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument("input", help="GeoJSON FeatureCollection of LineStrings.")
+    parser.add_argument("--output", default=None, help="Defaults to ROAD_GRAPH_PATH.")
+
+  def handle(self, *args, **options):
+    try:
+      with open(options["input"], encoding="utf-8") as handle:
+        collection = json.load(handle)
+    except (OSError, ValueError) as error:
+      raise CommandError(f"Could not read {options['input']}: {error}") from error
+
+    node_ids = {}
+    nodes = []
+    edges = []
+
+    def node_for(position):
+      key = (round(float(position[1]), NODE_PRECISION), round(float(position[0]), NODE_PRECISION))
+      node = node_ids.get(key)
+      if node is None:
+        node = node_ids[key] = len(nodes)
+        nodes.append(key)
+      return node
+
+    for feature in collection.get("features", []):
+      geometry = feature.get("geometry") or {}
+      if geometry.get("type") == "LineString":
+        lines = [geometry.get("coordinates") or []]
+      elif geometry.get("type") == "MultiLineString":
+        lines = geometry.get("coordinates") or []
+      else:
+        continue
+
+      oneway = (feature.get("properties") or {}).get("oneway")
+      for line in lines:
+        path = [node_for(position) for position in line]
+        for source, target in zip(path, path[1:]):
+          if source == target:
+            continue
+          meters = haversine_meters(*nodes[source], *nodes[target])
+          if oneway not in ONEWAY_REVERSE:
+            edges.append((source, target, meters))
+          if oneway not in ONEWAY_FORWARD:
+            edges.append((target, source, meters))
+
+    if not edges:
+      raise CommandError("No LineString roads found in the input.")
+
+    output = options["output"] or settings.ROAD_GRAPH_PATH
+    write_road_graph(output, nodes, edges)
+    self.stdout.write(f"Wrote {len(nodes)} nodes and {len(edges)} edges to {output}")
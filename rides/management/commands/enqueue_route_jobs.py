@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from rides.models import Person
+from rides.route_jobs import enqueue_route_jobs
+
+
+class Command(BaseCommand):
+  help = "Queue route precomputation for existing rides, e.g. after a bulk import."
+
+  def add_arguments(self, parser):
+    parser.add_argument("--chunk-size", type=int, default=500)
+
+  def handle(self, *args, **options):
+    queued = 0
+    chunk = []
+    rides = Person.objects.only(
+      "origination",
+      "destination_city",
+      "destination_state",
+      "origin_lat",
+      "origin_lng",
+      "destination_lat",
+      "destination_lng",
+    )
+    for ride in rides.iterator(chunk_size=options["chunk_size"]):
+      chunk.append(ride)
+      if len(chunk) >= options["chunk_size"]:
+        queued += enqueue_route_jobs(chunk)
+        chunk = []
+
+    queued += enqueue_route_jobs(chunk)
+    self.stdout.write(f"Queued {queued} route jobs.")
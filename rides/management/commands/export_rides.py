@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from rides.export import EXPORT_FORMATS, export_lines, export_rows
+from rides.forms import RideForm
+
+
+class Command(BaseCommand):
+  help = (
+    "Export rides as CSV or NDJSON, streamed in chunks so memory use stays flat "
+    "however many rides there are. Filters work like the ride search."
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--output", default="-", help="File to write; '-' for stdout.")
+    parser.add_argument("--search", default="")
+    parser.add_argument("--date", dest="travel_date", default="")
+    parser.add_argument("--minimum-seats", default="")
+    parser.add_argument("--passengers-only", action="store_true")
+    parser.add_argument("--near", default="", help='Place such as "Menlo Park, CA".')
+    parser.add_argument("--radius-km", default="")
+    parser.add_argument("--near-side", default="origin")
+
+  def handle(self, *args, **options):
+    data = {
+      name: options[name]
+      for name in ("search", "travel_date", "minimum_seats", "near", "radius_km", "near_side")
+      if options[name]
+    }
+    if options["passengers_only"]:
+      data["passengers_only"] = "on"
+    form = RideForm(data)
+    if not form.is_valid():
+      errors = "; ".join(
+        f"{field}: {' '.join(messages)}" for field, messages in form.errors.items()
+      )
+      raise CommandError(f"Invalid filters: {errors}")
+
+    lines = export_lines(options["format"], export_rows(form.cleaned_data))
+    if options["output"] == "-":
+      for line in lines:
+        self.stdout.write(line, ending="")
+      return
+
+    count = -1 if options["format"] == "csv" else 0
+    with open(options["output"], "w", encoding="utf-8", newline="") as handle:
+      for line in lines:
+        handle.write(line)
+        count += 1
+    self.stderr.write(f"Wrote {count} rides to {options['output']}")
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from rides.osrm import AsyncOsrmClient, CircuitBreaker, OsrmClient
+
+
+class _SlowOsrmHandler(BaseHTTPRequestHandler):
+  protocol_version = "HTTP/1.1"
+  # Headers and body go out as separate writes; without this Nagle holds the
+  # body back for a delayed ACK and adds ~40 ms to every keep-alive response.
+  disable_nagle_algorithm = True
+  latency = 0.1
+
+  def do_GET(self):
+    time.sleep(self.latency)
+    body = json.dumps(
+      {"code": "Ok", "routes": [{"geometry": {"coordinates": [[-74.0, 40.7], [-75.1, 39.9]]}}]}
+    ).encode("utf-8")
+    self.send_response(200)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    pass
+
+
+class _Server(ThreadingHTTPServer):
+  # Room for every pooled connection to connect at once.
+  request_queue_size = 128
+  daemon_threads = True
+
+
+def _summary(label, timings, elapsed):
+  timings = sorted(timings)
+  p50 = timings[len(timings) // 2]
+  p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+  return (
+    f"{label:<28} {len(timings) / elapsed:8.1f} req/s   "
+    f"p50 {p50 * 1000:7.1f} ms   p95 {p95 * 1000:7.1f} ms"
+  )
+
+
+class Command(BaseCommand):
+  help = (
+    "Compare road-route lookups on blocking workers (WSGI) with one event loop "
+    "(ASGI) against a local OSRM stand-in with fixed latency."
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.1, help="Upstream latency in seconds.")
+    parser.add_argument(
+      "--workers",
+      type=int,
+      default=2,
+      help="Blocking workers for the WSGI run; render.yaml uses WEB_CONCURRENCY=2.",
+    )
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--max-connections", type=int, default=32)
+
+  def handle(self, *args, **options):
+    _SlowOsrmHandler.latency = options["latency"]
+    server = _Server(("127.0.0.1", 0), _SlowOsrmHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/route/v1/driving/"
+
+    # Distinct coordinates per request so nothing could be served from a cache.
+    pairs = [
+      ([40.0 + index * 1e-4, -75.0], [41.0, -74.0 - index * 1e-4])
+      for index in range(options["requests"])
+    ]
+    budget = max(10.0, options["latency"] * len(pairs))
+
+    try:
+      self.stdout.write(
+        f"{len(pairs)} lookups, {options['latency'] * 1000:.0f} ms upstream latency"
+      )
+      self.stdout.write(self._run_sync(base_url, pairs, budget, options["workers"]))
+      self.stdout.write(
+        self._run_async(
+          base_url, pairs, budget, options["concurrency"], options["max_connections"]
+        )
+      )
+    finally:
+      server.shutdown()
+      server.server_close()
+
+  def _run_sync(self, base_url, pairs, budget, workers):
+    client = OsrmClient(base_url, budget=budget, breaker=CircuitBreaker(failure_threshold=10**6))
+
+    def timed(pair):
+      started = time.perf_counter()
+      client.route(*pair)
+      return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+      timings = list(executor.map(timed, pairs))
+    return _summary(f"wsgi, {workers} sync workers", timings, time.perf_counter() - started)
+
+  def _run_async(self, base_url, pairs, budget, concurrency, max_connections):
+    client = AsyncOsrmClient(
+      base_url,
+      budget=budget,
+      breaker=CircuitBreaker(failure_threshold=10**6),
+      max_connections=max_connections,
+    )
+
+    async def run():
+      gate = asyncio.Semaphore(concurrency)
+
+      async def timed(pair):
+        async with gate:
+          started = time.perf_counter()
+          await client.route(*pair)
+          return time.perf_counter() - started
+
+      try:
+        started = time.perf_counter()
+        timings = await asyncio.gather(*(timed(pair) for pair in pairs))
+        return timings, time.perf_counter() - started, client.stats()["connections_opened"]
+      finally:
+        await client.aclose()
+
+    timings, elapsed, opened = asyncio.run(run())
+    label = f"asgi, 1 loop, {opened} connections"
+    return _summary(label, timings, elapsed)
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from rides.route_jobs import process_route_jobs
+
+
+class Command(BaseCommand):
+  help = "Background worker that precomputes queued ride routes."
+
+  def add_arguments(self, parser):
+    parser.add_argument("--once", action="store_true", help="Drain due jobs once and exit.")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--sleep", type=float, default=2.0, help="Idle poll interval in seconds.")
+
+  def handle(self, *args, **options):
+    while True:
+      close_old_connections()
+      results = process_route_jobs(limit=options["batch_size"])
+      worked = sum(results.values())
+      if worked:
+        self.stdout.write(
+          f"routes done={results['done']} retried={results['retried']} failed={results['failed']}"
+        )
+
+      if options["once"] and worked < options["batch_size"]:
+        return
+      if not worked:
+        time.sleep(options["sleep"])
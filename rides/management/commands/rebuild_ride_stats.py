@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from rides.search_cache import bump_generation
+from rides.stats import rebuild_corridor_rollup, rebuild_ride_rollup
+from rides.tiles import clear_tile_cache
+
+
+class Command(BaseCommand):
+  help = (
+    "Recompute the home dashboard and map sidebar rollups from the rides table and "
+    "drop the cached map tiles. Signals keep both current for normal writes; run "
+    "this after bulk imports or raw SQL edits, or periodically (e.g. nightly from "
+    "cron) as a safety net."
+  )
+
+  def handle(self, *args, **options):
+    count = rebuild_ride_rollup()
+    corridors = rebuild_corridor_rollup()
+    bump_generation()
+    tiles = clear_tile_cache()
+    self.stdout.write(
+      f"Rebuilt {count} rollup rows and {corridors} corridor rows; "
+      f"dropped {tiles} cached tiles."
+    )
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.11 on 2026-10-17 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0003_alter_person_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoadRoute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=96, unique=True)),
+                ('coordinates', models.JSONField(blank=True, null=True)),
+                ('size_bytes', models.PositiveIntegerField(default=0)),
+                ('fetched_at', models.DateTimeField(auto_now=True)),
+                ('expires_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+        ),
+    ]
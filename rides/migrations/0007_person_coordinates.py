@@ -0,0 +1,33 @@
+# Generated by Django 5.2.11 on 2026-10-17 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0006_routejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='destination_lat',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='destination_lng',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='origin_lat',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='origin_lng',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.11 on 2026-10-17 20:41
+
+from django.db import migrations, models
+
+# Frozen copy of rides.geometry.geohash_encode() as of this migration, so
+# later edits to the app cannot change what it computes.
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+
+
+def geohash_encode(latitude, longitude):
+    latitude_range = [-90.0, 90.0]
+    longitude_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < GEOHASH_PRECISION:
+        interval, coordinate = (longitude_range, longitude) if even else (latitude_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def fill_geohashes(apps, schema_editor):
+    # Rows that already have coordinates only need their geohashes; the rest
+    # are geocoded by `manage.py backfill_ride_coordinates`.
+    Person = apps.get_model('rides', 'Person')
+    rides = Person.objects.filter(origin_lat__isnull=False, destination_lat__isnull=False)
+    batch = []
+    for ride in rides.only('origin_lat', 'origin_lng', 'destination_lat', 'destination_lng').iterator(chunk_size=1000):
+        ride.origin_geohash = geohash_encode(ride.origin_lat, ride.origin_lng)
+        ride.destination_geohash = geohash_encode(ride.destination_lat, ride.destination_lng)
+        batch.append(ride)
+        if len(batch) >= 1000:
+            Person.objects.bulk_update(batch, ['origin_geohash', 'destination_geohash'])
+            batch = []
+    Person.objects.bulk_update(batch, ['origin_geohash', 'destination_geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0007_person_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='destination_geohash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='origin_geohash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=12),
+        ),
+        migrations.RunPython(fill_geohashes, migrations.RunPython.noop),
+    ]
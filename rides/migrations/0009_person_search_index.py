@@ -0,0 +1,90 @@
+# Generated by Django 5.2.11 on 2026-10-17 22:05
+
+from django.db import migrations
+
+# Frozen copy of rides.search.document_sql() for SEARCH_FIELDS as of this
+# migration: the fields, lowercased and joined by newlines. A later change to
+# the search document needs a new migration rather than an edit here.
+SQLITE_DOCUMENT = (
+    'lower(first_name || char(10) || origination || char(10) || destination_city'
+    ' || char(10) || destination_state || char(10) || occupation || char(10) || interests'
+    ' || char(10) || personality_style || char(10) || looking_for'
+    ' || char(10) || relationship_status)'
+)
+SQLITE_NEW_DOCUMENT = (
+    'lower(new.first_name || char(10) || new.origination || char(10) || new.destination_city'
+    ' || char(10) || new.destination_state || char(10) || new.occupation'
+    ' || char(10) || new.interests || char(10) || new.personality_style'
+    ' || char(10) || new.looking_for || char(10) || new.relationship_status)'
+)
+POSTGRES_DOCUMENT = (
+    'lower(first_name || chr(10) || origination || chr(10) || destination_city'
+    ' || chr(10) || destination_state || chr(10) || occupation || chr(10) || interests'
+    ' || chr(10) || personality_style || chr(10) || looking_for'
+    ' || chr(10) || relationship_status)'
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = [
+            "CREATE VIRTUAL TABLE rides_person_search USING fts5(document, tokenize='trigram')",
+            f'INSERT INTO rides_person_search(rowid, document) SELECT id, {SQLITE_DOCUMENT} FROM rides_person',
+            f"""CREATE TRIGGER rides_person_search_insert AFTER INSERT ON rides_person BEGIN
+                INSERT INTO rides_person_search(rowid, document) VALUES (new.id, {SQLITE_NEW_DOCUMENT});
+            END""",
+            f"""CREATE TRIGGER rides_person_search_update AFTER UPDATE OF
+                first_name, origination, destination_city, destination_state, occupation,
+                interests, personality_style, looking_for, relationship_status
+            ON rides_person BEGIN
+                DELETE FROM rides_person_search WHERE rowid = old.id;
+                INSERT INTO rides_person_search(rowid, document) VALUES (new.id, {SQLITE_NEW_DOCUMENT});
+            END""",
+            """CREATE TRIGGER rides_person_search_delete AFTER DELETE ON rides_person BEGIN
+                DELETE FROM rides_person_search WHERE rowid = old.id;
+            END""",
+        ]
+    elif vendor == 'postgresql':
+        statements = [
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            f'CREATE INDEX rides_person_search_trgm ON rides_person USING gin (({POSTGRES_DOCUMENT}) gin_trgm_ops)',
+            f"CREATE INDEX rides_person_search_tsv ON rides_person USING gin (to_tsvector('simple', {POSTGRES_DOCUMENT}))",
+        ]
+    else:
+        return
+
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = [
+            'DROP TRIGGER IF EXISTS rides_person_search_insert',
+            'DROP TRIGGER IF EXISTS rides_person_search_update',
+            'DROP TRIGGER IF EXISTS rides_person_search_delete',
+            'DROP TABLE IF EXISTS rides_person_search',
+        ]
+    elif vendor == 'postgresql':
+        statements = [
+            'DROP INDEX IF EXISTS rides_person_search_trgm',
+            'DROP INDEX IF EXISTS rides_person_search_tsv',
+        ]
+    else:
+        return
+
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0008_person_geohash'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.11 on 2026-10-17 23:10
+
+from django.db import migrations
+
+# rides.fuzzy.FUZZY_FIELDS as of this migration.
+FUZZY_FIELDS = ('origination', 'destination_city', 'first_name')
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # Postgres only; elsewhere fuzzy search uses the in-process trigram index.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for field in FUZZY_FIELDS:
+        schema_editor.execute(
+            f'CREATE INDEX rides_person_{field}_trgm ON rides_person USING gin (lower({field}) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for field in FUZZY_FIELDS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS rides_person_{field}_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0009_person_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
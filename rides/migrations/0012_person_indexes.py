@@ -0,0 +1,37 @@
+# Generated by Django 5.2.11 on 2026-10-18 00:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0011_cachegeneration'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['date', 'time', 'first_name', 'id'], name='person_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(condition=models.Q(('taking_passengers', True)), fields=['date', 'time'], name='person_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['destination_city', 'destination_state', 'date', 'time'], name='person_destination_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['taking_passengers', 'seats_available'], name='person_seats_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['origination'], name='person_origination_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['first_name'], name='person_first_name_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.11 on 2026-10-18 00:50
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_rollup(apps, schema_editor):
+    # Frozen copy of rides.stats.rebuild_ride_rollup() and its row keys as of
+    # this migration.
+    Person = apps.get_model('rides', 'Person')
+    RideRollup = apps.get_model('rides', 'RideRollup')
+    rides = Person.objects.order_by()
+    totals = rides.aggregate(rides=Count('id'), seats=Sum('seats_available'))
+    rows = [
+        RideRollup(key='total::|', kind='total', rides=totals['rides'], seats=totals['seats'] or 0)
+    ]
+    days = rides.filter(taking_passengers=True).values('date').annotate(
+        total=Count('id'), seats=Sum('seats_available')
+    )
+    for day in days:
+        rows.append(
+            RideRollup(
+                key=f"open_day:{day['date'].isoformat()}:|",
+                kind='open_day',
+                date=day['date'],
+                rides=day['total'],
+                seats=day['seats'] or 0,
+            )
+        )
+    destinations = rides.values('destination_city', 'destination_state').annotate(total=Count('id'))
+    for destination in destinations:
+        city, state = destination['destination_city'], destination['destination_state']
+        rows.append(
+            RideRollup(
+                key=f'destination::{city}|{state}',
+                kind='destination',
+                destination_city=city,
+                destination_state=state,
+                rides=destination['total'],
+            )
+        )
+    RideRollup.objects.all().delete()
+    RideRollup.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0012_person_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RideRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=96, unique=True)),
+                ('kind', models.CharField(max_length=12)),
+                ('date', models.DateField(blank=True, null=True)),
+                ('destination_city', models.CharField(blank=True, default='', max_length=64)),
+                ('destination_state', models.CharField(blank=True, default='', max_length=2)),
+                ('rides', models.BigIntegerField(default=0)),
+                ('seats', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'date'], name='rollup_kind_date_idx'), models.Index(fields=['kind', '-rides'], name='rollup_kind_rides_idx')],
+            },
+        ),
+        migrations.RunPython(fill_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.11 on 2026-10-17 21:03
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import ExtractHour
+
+
+def fill_corridors(apps, schema_editor):
+    # Frozen copy of rides.stats.rebuild_corridor_rollup() and its row keys
+    # as of this migration.
+    Person = apps.get_model('rides', 'Person')
+    CorridorRollup = apps.get_model('rides', 'CorridorRollup')
+    groups = (
+        Person.objects.order_by()
+        .filter(taking_passengers=True)
+        .values('origination', 'destination_city', 'destination_state', hour=ExtractHour('time'))
+        .annotate(
+            rides=Count('id', filter=Q(seats_available__gt=0)),
+            seats=Sum('seats_available', filter=Q(seats_available__gt=0)),
+            drivers=Count('id'),
+        )
+    )
+    rows = {}
+    for group in groups:
+        origination, hour = group['origination'], group['hour']
+        city, state = group['destination_city'], group['destination_state']
+        route = f'{origination}|{city}|{state}'
+        corridor = {
+            'origination': origination, 'destination_city': city, 'destination_state': state
+        }
+        for key, fields in (
+            (f'corridor::{route}', {'kind': 'corridor', **corridor}),
+            (f'hour:{hour}:{route}', {'kind': 'hour', 'hour': hour, **corridor}),
+            (f'pickup::{origination}||', {'kind': 'pickup', 'origination': origination}),
+        ):
+            row = rows.setdefault(key, CorridorRollup(key=key, **fields))
+            row.rides += group['rides']
+            row.seats += group['seats'] or 0
+            row.drivers += group['drivers']
+    CorridorRollup.objects.all().delete()
+    CorridorRollup.objects.bulk_create(rows.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0013_riderollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorridorRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=160, unique=True)),
+                ('kind', models.CharField(max_length=12)),
+                ('origination', models.CharField(max_length=64)),
+                ('destination_city', models.CharField(blank=True, default='', max_length=64)),
+                ('destination_state', models.CharField(blank=True, default='', max_length=2)),
+                ('hour', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('rides', models.BigIntegerField(default=0)),
+                ('seats', models.BigIntegerField(default=0)),
+                ('drivers', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', '-rides'], name='corridor_kind_rides_idx'), models.Index(fields=['origination', 'destination_city', 'destination_state', 'kind'], name='corridor_route_idx')],
+            },
+        ),
+        migrations.RunPython(fill_corridors, migrations.RunPython.noop),
+    ]
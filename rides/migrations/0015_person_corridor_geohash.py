@@ -0,0 +1,39 @@
+# Generated by Django 5.2.11 on 2026-10-17 21:35
+
+from django.db import migrations, models
+
+
+def fill_corridor_geohashes(apps, schema_editor):
+    # The corridor cell is the common prefix of the two endpoint geohashes,
+    # which every geocoded row already stores.
+    Person = apps.get_model('rides', 'Person')
+    rides = Person.objects.filter(origin_lat__isnull=False, destination_lat__isnull=False)
+    batch = []
+    for ride in rides.only('origin_geohash', 'destination_geohash').iterator(chunk_size=1000):
+        length = 0
+        for origin_char, destination_char in zip(ride.origin_geohash, ride.destination_geohash):
+            if origin_char != destination_char:
+                break
+            length += 1
+        ride.corridor_geohash = ride.origin_geohash[:length]
+        batch.append(ride)
+        if len(batch) >= 1000:
+            Person.objects.bulk_update(batch, ['corridor_geohash'])
+            batch = []
+    Person.objects.bulk_update(batch, ['corridor_geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0014_corridorrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='corridor_geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12, null=True),
+        ),
+        migrations.RunPython(fill_corridor_geohashes, migrations.RunPython.noop),
+    ]
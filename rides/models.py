@@ -1,9 +1,22 @@
 from django.db import models
+from django.db.models import Q
 
 # Create your models here.
 
 
 class Person(models.Model):
+  # Saving any of PLACE_FIELDS re-geocodes the ride into COORDINATE_FIELDS.
+  PLACE_FIELDS = frozenset({"origination", "destination_city", "destination_state"})
+  COORDINATE_FIELDS = (
+    "origin_lat",
+    "origin_lng",
+    "destination_lat",
+    "destination_lng",
+    "origin_geohash",
+    "destination_geohash",
+    "corridor_geohash",
+  )
+
   first_name = models.CharField(max_length=64)
   origination = models.CharField(max_length=64)
   destination_city = models.CharField(max_length=64)
@@ -19,6 +32,170 @@ class Person(models.Model):
   personality_style = models.CharField(max_length=120, blank=True, default="")
   looking_for = models.CharField(max_length=180, blank=True, default="")
   bio = models.TextField(blank=True, default="")
+  # Geocoded from origination/destination on save (see signals.py) and by
+  # `manage.py backfill_ride_coordinates`; null when a side cannot be resolved.
+  origin_lat = models.FloatField(null=True, blank=True)
+  origin_lng = models.FloatField(null=True, blank=True)
+  destination_lat = models.FloatField(null=True, blank=True)
+  destination_lng = models.FloatField(null=True, blank=True)
+  # Geohashes of the two endpoints; the spatial index for radius and
+  # bounding-box search (a geohash prefix is a range scan on these indexes).
+  origin_geohash = models.CharField(max_length=12, blank=True, default="", db_index=True)
+  destination_geohash = models.CharField(max_length=12, blank=True, default="", db_index=True)
+  # Smallest geohash cell holding both endpoints (their common prefix), so a
+  # map tile finds the corridors crossing it with index lookups; null when a
+  # side cannot be resolved.
+  corridor_geohash = models.CharField(max_length=12, null=True, blank=True, db_index=True)
+
+  class Meta:
+    # One index per access path; PersonQueryPlanTests fails when a view's query
+    # falls back to scanning the table.
+    indexes = [
+      # Ride list and keyset pages: ORDER BY date, time, first_name, id.
+      models.Index(fields=["date", "time", "first_name", "id"], name="person_listing_idx"),
+      # Upcoming open rides (home, profile, map), in departure order.
+      models.Index(
+        fields=["date", "time"], name="person_open_idx", condition=Q(taking_passengers=True)
+      ),
+      # Similar riders by destination and popular destinations.
+      models.Index(
+        fields=["destination_city", "destination_state", "date", "time"],
+        name="person_destination_idx",
+      ),
+      # Open-seat filters and seat totals.
+      models.Index(fields=["taking_passengers", "seats_available"], name="person_seats_idx"),
+      # Exact-value lookups from fuzzy search.
+      models.Index(fields=["origination"], name="person_origination_idx"),
+      models.Index(fields=["first_name"], name="person_first_name_idx"),
+    ]
+
+  def save(self, *args, **kwargs):
+    update_fields = kwargs.get("update_fields")
+    if update_fields is not None and self.PLACE_FIELDS & set(update_fields):
+      kwargs["update_fields"] = {*update_fields, *self.COORDINATE_FIELDS}
+    super().save(*args, **kwargs)
 
   def __str__(self):
     return f"{self.first_name}: {self.origination} to {self.destination_city}, {self.destination_state}"
+
+
+class RideRollup(models.Model):
+  # Running totals behind the home dashboard, adjusted by signals on every ride
+  # write (see stats.py); `manage.py rebuild_ride_stats` recomputes them.
+  TOTAL = "total"
+  OPEN_DAY = "open_day"
+  DESTINATION = "destination"
+
+  key = models.CharField(max_length=96, unique=True)
+  kind = models.CharField(max_length=12)
+  date = models.DateField(null=True, blank=True)
+  destination_city = models.CharField(max_length=64, blank=True, default="")
+  destination_state = models.CharField(max_length=2, blank=True, default="")
+  rides = models.BigIntegerField(default=0)
+  seats = models.BigIntegerField(default=0)
+
+  class Meta:
+    indexes = [
+      models.Index(fields=["kind", "date"], name="rollup_kind_date_idx"),
+      models.Index(fields=["kind", "-rides"], name="rollup_kind_rides_idx"),
+    ]
+
+  def __str__(self):
+    return f"{self.key}: {self.rides} rides, {self.seats} seats"
+
+
+class CorridorRollup(models.Model):
+  # Running totals behind the map sidebar over rides taking passengers: per
+  # corridor, per corridor and departure hour, and per pickup city. `rides`
+  # and `seats` count rides with seats left; `drivers` also counts full ones.
+  # Maintained with RideRollup (see stats.py).
+  CORRIDOR = "corridor"
+  CORRIDOR_HOUR = "hour"
+  PICKUP = "pickup"
+
+  key = models.CharField(max_length=160, unique=True)
+  kind = models.CharField(max_length=12)
+  origination = models.CharField(max_length=64)
+  destination_city = models.CharField(max_length=64, blank=True, default="")
+  destination_state = models.CharField(max_length=2, blank=True, default="")
+  hour = models.PositiveSmallIntegerField(null=True, blank=True)
+  rides = models.BigIntegerField(default=0)
+  seats = models.BigIntegerField(default=0)
+  drivers = models.BigIntegerField(default=0)
+
+  class Meta:
+    indexes = [
+      models.Index(fields=["kind", "-rides"], name="corridor_kind_rides_idx"),
+      models.Index(
+        fields=["origination", "destination_city", "destination_state", "kind"],
+        name="corridor_route_idx",
+      ),
+    ]
+
+  def __str__(self):
+    return f"{self.key}: {self.rides} rides, {self.seats} seats, {self.drivers} drivers"
+
+
+class CacheGeneration(models.Model):
+  # Counter bumped whenever the data behind a cache changes (e.g. any ride
+  # write); cache keys include it, so a bump invalidates every worker at once.
+  name = models.CharField(max_length=32, unique=True)
+  value = models.PositiveBigIntegerField(default=0)
+
+  def __str__(self):
+    return f"{self.name} @ {self.value}"
+
+
+class RoadRoute(models.Model):
+  # Shared tier of the road-route cache; every worker reads and writes these rows.
+  key = models.CharField(max_length=96, unique=True)
+  coordinates = models.JSONField(null=True, blank=True)
+  size_bytes = models.PositiveIntegerField(default=0)
+  fetched_at = models.DateTimeField(auto_now=True)
+  expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+  def __str__(self):
+    return self.key
+
+
+class RouteFetchLease(models.Model):
+  # Marks a route key that some worker is currently fetching upstream, so other
+  # workers wait for its result instead of issuing the same request.
+  key = models.CharField(max_length=96, unique=True)
+  owner = models.CharField(max_length=32)
+  expires_at = models.DateTimeField()
+
+  def __str__(self):
+    return self.key
+
+
+class RouteJob(models.Model):
+  # Database-backed queue of routes to precompute off the request path; one row
+  # per route key, processed by `manage.py process_route_jobs`.
+  PENDING = "pending"
+  RUNNING = "running"
+  DONE = "done"
+  FAILED = "failed"
+  STATUS_CHOICES = [
+    (PENDING, "Pending"),
+    (RUNNING, "Running"),
+    (DONE, "Done"),
+    (FAILED, "Failed"),
+  ]
+
+  key = models.CharField(max_length=96, unique=True)
+  origin_lat = models.FloatField()
+  origin_lng = models.FloatField()
+  destination_lat = models.FloatField()
+  destination_lng = models.FloatField()
+  status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=PENDING)
+  attempts = models.PositiveSmallIntegerField(default=0)
+  run_after = models.DateTimeField()
+  updated_at = models.DateTimeField(auto_now=True)
+  last_error = models.CharField(max_length=200, blank=True, default="")
+
+  class Meta:
+    indexes = [models.Index(fields=["status", "run_after"])]
+
+  def __str__(self):
+    return f"{self.key} ({self.status})"
@@ -0,0 +1,303 @@
+import asyncio
+import json
+import random
+import threading
+import time
+import weakref
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+import httpx
+
+# Statuses worth retrying: the upstream is overloaded or briefly unavailable.
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Largest response body read from the routing backend; a full-detail route
+# across the country is well under a megabyte.
+OSRM_MAX_RESPONSE_BYTES = 8 * 1024 * 1024
+
+OSRM_MAX_REDIRECTS = 5
+
+
+class RouteUnavailable(Exception):
+  # The routing backend could not answer (error, timeout, or breaker open).
+  pass
+
+
+class CircuitOpen(RouteUnavailable):
+  pass
+
+
+class _Retryable(Exception):
+  pass
+
+
+def _route_url(base_url, origin, destination):
+  return (
+    f"{base_url}{origin[1]},{origin[0]};{destination[1]},{destination[0]}?"
+    + urlencode({"overview": "full", "geometries": "geojson"})
+  )
+
+
+def _first_route(payload):
+  routes = payload.get("routes") if isinstance(payload, dict) else None
+  return (routes or [None])[0]
+
+
+def _parse_json_body(status, body):
+  # Same rules as OsrmClient._get_json: 429/5xx and unreadable 2xx bodies are
+  # transient; other 4xx bodies are OSRM's NoRoute/InvalidQuery answers.
+  if status in RETRYABLE_STATUSES:
+    raise _Retryable()
+
+  try:
+    return json.loads(body.decode("utf-8"))
+  except (UnicodeDecodeError, ValueError) as error:
+    if status >= 400:
+      return {}
+    raise _Retryable() from error
+
+
+# Trips after `failure_threshold` consecutive failures and rejects calls until
+# `reset_timeout` seconds have passed; then a single trial call is let through
+# (half-open) and its outcome closes or re-opens the breaker.
+class CircuitBreaker:
+  CLOSED = "closed"
+  OPEN = "open"
+  HALF_OPEN = "half_open"
+
+  def __init__(self, failure_threshold=5, reset_timeout=30):
+    self.failure_threshold = failure_threshold
+    self.reset_timeout = reset_timeout
+    self._lock = threading.Lock()
+    self._state = self.CLOSED
+    self._failures = 0
+    self._opened_at = 0.0
+    self._trial_in_flight = False
+    self._counters = {"trips": 0, "rejected": 0}
+
+  @property
+  def state(self):
+    with self._lock:
+      return self._current_state()
+
+  def allow(self):
+    with self._lock:
+      state = self._current_state()
+      if state == self.CLOSED:
+        return True
+
+      if state == self.HALF_OPEN and not self._trial_in_flight:
+        self._trial_in_flight = True
+        return True
+
+      self._counters["rejected"] += 1
+      return False
+
+  def record_success(self):
+    with self._lock:
+      self._state = self.CLOSED
+      self._failures = 0
+      self._trial_in_flight = False
+
+  def record_failure(self):
+    with self._lock:
+      self._failures += 1
+      self._trial_in_flight = False
+      if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+        if self._state != self.OPEN:
+          self._counters["trips"] += 1
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+
+  def reset(self):
+    with self._lock:
+      self._state = self.CLOSED
+      self._failures = 0
+      self._trial_in_flight = False
+      for name in self._counters:
+        self._counters[name] = 0
+
+  def stats(self):
+    with self._lock:
+      stats = dict(self._counters)
+      stats["state"] = self._current_state()
+      stats["failures"] = self._failures
+    return stats
+
+  def _current_state(self):
+    if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+      self._state = self.HALF_OPEN
+    return self._state
+
+
+# Thin OSRM HTTP client. Every call gets a total latency budget shared by all
+# of its attempts; transient failures are retried with jittered exponential
+# backoff while budget remains, and repeated failures trip the breaker so
+# callers fail fast instead of tying up a worker.
+class OsrmClient:
+  def __init__(
+    self,
+    base_url,
+    budget=4.0,
+    max_attempts=3,
+    backoff=0.25,
+    breaker=None,
+    user_agent="HandyRides/1.0",
+  ):
+    self.base_url = base_url
+    self.budget = budget
+    self.max_attempts = max_attempts
+    self.backoff = backoff
+    self.breaker = breaker or CircuitBreaker()
+    self.user_agent = user_agent
+
+  def route(self, origin, destination):
+    # Returns OSRM's first route object, or None when OSRM answered but has no
+    # route between the points. Raises RouteUnavailable when it did not answer.
+    if not self.breaker.allow():
+      raise CircuitOpen("circuit_open")
+
+    url = _route_url(self.base_url, origin, destination)
+    deadline = time.monotonic() + self.budget
+    attempt = 0
+
+    while True:
+      attempt += 1
+      remaining = deadline - time.monotonic()
+      try:
+        payload = self._get_json(url, timeout=max(remaining, 0.05))
+      except _Retryable as error:
+        delay = self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+        if attempt >= self.max_attempts or time.monotonic() + delay >= deadline:
+          self.breaker.record_failure()
+          raise RouteUnavailable(str(error.__cause__ or error)) from error
+        time.sleep(delay)
+        continue
+
+      self.breaker.record_success()
+      return _first_route(payload)
+
+  def _get_json(self, url, timeout):
+    request = Request(url, headers={"User-Agent": self.user_agent})
+    try:
+      with urlopen(request, timeout=timeout) as response:
+        body = response.read(OSRM_MAX_RESPONSE_BYTES + 1)
+    except HTTPError as error:
+      if error.code in RETRYABLE_STATUSES:
+        raise _Retryable() from error
+      # OSRM reports NoRoute/InvalidQuery as a 4xx with a JSON body; that is an
+      # answer, not an outage.
+      try:
+        return json.loads(error.read().decode("utf-8"))
+      except (UnicodeDecodeError, ValueError):
+        return {}
+    except (URLError, TimeoutError, OSError) as error:
+      raise _Retryable() from error
+
+    if len(body) > OSRM_MAX_RESPONSE_BYTES:
+      raise _Retryable("response too large")
+
+    try:
+      return json.loads(body.decode("utf-8"))
+    except (UnicodeDecodeError, ValueError) as error:
+      raise _Retryable() from error
+
+
+# Non-blocking counterpart of OsrmClient for async views, on an httpx client
+# per event loop (its connections cannot cross loops). Requests reuse pooled
+# keep-alive connections with at most `max_connections` open at once; callers
+# beyond that queue instead of opening new sockets. Budget, retries and the
+# circuit breaker behave exactly as in OsrmClient, and the breaker is shared
+# with it when passed in.
+class AsyncOsrmClient:
+  def __init__(
+    self,
+    base_url,
+    budget=4.0,
+    max_attempts=3,
+    backoff=0.25,
+    breaker=None,
+    max_connections=32,
+    user_agent="HandyRides/1.0",
+  ):
+    self.base_url = base_url
+    self.budget = budget
+    self.max_attempts = max_attempts
+    self.backoff = backoff
+    self.breaker = breaker or CircuitBreaker()
+    self.max_connections = max_connections
+    self.user_agent = user_agent
+    self._clients = weakref.WeakKeyDictionary()
+    self._connections_opened = 0
+
+  def _client(self):
+    # (httpx client, slots) for the running loop. Callers wait for a slot
+    # before a request reaches the client: httpx hands out connections to a
+    # long queue of its own waiters far more slowly than a semaphore.
+    loop = asyncio.get_running_loop()
+    entry = self._clients.get(loop)
+    if entry is None:
+      client = httpx.AsyncClient(
+        headers={"User-Agent": self.user_agent, "Accept": "application/json"},
+        limits=httpx.Limits(
+          max_connections=self.max_connections,
+          max_keepalive_connections=self.max_connections,
+        ),
+        timeout=self.budget,
+        follow_redirects=True,
+        max_redirects=OSRM_MAX_REDIRECTS,
+      )
+      entry = self._clients[loop] = (client, asyncio.Semaphore(self.max_connections))
+    return entry
+
+  async def _trace(self, event, info):
+    if event == "connection.connect_tcp.complete":
+      self._connections_opened += 1
+
+  def stats(self):
+    return {"clients": len(self._clients), "connections_opened": self._connections_opened}
+
+  async def aclose(self):
+    entry = self._clients.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+      await entry[0].aclose()
+
+  async def route(self, origin, destination):
+    if not self.breaker.allow():
+      raise CircuitOpen("circuit_open")
+
+    url = _route_url(self.base_url, origin, destination)
+    deadline = time.monotonic() + self.budget
+    attempt = 0
+
+    while True:
+      attempt += 1
+      remaining = max(deadline - time.monotonic(), 0.05)
+      try:
+        payload = await asyncio.wait_for(self._get_json(url), timeout=remaining)
+      except (_Retryable, asyncio.TimeoutError) as error:
+        delay = self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+        if attempt >= self.max_attempts or time.monotonic() + delay >= deadline:
+          self.breaker.record_failure()
+          raise RouteUnavailable(repr(error.__cause__ or error)) from error
+        await asyncio.sleep(delay)
+        continue
+
+      self.breaker.record_success()
+      return _first_route(payload)
+
+  async def _get_json(self, url):
+    client, slots = self._client()
+    try:
+      async with slots, client.stream("GET", url, extensions={"trace": self._trace}) as response:
+        body = bytearray()
+        async for chunk in response.aiter_bytes():
+          body += chunk
+          if len(body) > OSRM_MAX_RESPONSE_BYTES:
+            raise _Retryable("response too large")
+    except httpx.HTTPError as error:
+      raise _Retryable() from error
+
+    return _parse_json_body(response.status_code, bytes(body))
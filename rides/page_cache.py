@@ -0,0 +1,91 @@
+import hashlib
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+from .search_cache import current_generation
+
+_COUNTERS = defaultdict(lambda: {"hits": 0, "misses": 0})
+_COUNTERS_LOCK = threading.Lock()
+
+
+def page_cache():
+  return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def page_cache_key(name, variants=(), generation=None):
+  # Keys carry the ride data generation, so a ride write makes every cached
+  # page and fragment unreachable; the backend's TTL clears them out.
+  if generation is None:
+    generation = current_generation()
+  digest = hashlib.sha1(
+    json.dumps(list(variants), cls=DjangoJSONEncoder).encode("utf-8")
+  ).hexdigest()
+  return f"page:{name}:{generation}:{digest}"
+
+
+def _count(name, counter):
+  with _COUNTERS_LOCK:
+    _COUNTERS[name][counter] += 1
+
+
+def cached_fragment(name, variants, render):
+  # (text, "hit" or "miss") for the fragment `name`, rendered by render() on
+  # a miss. `variants` are the inputs other than ride data it depends on.
+  cache = page_cache()
+  key = page_cache_key(name, variants)
+  text = cache.get(key)
+  if text is not None:
+    _count(name, "hits")
+    return text, "hit"
+
+  text = render()
+  cache.set(key, text, settings.PAGE_CACHE_TTL)
+  _count(name, "misses")
+  return text, "miss"
+
+
+def cached_response(name, request, variants, view):
+  # A whole GET page from the cache, or from view() on a miss; only 200s are
+  # stored. The query string is always part of the key. Pages cached here
+  # must not hold a CSRF token or anything else per visitor.
+  if request.method not in ("GET", "HEAD"):
+    return view()
+
+  cache = page_cache()
+  key = page_cache_key(name, (request.get_full_path(), *variants))
+  cached = cache.get(key)
+  if cached is not None:
+    _count(name, "hits")
+    content, content_type = cached
+    response = HttpResponse(content, content_type=content_type)
+    response["X-Page-Cache"] = "hit"
+    return response
+
+  response = view()
+  if response.status_code == 200 and not response.streaming:
+    cache.set(key, (response.content, response["Content-Type"]), settings.PAGE_CACHE_TTL)
+  _count(name, "misses")
+  response["X-Page-Cache"] = "miss"
+  return response
+
+
+def page_cache_stats():
+  # {name: {"hits", "misses", "hit_rate"}} for this worker since start-up.
+  with _COUNTERS_LOCK:
+    stats = {name: dict(counters) for name, counters in _COUNTERS.items()}
+  for counters in stats.values():
+    lookups = counters["hits"] + counters["misses"]
+    counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+  return stats
+
+
+def reset_page_cache():
+  page_cache().clear()
+  with _COUNTERS_LOCK:
+    _COUNTERS.clear()
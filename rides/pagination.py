@@ -0,0 +1,177 @@
+import base64
+import json
+
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+
+# Default sort of the ride list. `id` is last so every position is unique and
+# a cursor always points between two rows.
+RIDE_ORDERING = ("date", "time", "first_name", "id")
+
+
+class Page:
+  def __init__(self, rides, next_cursor=None, previous_cursor=None):
+    self.rides = rides
+    self.next_cursor = next_cursor
+    self.previous_cursor = previous_cursor
+
+  def __iter__(self):
+    return iter(self.rides)
+
+  def __len__(self):
+    return len(self.rides)
+
+
+def encode_cursor(direction, values):
+  payload = json.dumps([direction, list(values)], cls=DjangoJSONEncoder, separators=(",", ":"))
+  return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, length):
+  # (direction, values) from a cursor made by encode_cursor(), or None when the
+  # token is missing, malformed or for a different ordering.
+  if not token:
+    return None
+  try:
+    padded = token + "=" * (-len(token) % 4)
+    direction, values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+  except (ValueError, TypeError, UnicodeError):
+    return None
+  if direction not in ("after", "before") or not isinstance(values, list) or len(values) != length:
+    return None
+  return direction, values
+
+
+def _typed_values(queryset, ordering, values):
+  # A cursor's values converted to the types of their ordering columns, or
+  # None when one does not fit (a tampered or stale cursor).
+  typed = []
+  for field, value in zip(ordering, values):
+    column = queryset.query.resolve_ref(field.lstrip("-")).output_field
+    try:
+      value = column.to_python(value)
+    except (ValidationError, TypeError, ValueError):
+      return None
+    if value is None:
+      return None
+    typed.append(value)
+  return typed
+
+
+def _same_types(values, sample):
+  # Whether a cursor from list_page() can be compared with keys like `sample`.
+  def kind(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+      return "number"
+    return type(value)
+
+  return all(kind(value) == kind(expected) for value, expected in zip(values, sample))
+
+
+def page_size(value, default, maximum):
+  try:
+    size = int(value)
+  except (TypeError, ValueError):
+    return default
+  return max(1, min(size, maximum))
+
+
+def _keyset_filter(ordering, values, forward):
+  # Rows strictly after (or before) `values` in `ordering`: the first column
+  # past its value, or equal to it and the second column past, and so on.
+  query = Q()
+  equal = Q()
+  for field, value in zip(ordering, values):
+    name = field.lstrip("-")
+    ascending = not field.startswith("-")
+    lookup = "gt" if ascending == forward else "lt"
+    query |= equal & Q(**{f"{name}__{lookup}": value})
+    equal &= Q(**{name: value})
+  return query
+
+
+def _reversed(ordering):
+  return [field[1:] if field.startswith("-") else f"-{field}" for field in ordering]
+
+
+def _cursors(rows, key, size, direction, has_cursor):
+  # Trim the extra row fetched to look ahead and work out both cursors.
+  more = len(rows) > size
+  rows = rows[:size]
+  if direction == "before":
+    rows.reverse()
+    has_next, has_previous = True, more
+  else:
+    has_next, has_previous = more, has_cursor
+  if not rows:
+    return rows, None, None
+  return (
+    rows,
+    encode_cursor("after", key(rows[-1])) if has_next else None,
+    encode_cursor("before", key(rows[0])) if has_previous else None,
+  )
+
+
+def keyset_page(queryset, ordering=RIDE_ORDERING, cursor=None, size=24):
+  # One page of `queryset` in `ordering` (which must end in a unique column),
+  # starting after or ending before the position in `cursor`. Each page is an
+  # index range scan of size + 1 rows, however deep it is.
+  position = decode_cursor(cursor, len(ordering))
+  values = position and _typed_values(queryset, ordering, position[1])
+  if values is None:
+    position = None
+  direction = position[0] if position else "after"
+  if position:
+    queryset = queryset.filter(_keyset_filter(ordering, values, direction == "after"))
+  queryset = queryset.order_by(*(ordering if direction == "after" else _reversed(ordering)))
+
+  names = [field.lstrip("-") for field in ordering]
+  rows = list(queryset[:size + 1])
+  rows, next_cursor, previous_cursor = _cursors(
+    rows, lambda row: [getattr(row, name) for name in names], size, direction, bool(position)
+  )
+  return Page(rows, next_cursor, previous_cursor)
+
+
+def list_page(rows, key, cursor=None, size=24):
+  # keyset_page() for rows already sorted by `key` in memory, e.g. ranked by
+  # distance. `key` must be unique per row.
+  position = decode_cursor(cursor, len(key(rows[0])) if rows else 0)
+  if position and not _same_types(position[1], key(rows[0])):
+    position = None
+  direction = position[0] if position else "after"
+  if position:
+    values = position[1]
+    if direction == "after":
+      rows = [row for row in rows if list(key(row)) > values]
+    else:
+      rows = [row for row in rows if list(key(row)) < values][::-1]
+  rows, next_cursor, previous_cursor = _cursors(
+    list(rows[:size + 1]), lambda row: list(key(row)), size, direction, bool(position)
+  )
+  return Page(rows, next_cursor, previous_cursor)
+
+
+def approximate_count(queryset, limit=1000):
+  # (count, qualifier): qualifier is "" for an exact count, "about" for a
+  # planner estimate (Postgres EXPLAIN, nothing scanned) and "over" when
+  # counting stopped at `limit`.
+  connection = connections[queryset.db]
+  if connection.vendor == "postgresql":
+    try:
+      sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+      return 0, ""
+    with connection.cursor() as cursor:
+      cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+      plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+      plan = json.loads(plan)
+    estimate = int(plan[0]["Plan"]["Plan Rows"])
+    if estimate > limit:
+      return estimate, "about"
+
+  count = queryset.order_by()[:limit + 1].count()
+  return (limit, "over") if count > limit else (count, "")
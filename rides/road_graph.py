@@ -0,0 +1,247 @@
+import heapq
+import math
+import mmap
+import struct
+import sys
+import threading
+from array import array
+
+from .osrm import CircuitBreaker, RouteUnavailable
+
+# File layout, all little-endian and 4-byte aligned:
+#   header   magic b"HRG1", node count, edge count, reserved
+#   int32    node latitudes, microdegrees          [nodes]
+#   int32    node longitudes, microdegrees         [nodes]
+#   uint32   first outgoing edge of every node     [nodes + 1]
+#   uint32   edge target node                      [edges]
+#   float32  edge length in meters                 [edges]
+# The adjacency is a compressed sparse row layout, so a node's edges are
+# targets[offsets[node]:offsets[node + 1]] and nothing has to be parsed on load.
+GRAPH_MAGIC = b"HRG1"
+GRAPH_HEADER = struct.Struct("<4sIII")
+COORDINATE_SCALE = 1e6
+
+EARTH_RADIUS_METERS = 6371008.8
+
+# Snapping grid cell size in degrees; a few kilometers, so a ring search
+# usually touches a handful of cells.
+SNAP_CELL_DEGREES = 0.05
+
+
+def haversine_meters(latitude1, longitude1, latitude2, longitude2):
+  phi1 = math.radians(latitude1)
+  phi2 = math.radians(latitude2)
+  half_dphi = (phi2 - phi1) / 2
+  half_dlambda = math.radians(longitude2 - longitude1) / 2
+  a = math.sin(half_dphi) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(half_dlambda) ** 2
+  return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def write_road_graph(path, nodes, edges):
+  # `nodes` is a list of (lat, lng); `edges` an iterable of (source, target,
+  # meters) with node indexes. Directed: add both directions for two-way roads.
+  by_source = [[] for _ in nodes]
+  for source, target, meters in edges:
+    by_source[source].append((target, meters))
+
+  offsets = array("I", [0])
+  targets = array("I")
+  weights = array("f")
+  for outgoing in by_source:
+    for target, meters in outgoing:
+      targets.append(target)
+      weights.append(meters)
+    offsets.append(len(targets))
+
+  latitudes = array("i", (round(lat * COORDINATE_SCALE) for lat, _ in nodes))
+  longitudes = array("i", (round(lng * COORDINATE_SCALE) for _, lng in nodes))
+  sections = (latitudes, longitudes, offsets, targets, weights)
+  if sys.byteorder != "little":
+    for section in sections:
+      section.byteswap()
+
+  with open(path, "wb") as handle:
+    handle.write(GRAPH_HEADER.pack(GRAPH_MAGIC, len(nodes), len(targets), 0))
+    for section in sections:
+      section.tofile(handle)
+
+
+# Read-only view of a graph file. The file is memory-mapped, so opening a large
+# graph is instant and every worker process shares the same pages.
+class RoadGraph:
+  def __init__(self, path):
+    with open(path, "rb") as handle:
+      self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, self.node_count, self.edge_count, _ = GRAPH_HEADER.unpack_from(self._map)
+    if magic != GRAPH_MAGIC:
+      self._map.close()
+      raise ValueError(f"{path} is not a road graph file")
+
+    nodes = self.node_count
+    edges = self.edge_count
+    expected = GRAPH_HEADER.size + 4 * (3 * nodes + 1 + 2 * edges)
+    if len(self._map) < expected:
+      self._map.close()
+      raise ValueError(f"{path} is truncated")
+
+    view = self._view = memoryview(self._map)
+    position = GRAPH_HEADER.size
+    sections = []
+    for code, count in (("i", nodes), ("i", nodes), ("I", nodes + 1), ("I", edges), ("f", edges)):
+      chunk = view[position:position + 4 * count]
+      if sys.byteorder != "little":
+        # Big-endian hosts pay for a private, byte-swapped copy.
+        chunk = array(code, chunk.tobytes())
+        chunk.byteswap()
+      else:
+        chunk = chunk.cast(code)
+      sections.append(chunk)
+      position += 4 * count
+
+    self._latitudes, self._longitudes, self.offsets, self.targets, self.weights = sections
+    self._cells = None
+    self._cells_lock = threading.Lock()
+
+  def coordinates(self, node):
+    return (
+      self._latitudes[node] / COORDINATE_SCALE,
+      self._longitudes[node] / COORDINATE_SCALE,
+    )
+
+  def _snap_cells(self):
+    with self._cells_lock:
+      if self._cells is None:
+        cells = {}
+        scale = COORDINATE_SCALE * SNAP_CELL_DEGREES
+        for node in range(self.node_count):
+          cell = (int(self._latitudes[node] // scale), int(self._longitudes[node] // scale))
+          cells.setdefault(cell, []).append(node)
+        self._cells = cells
+    return self._cells
+
+  def nearest_node(self, latitude, longitude, max_meters):
+    # Closest node within `max_meters`, or None. Searches rings of grid cells
+    # outward until no unvisited cell can hold anything closer.
+    cells = self._snap_cells()
+    row = int(latitude // SNAP_CELL_DEGREES)
+    column = int(longitude // SNAP_CELL_DEGREES)
+    # Width of a cell in meters at this latitude, the narrower of its sides.
+    cell_meters = (
+      SNAP_CELL_DEGREES
+      * math.radians(1)
+      * EARTH_RADIUS_METERS
+      * max(math.cos(math.radians(min(abs(latitude) + SNAP_CELL_DEGREES, 89.9))), 0.01)
+    )
+
+    best = None
+    best_meters = max_meters
+    ring = 0
+    while (ring - 1) * cell_meters <= best_meters:
+      for cell_row in range(row - ring, row + ring + 1):
+        for cell_column in range(column - ring, column + ring + 1):
+          if max(abs(cell_row - row), abs(cell_column - column)) != ring:
+            continue
+          for node in cells.get((cell_row, cell_column), ()):
+            node_latitude, node_longitude = self.coordinates(node)
+            meters = haversine_meters(latitude, longitude, node_latitude, node_longitude)
+            if meters <= best_meters:
+              best = node
+              best_meters = meters
+      ring += 1
+    return best
+
+  def shortest_path(self, source, target):
+    # A* over edge lengths with the great-circle distance to the target as the
+    # heuristic; it never overestimates, so the first time the target is
+    # popped its distance is optimal. Returns (meters, [nodes]) or None.
+    if source == target:
+      return 0.0, [source]
+
+    offsets = self.offsets
+    targets = self.targets
+    weights = self.weights
+    target_latitude, target_longitude = self.coordinates(target)
+
+    def remaining(node):
+      node_latitude, node_longitude = self.coordinates(node)
+      return haversine_meters(node_latitude, node_longitude, target_latitude, target_longitude)
+
+    distances = {source: 0.0}
+    previous = {}
+    settled = set()
+    queue = [(remaining(source), 0.0, source)]
+
+    while queue:
+      _, distance, node = heapq.heappop(queue)
+      if node in settled:
+        continue
+      if node == target:
+        path = [node]
+        while node in previous:
+          node = previous[node]
+          path.append(node)
+        path.reverse()
+        return distance, path
+
+      settled.add(node)
+      for edge in range(offsets[node], offsets[node + 1]):
+        neighbor = targets[edge]
+        if neighbor in settled:
+          continue
+        candidate = distance + weights[edge]
+        if candidate < distances.get(neighbor, math.inf):
+          distances[neighbor] = candidate
+          previous[neighbor] = node
+          heapq.heappush(queue, (candidate + remaining(neighbor), candidate, neighbor))
+
+    return None
+
+  def close(self):
+    for section in (self._latitudes, self._longitudes, self.offsets, self.targets, self.weights):
+      if isinstance(section, memoryview):
+        section.release()
+    self._view.release()
+    self._map.close()
+
+
+# Routing backend that answers from a local RoadGraph instead of a remote
+# service. It has the same interface as OsrmClient: route() returns an
+# OSRM-style route dict, or None when the graph has no route between the
+# points, and raises RouteUnavailable when it cannot answer at all. The graph
+# is opened on first use.
+class OfflineRouter:
+  def __init__(self, graph_path, max_snap_meters=5000):
+    self.graph_path = graph_path
+    self.max_snap_meters = max_snap_meters
+    # Never trips; present so callers can treat every backend alike.
+    self.breaker = CircuitBreaker()
+    self._graph = None
+    self._lock = threading.Lock()
+
+  @property
+  def graph(self):
+    with self._lock:
+      if self._graph is None:
+        try:
+          self._graph = RoadGraph(self.graph_path)
+        except (OSError, ValueError) as error:
+          raise RouteUnavailable(f"road graph unavailable: {error}") from error
+      return self._graph
+
+  def route(self, origin, destination):
+    graph = self.graph
+    source = graph.nearest_node(origin[0], origin[1], self.max_snap_meters)
+    target = graph.nearest_node(destination[0], destination[1], self.max_snap_meters)
+    if source is None or target is None:
+      return None
+
+    found = graph.shortest_path(source, target)
+    if found is None:
+      return None
+
+    meters, path = found
+    coordinates = [[lng, lat] for lat, lng in map(graph.coordinates, path)]
+    if len(coordinates) == 1:
+      coordinates.append(coordinates[0])
+    return {"distance": meters, "geometry": {"type": "LineString", "coordinates": coordinates}}
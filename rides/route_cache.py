@@ -0,0 +1,385 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+
+from .geometry import decode_polyline, decode_polylines, encode_polyline
+from .models import RoadRoute, RouteFetchLease
+
+# Returned by RouteCache.get() when a key is absent; None is a valid cached value.
+MISSING = object()
+
+# Expired rows in the shared tier are swept after this many writes.
+PRUNE_EVERY_WRITES = 256
+
+# Keys per shared-tier query in bulk lookups, well under SQLite's variable limit.
+SHARED_QUERY_CHUNK = 500
+
+# How long a worker may hold a fetch lease, and how often waiters re-check the
+# shared tier for the lease holder's result.
+LEASE_SECONDS = 10
+LEASE_POLL_SECONDS = 0.1
+
+
+# Routes are stored in the shared tier as encoded polylines at this precision
+# (about 0.1 m), several times smaller than JSON float lists; bulk reads
+# decode every row of a query in one vectorized pass. Any other value, and
+# rows written as lists before, are stored and read as plain JSON.
+SHARED_ROUTE_PRECISION = 6
+
+
+def _entry_size(value):
+  return len(json.dumps(value, separators=(",", ":")))
+
+
+def _pack(value):
+  if not isinstance(value, list) or not value:
+    return value
+  try:
+    return encode_polyline(value, SHARED_ROUTE_PRECISION)
+  except (TypeError, ValueError):
+    return value
+
+
+def _unpack_rows(rows):
+  # Decodes the polylines among (key, value, size, expires) shared-tier rows
+  # in one decode_polylines() call.
+  rows = list(rows)
+  encoded = [position for position, row in enumerate(rows) if isinstance(row[1], str)]
+  decoded = decode_polylines([rows[position][1] for position in encoded], SHARED_ROUTE_PRECISION)
+  for position, coordinates in zip(encoded, decoded):
+    rows[position] = (rows[position][0], coordinates, *rows[position][2:])
+  return rows
+
+
+# Two-tier road-route cache: a bounded per-worker LRU (by entry count and bytes)
+# in front of the shared RoadRoute table, so every worker and every restart
+# reuses the same warm entries.
+class RouteCache:
+  def __init__(self, max_entries=None, max_bytes=None, ttl=None, shared=True):
+    self.max_entries = max_entries or getattr(settings, "ROUTE_CACHE_MAX_ENTRIES", 2048)
+    self.max_bytes = max_bytes or getattr(settings, "ROUTE_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+    self.ttl = ttl or getattr(settings, "ROUTE_CACHE_TTL", 30 * 24 * 60 * 60)
+    self.shared = shared
+
+    self._entries = OrderedDict()
+    self._bytes = 0
+    self._writes = 0
+    self._lock = threading.Lock()
+    self._counters = dict.fromkeys(
+      (
+        "hits",
+        "shared_hits",
+        "misses",
+        "evictions",
+        "expirations",
+        "remote_fills",
+        "shared_errors",
+      ),
+      0,
+    )
+
+  def get(self, key, default=MISSING):
+    now = time.time()
+
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None:
+        value, size, expires_at = entry
+        if expires_at is None or expires_at > now:
+          self._entries.move_to_end(key)
+          self._counters["hits"] += 1
+          return value
+
+        self._discard(key)
+        self._counters["expirations"] += 1
+
+    if self.shared:
+      row = self._read_shared(key)
+      if row is not None:
+        expires_at = row.expires_at.timestamp() if row.expires_at else None
+        if expires_at is None or expires_at > now:
+          value = row.coordinates
+          if isinstance(value, str):
+            value = decode_polyline(value, SHARED_ROUTE_PRECISION)
+          with self._lock:
+            self._counters["shared_hits"] += 1
+            self._store_local(key, value, row.size_bytes, expires_at)
+          return value
+
+    with self._lock:
+      self._counters["misses"] += 1
+    return default
+
+  def get_many(self, keys):
+    # Bulk get(): one shared-tier query for everything the local tier lacks.
+    # Returns only the keys that were found.
+    now = time.time()
+    found = {}
+    remaining = []
+
+    with self._lock:
+      for key in keys:
+        entry = self._entries.get(key)
+        if entry is not None and (entry[2] is None or entry[2] > now):
+          self._entries.move_to_end(key)
+          self._counters["hits"] += 1
+          found[key] = entry[0]
+        else:
+          remaining.append(key)
+
+    if self.shared and remaining:
+      for start in range(0, len(remaining), SHARED_QUERY_CHUNK):
+        chunk = remaining[start:start + SHARED_QUERY_CHUNK]
+        try:
+          rows = _unpack_rows(
+            RoadRoute.objects.filter(key__in=chunk).values_list(
+              "key", "coordinates", "size_bytes", "expires_at"
+            )
+          )
+        except DatabaseError:
+          self._counters["shared_errors"] += 1
+          break
+
+        with self._lock:
+          for key, value, size, expires in rows:
+            expires_at = expires.timestamp() if expires else None
+            if expires_at is None or expires_at > now:
+              self._counters["shared_hits"] += 1
+              self._store_local(key, value, size, expires_at)
+              found[key] = value
+
+    with self._lock:
+      self._counters["misses"] += len(remaining) - sum(1 for key in remaining if key in found)
+    return found
+
+  def set(self, key, value, ttl=None):
+    ttl = self.ttl if ttl is None else ttl
+    size = _entry_size(value)
+    expires_at = time.time() + ttl if ttl else None
+
+    with self._lock:
+      self._store_local(key, value, size, expires_at)
+      self._writes += 1
+      should_prune = self._writes % PRUNE_EVERY_WRITES == 0
+
+    if self.shared:
+      self._write_shared(key, value, size, expires_at)
+      if should_prune:
+        self.prune()
+
+  def delete(self, key):
+    with self._lock:
+      self._discard(key)
+
+    if self.shared:
+      try:
+        RoadRoute.objects.filter(key=key).delete()
+      except DatabaseError:
+        self._counters["shared_errors"] += 1
+
+  def clear(self, shared=True):
+    with self._lock:
+      self._entries.clear()
+      self._bytes = 0
+      for name in self._counters:
+        self._counters[name] = 0
+
+    if self.shared and shared:
+      try:
+        RoadRoute.objects.all().delete()
+      except DatabaseError:
+        self._counters["shared_errors"] += 1
+
+  def prune(self):
+    # Drop expired rows so the shared table only holds live entries.
+    try:
+      return RoadRoute.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+    except DatabaseError:
+      self._counters["shared_errors"] += 1
+      return 0
+
+  def claim(self, keys, ttl=LEASE_SECONDS):
+    # Take the cross-worker fetch lease for as many keys as possible. Returns a
+    # token for release() and the set of keys this caller now owns; keys held
+    # by another worker are left out and can be waited on with wait_for().
+    keys = list(keys)
+    if not self.shared or not keys:
+      return None, set(keys)
+
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    try:
+      RouteFetchLease.objects.filter(key__in=keys, expires_at__lte=now).delete()
+      RouteFetchLease.objects.bulk_create(
+        [
+          RouteFetchLease(key=key, owner=token, expires_at=now + timedelta(seconds=ttl))
+          for key in keys
+        ],
+        ignore_conflicts=True,
+      )
+      claimed = set(
+        RouteFetchLease.objects.filter(key__in=keys, owner=token).values_list("key", flat=True)
+      )
+    except DatabaseError:
+      self._counters["shared_errors"] += 1
+      return None, set(keys)
+
+    return token, claimed
+
+  def release(self, token):
+    if token is None:
+      return
+
+    try:
+      RouteFetchLease.objects.filter(owner=token).delete()
+    except DatabaseError:
+      self._counters["shared_errors"] += 1
+
+  def wait_for(self, keys, timeout=LEASE_SECONDS):
+    # Poll the shared tier until another worker has filled the keys or the
+    # lease would have expired anyway.
+    pending = set(keys)
+    filled = {}
+    deadline = time.monotonic() + timeout
+
+    while pending and self.shared:
+      try:
+        rows = RoadRoute.objects.filter(key__in=pending).values_list(
+          "key", "coordinates", "size_bytes", "expires_at"
+        )
+        rows = _unpack_rows(rows)
+      except DatabaseError:
+        self._counters["shared_errors"] += 1
+        break
+
+      with self._lock:
+        for key, value, size, expires in rows:
+          expires_at = expires.timestamp() if expires else None
+          self._store_local(key, value, size, expires_at)
+          self._counters["remote_fills"] += 1
+          filled[key] = value
+          pending.discard(key)
+
+      if not pending or time.monotonic() >= deadline:
+        break
+      time.sleep(LEASE_POLL_SECONDS)
+
+    return filled
+
+  def stats(self):
+    with self._lock:
+      stats = dict(self._counters)
+      stats["entries"] = len(self._entries)
+      stats["bytes"] = self._bytes
+
+    lookups = stats["hits"] + stats["shared_hits"] + stats["misses"]
+    stats["hit_rate"] = (stats["hits"] + stats["shared_hits"]) / lookups if lookups else 0.0
+    return stats
+
+  def __contains__(self, key):
+    return self.get(key) is not MISSING
+
+  def __len__(self):
+    return len(self._entries)
+
+  # The helpers below expect self._lock to be held by the caller.
+
+  def _store_local(self, key, value, size, expires_at):
+    self._discard(key)
+    self._entries[key] = (value, size, expires_at)
+    self._bytes += size
+
+    while self._entries and (
+      len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+    ):
+      _, (_, evicted_size, _) = self._entries.popitem(last=False)
+      self._bytes -= evicted_size
+      self._counters["evictions"] += 1
+
+  def _discard(self, key):
+    entry = self._entries.pop(key, None)
+    if entry is not None:
+      self._bytes -= entry[1]
+
+  def _read_shared(self, key):
+    try:
+      return RoadRoute.objects.filter(key=key).first()
+    except DatabaseError:
+      self._counters["shared_errors"] += 1
+      return None
+
+  def _write_shared(self, key, value, size, expires_at):
+    expires = (
+      datetime.fromtimestamp(expires_at, tz=dt_timezone.utc) if expires_at else None
+    )
+    try:
+      RoadRoute.objects.update_or_create(
+        key=key,
+        defaults={"coordinates": _pack(value), "size_bytes": size, "expires_at": expires},
+      )
+    except DatabaseError:
+      self._counters["shared_errors"] += 1
+
+
+class _Call:
+  def __init__(self):
+    self.done = threading.Event()
+    self.result = None
+    self.error = None
+
+
+# Collapses concurrent calls for the same key within this process: the first
+# caller runs the function and every caller that arrives while it is running
+# waits for and shares its result.
+class SingleFlight:
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._calls = {}
+    self._counters = {"leaders": 0, "coalesced": 0}
+
+  def do(self, key, function, *args):
+    # Returns (result, leader); only the leader actually ran the function.
+    with self._lock:
+      call = self._calls.get(key)
+      leader = call is None
+      if leader:
+        call = self._calls[key] = _Call()
+        self._counters["leaders"] += 1
+      else:
+        self._counters["coalesced"] += 1
+
+    if not leader:
+      call.done.wait()
+      if call.error is not None:
+        raise call.error
+      return call.result, False
+
+    try:
+      call.result = function(*args)
+    except Exception as error:
+      call.error = error
+      raise
+    finally:
+      with self._lock:
+        del self._calls[key]
+      call.done.set()
+
+    return call.result, True
+
+  def stats(self):
+    with self._lock:
+      stats = dict(self._counters)
+      stats["in_flight"] = len(self._calls)
+    return stats
+
+  def reset(self):
+    with self._lock:
+      for name in self._counters:
+        self._counters[name] = 0
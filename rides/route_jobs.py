@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .geocoding import resolve_ride_endpoints
+from .models import RouteJob
+from .route_cache import MISSING
+from .routing import ROUTE_COORDINATE_CACHE, build_route_key, request_road_route
+
+# Failed jobs are retried with exponential backoff up to this many attempts.
+ROUTE_JOB_MAX_ATTEMPTS = 5
+ROUTE_JOB_RETRY_SECONDS = 30
+
+# Jobs left "running" this long belong to a worker that died; they are retried.
+ROUTE_JOB_STALE_SECONDS = 10 * 60
+
+
+def enqueue_route_jobs(rides):
+  # Queue a route computation for every corridor in `rides` that does not have
+  # a job yet. Returns the number of new jobs.
+  now = timezone.now()
+  jobs = {}
+  for ride in rides:
+    endpoints = resolve_ride_endpoints(ride)
+    if endpoints is None or endpoints[0] == endpoints[1]:
+      continue
+
+    origin, destination = endpoints
+    key = build_route_key(origin, destination)
+    jobs[key] = RouteJob(
+      key=key,
+      origin_lat=origin[0],
+      origin_lng=origin[1],
+      destination_lat=destination[0],
+      destination_lng=destination[1],
+      run_after=now,
+    )
+
+  if not jobs:
+    return 0
+
+  existing = set(RouteJob.objects.filter(key__in=jobs).values_list("key", flat=True))
+  RouteJob.objects.bulk_create(
+    [job for key, job in jobs.items() if key not in existing], ignore_conflicts=True
+  )
+  return len(jobs) - len(existing)
+
+
+def _claim_jobs(limit, now):
+  RouteJob.objects.filter(
+    status=RouteJob.RUNNING,
+    updated_at__lte=now - timedelta(seconds=ROUTE_JOB_STALE_SECONDS),
+  ).update(status=RouteJob.PENDING)
+
+  candidates = RouteJob.objects.filter(status=RouteJob.PENDING, run_after__lte=now).order_by(
+    "run_after", "id"
+  )[:limit]
+
+  # The conditional update makes each claim atomic, so several workers can
+  # poll the same queue without running a job twice.
+  claimed = []
+  for job in candidates:
+    if RouteJob.objects.filter(pk=job.pk, status=RouteJob.PENDING).update(
+      status=RouteJob.RUNNING, updated_at=now
+    ):
+      claimed.append(job)
+  return claimed
+
+
+def process_route_jobs(limit=50):
+  # Run up to `limit` due jobs. Returns a dict of outcome counts.
+  now = timezone.now()
+  results = {"done": 0, "retried": 0, "failed": 0}
+
+  for job in _claim_jobs(limit, now):
+    origin = [job.origin_lat, job.origin_lng]
+    destination = [job.destination_lat, job.destination_lng]
+
+    coordinates = ROUTE_COORDINATE_CACHE.get(job.key)
+    error = None
+    if coordinates is MISSING or coordinates is None:
+      coordinates, error = request_road_route(origin, destination)
+
+    job.attempts += 1
+    if error is None:
+      # Precomputed routes never expire; they are the map's source of truth.
+      ROUTE_COORDINATE_CACHE.set(job.key, coordinates, ttl=0)
+      job.status = RouteJob.DONE
+      job.last_error = ""
+      results["done"] += 1
+    elif job.attempts >= ROUTE_JOB_MAX_ATTEMPTS:
+      job.status = RouteJob.FAILED
+      job.last_error = str(error)[:200]
+      results["failed"] += 1
+    else:
+      job.status = RouteJob.PENDING
+      job.run_after = now + timedelta(seconds=ROUTE_JOB_RETRY_SECONDS * 2 ** (job.attempts - 1))
+      job.last_error = str(error)[:200]
+      results["retried"] += 1
+
+    job.save(update_fields=["status", "attempts", "run_after", "last_error", "updated_at"])
+
+  return results
@@ -0,0 +1,293 @@
+import asyncio
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .geometry import decode_polyline, pixel_tolerance, simplify_path
+from .osrm import AsyncOsrmClient, CircuitBreaker, CircuitOpen, OsrmClient, RouteUnavailable
+from .road_graph import OfflineRouter
+from .route_cache import MISSING, RouteCache, SingleFlight
+
+OSRM_BASE_URL = "https://router.project-osrm.org/route/v1/driving/"
+OSRM_CLIENT = OsrmClient(OSRM_BASE_URL, breaker=CircuitBreaker(failure_threshold=5, reset_timeout=30))
+# The async client shares the breaker, so both paths agree on upstream health.
+ASYNC_OSRM_CLIENT = AsyncOsrmClient(OSRM_BASE_URL, breaker=OSRM_CLIENT.breaker)
+
+
+def build_routing_backend(name):
+  # A routing backend has route(origin, destination) -> OSRM-style route dict
+  # or None, raises RouteUnavailable when it cannot answer, and exposes the
+  # CircuitBreaker guarding it as `breaker`.
+  if name == "osrm":
+    return OSRM_CLIENT
+  if name == "offline":
+    return OfflineRouter(settings.ROAD_GRAPH_PATH, settings.ROAD_GRAPH_MAX_SNAP_METERS)
+  raise ImproperlyConfigured(f"Unknown ROUTING_BACKEND {name!r}")
+
+
+ROUTING_BACKEND = build_routing_backend(settings.ROUTING_BACKEND)
+ROUTE_COORDINATE_CACHE = RouteCache()
+ROUTE_FETCHES = SingleFlight()
+
+# In-flight async lookups per event loop, keyed by route key.
+_ASYNC_FETCHES = weakref.WeakKeyDictionary()
+
+# Route geometry is simplified to `tolerance` screen pixels (default 1) at the
+# requested map zoom; from this zoom on the full OSRM geometry is returned.
+ROUTE_FULL_DETAIL_ZOOM = 17
+ROUTE_MAX_PIXEL_TOLERANCE = 10.0
+
+# Detail level of the routes embedded in the map page; the map script asks the
+# batch API for finer geometry once the user zooms in past it.
+ROUTE_EMBED_LEVEL = (10, 1.0)
+
+
+def build_route_key(origin, destination):
+  return (
+    f"{origin[0]:.5f}|{origin[1]:.5f}|"
+    f"{destination[0]:.5f}|{destination[1]:.5f}"
+  )
+
+
+def _normalize_route_coordinates(raw_coordinates):
+  coordinates = []
+  for point in raw_coordinates:
+    if not isinstance(point, (list, tuple)) or len(point) < 2:
+      continue
+
+    try:
+      longitude = float(point[0])
+      latitude = float(point[1])
+    except (TypeError, ValueError):
+      continue
+
+    coordinates.append([latitude, longitude])
+
+  return coordinates
+
+
+def extract_route_coordinates(route):
+  if not isinstance(route, dict):
+    return None
+
+  geometry = route.get("geometry")
+
+  if isinstance(geometry, dict):
+    coordinates = _normalize_route_coordinates(geometry.get("coordinates") or [])
+    return coordinates if len(coordinates) > 1 else None
+
+  if isinstance(geometry, str):
+    for precision in (5, 6):
+      decoded = decode_polyline(geometry, precision=precision)
+      if len(decoded) > 1:
+        return decoded
+
+  return None
+
+
+def request_road_route(origin, destination):
+  # Returns (coordinates, error); error is the RouteUnavailable raised when the
+  # routing backend did not answer.
+  try:
+    return extract_route_coordinates(ROUTING_BACKEND.route(origin, destination)), None
+  except RouteUnavailable as error:
+    return None, error
+
+
+def store_road_route(key, coordinates, error):
+  if error is None:
+    ROUTE_COORDINATE_CACHE.set(key, coordinates)
+  elif not isinstance(error, CircuitOpen):
+    # Failures get a short negative entry; open-breaker rejections are not
+    # cached at all so routes come back as soon as the breaker closes.
+    ROUTE_COORDINATE_CACHE.set(key, None, ttl=settings.ROUTE_NEGATIVE_CACHE_TTL)
+
+
+def upstream_open():
+  return ROUTING_BACKEND.breaker.state == CircuitBreaker.OPEN
+
+
+def _load_road_route(key, origin, destination):
+  # Runs once per key per process (see ROUTE_FETCHES). If another worker holds
+  # the fetch lease, wait for its result instead of calling upstream again.
+  # Returns (coordinates, error) like request_road_route(), which batch
+  # lookups of the same key share the flight with.
+  token, claimed = ROUTE_COORDINATE_CACHE.claim([key])
+  if key not in claimed:
+    filled = ROUTE_COORDINATE_CACHE.wait_for([key])
+    if key in filled:
+      return filled[key], None
+
+  try:
+    coordinates, error = request_road_route(origin, destination)
+    store_road_route(key, coordinates, error)
+  finally:
+    ROUTE_COORDINATE_CACHE.release(token)
+
+  return coordinates, error
+
+
+def fetch_road_route(origin, destination):
+  key = build_route_key(origin, destination)
+  cached = ROUTE_COORDINATE_CACHE.get(key)
+  if cached is not MISSING:
+    return cached
+
+  # While the breaker is open, skip the lease and answer with no route at once.
+  if upstream_open():
+    return None
+
+  (coordinates, _), _ = ROUTE_FETCHES.do(key, _load_road_route, key, origin, destination)
+  return coordinates
+
+
+async def async_request_road_route(origin, destination):
+  try:
+    if ROUTING_BACKEND is OSRM_CLIENT:
+      route = await ASYNC_OSRM_CLIENT.route(origin, destination)
+    else:
+      # In-process backends are CPU-bound; keep them off the event loop.
+      route = await sync_to_async(ROUTING_BACKEND.route, thread_sensitive=False)(
+        origin, destination
+      )
+  except RouteUnavailable as error:
+    return None, error
+  return extract_route_coordinates(route), None
+
+
+async def _async_load_road_route(key, origin, destination):
+  coordinates, error = await async_request_road_route(origin, destination)
+  await sync_to_async(store_road_route)(key, coordinates, error)
+  return coordinates
+
+
+def _async_shared_fetch(key, origin, destination):
+  # Concurrent lookups of one key on an event loop share a task.
+  in_flight = _ASYNC_FETCHES.setdefault(asyncio.get_running_loop(), {})
+  task = in_flight.get(key)
+  if task is None:
+    task = in_flight[key] = asyncio.ensure_future(_async_load_road_route(key, origin, destination))
+    task.add_done_callback(lambda _: in_flight.pop(key, None))
+
+  # Shielded so one caller disconnecting does not cancel the shared lookup.
+  return asyncio.shield(task)
+
+
+async def async_fetch_road_route(origin, destination):
+  # fetch_road_route() for async views: the upstream call never blocks the
+  # event loop and concurrent lookups of one key on a loop share a task. Cache
+  # access still goes through Django's thread-sensitive executor because it
+  # touches the database.
+  key = build_route_key(origin, destination)
+  cached = await sync_to_async(ROUTE_COORDINATE_CACHE.get)(key)
+  if cached is not MISSING:
+    return cached
+
+  if upstream_open():
+    return None
+
+  return await _async_shared_fetch(key, origin, destination)
+
+
+async def _async_request_missing_routes(misses):
+  # Every miss goes upstream at once; the async client's connection slots
+  # bound how many requests are actually in flight.
+  coordinates = await asyncio.gather(
+    *(_async_shared_fetch(key, *endpoints) for key, endpoints in misses.items())
+  )
+  return dict(zip(misses, coordinates))
+
+
+async def async_fetch_road_routes(pairs):
+  # Resolve many (origin, destination) pairs at once: cache hits are answered
+  # from one bulk read and only the misses go upstream, concurrently.
+  routes = {}
+  misses = {}
+
+  for key, (origin, destination) in pairs.items():
+    if origin == destination:
+      routes[key] = [origin, destination]
+    else:
+      misses[key] = (origin, destination)
+
+  cached = await sync_to_async(ROUTE_COORDINATE_CACHE.get_many)(list(misses))
+  routes.update(cached)
+  misses = {key: endpoints for key, endpoints in misses.items() if key not in cached}
+  if not misses:
+    return routes
+
+  if upstream_open():
+    routes.update(dict.fromkeys(misses))
+    return routes
+
+  token, claimed = await sync_to_async(ROUTE_COORDINATE_CACHE.claim)(misses)
+  try:
+    routes.update(
+      await _async_request_missing_routes({key: misses[key] for key in misses if key in claimed})
+    )
+  finally:
+    await sync_to_async(ROUTE_COORDINATE_CACHE.release)(token)
+
+  # Keys another worker was already fetching: wait for its result and only
+  # fetch what is still missing once its lease runs out.
+  remote_keys = [key for key in misses if key not in claimed]
+  if remote_keys:
+    routes.update(await sync_to_async(ROUTE_COORDINATE_CACHE.wait_for)(remote_keys))
+    routes.update(
+      await _async_request_missing_routes(
+        {key: misses[key] for key in remote_keys if key not in routes}
+      )
+    )
+
+  return routes
+
+
+def parse_detail_level(zoom, tolerance):
+  # Returns (zoom, pixel_tolerance), or None for full detail. Raises ValueError
+  # on out-of-range input.
+  if zoom in (None, ""):
+    return None
+
+  zoom = int(zoom)
+  tolerance = 1.0 if tolerance in (None, "") else float(tolerance)
+  if not 0 <= zoom <= 22 or not 0 < tolerance <= ROUTE_MAX_PIXEL_TOLERANCE:
+    raise ValueError("detail level out of range")
+
+  if zoom >= ROUTE_FULL_DETAIL_ZOOM:
+    return None
+  return zoom, tolerance
+
+
+def detail_key(key, level):
+  return f"{key}|z{level[0]}|t{level[1]:g}"
+
+
+def simplify_road_route(key, coordinates, level):
+  # Each simplification level is cached next to the full geometry.
+  if coordinates is None or level is None or len(coordinates) < 3:
+    return coordinates
+
+  simplified = simplify_path(coordinates, pixel_tolerance(*level))
+  ROUTE_COORDINATE_CACHE.set(detail_key(key, level), simplified)
+  return simplified
+
+
+def stored_routes(keys, level=None):
+  # Routes that are already computed, read from the cache tiers in bulk and
+  # simplified to `level`. Never calls upstream; keys without a stored road
+  # route are left out.
+  keys = list(keys)
+  wanted = list(keys)
+  if level:
+    wanted += [detail_key(key, level) for key in keys]
+  found = ROUTE_COORDINATE_CACHE.get_many(wanted)
+
+  routes = {}
+  for key in keys:
+    if level and detail_key(key, level) in found:
+      routes[key] = found[detail_key(key, level)]
+    elif found.get(key) is not None:
+      routes[key] = simplify_road_route(key, found[key], level)
+  return routes
@@ -0,0 +1,147 @@
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .fuzzy import fuzzy_search_rides
+from .models import Person
+from .pagination import RIDE_ORDERING
+
+# Columns a keyword search looks at. A term matches a ride when it appears
+# anywhere inside one of them, ignoring case; every term has to match.
+SEARCH_FIELDS = (
+  "first_name",
+  "origination",
+  "destination_city",
+  "destination_state",
+  "occupation",
+  "interests",
+  "personality_style",
+  "looking_for",
+  "relationship_status",
+)
+
+# SQLite: FTS5 table with the trigram tokenizer, one row per ride (rowid is the
+# ride id), kept in sync by triggers on rides_person (see migration 0009).
+# Postgres: GIN indexes over the same document expression, trigram for the
+# substring match and tsvector for ranking.
+SEARCH_TABLE = "rides_person_search"
+
+# Trigrams can only find terms of three or more characters; shorter terms are
+# matched field by field.
+MIN_INDEXED_TERM = 3
+
+
+def document_sql(vendor, prefix=""):
+  # SQL for one ride's search document: its fields, lowercased and joined by
+  # newlines. Terms never contain whitespace, so a term is a substring of the
+  # document exactly when it is a substring of one of the fields.
+  separator = "chr(10)" if vendor == "postgresql" else "char(10)"
+  joined = f" || {separator} || ".join(f"{prefix}{field}" for field in SEARCH_FIELDS)
+  return f"lower({joined})"
+
+
+def search_terms(text):
+  return (text or "").replace(",", " ").split()
+
+
+def term_filter(term):
+  # The unindexed match for one term: a substring of any search field.
+  query = Q()
+  for field in SEARCH_FIELDS:
+    if field != "destination_state":
+      query |= Q(**{f"{field}__icontains": term})
+
+  # Treat 2-character tokens as potential state abbreviations.
+  if len(term) == 2:
+    query |= Q(destination_state__iexact=term)
+  else:
+    query |= Q(destination_state__icontains=term)
+  return query
+
+
+def _fts_phrase(term):
+  return '"' + term.replace('"', '""') + '"'
+
+
+def search_rides(queryset, text):
+  # `queryset` narrowed to the rides matching every term in `text`, annotated
+  # with `search_rank` (higher is more relevant; 0 when nothing was ranked).
+  terms = search_terms(text)
+  vendor = connections[queryset.db].vendor
+  rank = Value(0.0, output_field=FloatField())
+  if not terms:
+    return queryset.annotate(search_rank=rank)
+
+  indexed = [term for term in terms if len(term) >= MIN_INDEXED_TERM]
+  if vendor not in ("sqlite", "postgresql"):
+    indexed = []
+  for term in terms:
+    if term not in indexed:
+      queryset = queryset.filter(term_filter(term))
+  if not indexed:
+    return queryset.annotate(search_rank=rank)
+
+  table = queryset.model._meta.db_table
+  if vendor == "sqlite":
+    match = " AND ".join(_fts_phrase(term) for term in indexed)
+    queryset = queryset.filter(
+      pk__in=RawSQL(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", (match,))
+    )
+    # bm25() is lower for better matches.
+    rank = RawSQL(
+      f"SELECT -bm25({SEARCH_TABLE}) FROM {SEARCH_TABLE} "
+      f"WHERE {SEARCH_TABLE} MATCH %s AND rowid = {table}.id",
+      (match,),
+      output_field=FloatField(),
+    )
+  else:
+    document = document_sql(vendor)
+    queryset = queryset.alias(search_document=RawSQL(document, ()))
+    for term in indexed:
+      queryset = queryset.filter(search_document__contains=term.lower())
+    rank = RawSQL(
+      f"ts_rank(to_tsvector('simple', {document}), plainto_tsquery('simple', %s))",
+      (" ".join(indexed),),
+      output_field=FloatField(),
+    )
+  return queryset.annotate(search_rank=rank)
+
+
+def filter_rides(cleaned_data, fuzzy=False):
+  # (queryset, ordering) for RideForm's filters, without running it. Radius
+  # search (near_point) is left to the caller.
+  people = Person.objects.all()
+  ordering = RIDE_ORDERING
+  if cleaned_data is None:
+    return people, ordering
+
+  search = cleaned_data["search"].strip()
+  travel_date = cleaned_data["travel_date"]
+  minimum_seats = cleaned_data["minimum_seats"]
+  passengers_only = cleaned_data["passengers_only"]
+
+  if travel_date:
+    people = people.filter(date=travel_date)
+
+  if minimum_seats:
+    people = people.filter(seats_available__gte=minimum_seats)
+
+  if passengers_only:
+    people = people.filter(taking_passengers=True)
+
+  if search:
+    # Best keyword matches first; fuzzy matching ranks close spellings of
+    # cities and names ("Sna Jose") by similarity instead.
+    people = (fuzzy_search_rides if fuzzy else search_rides)(people, search)
+    ordering = ("-search_rank", *RIDE_ORDERING)
+  return people, ordering
+
+
+def matching_rides(cleaned_data):
+  # filter_rides(), falling back to fuzzy matching when a keyword search finds
+  # nothing. Returns (queryset, ordering, fuzzy).
+  people, ordering = filter_rides(cleaned_data)
+  if cleaned_data and cleaned_data["search"].strip() and not people.exists():
+    people, ordering = filter_rides(cleaned_data, fuzzy=True)
+    return people, ordering, True
+  return people, ordering, False
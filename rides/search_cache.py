@@ -0,0 +1,58 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+
+from .models import CacheGeneration
+from .route_cache import RouteCache
+from .search import search_terms
+
+# Generation of the ride data; bumped on every ride create, update and delete.
+RIDES_GENERATION = "rides"
+
+# Per-worker LRU of search result pages. Entries carry the generation they
+# were computed at in their key, so a bump makes them unreachable and they
+# age out of the LRU.
+SEARCH_RESULT_CACHE = RouteCache(
+  max_entries=settings.SEARCH_CACHE_MAX_ENTRIES,
+  max_bytes=settings.SEARCH_CACHE_MAX_BYTES,
+  ttl=settings.SEARCH_CACHE_TTL,
+  shared=False,
+)
+
+
+def current_generation(name=RIDES_GENERATION):
+  value = CacheGeneration.objects.filter(name=name).values_list("value", flat=True).first()
+  return value or 0
+
+
+def bump_generation(name=RIDES_GENERATION):
+  # Writers that skip model signals (bulk_create(), update(), bulk_update())
+  # call this themselves.
+  if not CacheGeneration.objects.filter(name=name).update(value=F("value") + 1):
+    generation, created = CacheGeneration.objects.get_or_create(name=name, defaults={"value": 1})
+    if not created:
+      CacheGeneration.objects.filter(name=name).update(value=F("value") + 1)
+
+
+def search_cache_key(generation, cleaned_data, cursor, size):
+  # Same key for searches that differ only in case, spacing or commas.
+  near_point = cleaned_data.get("near_point")
+  normalized = {
+    "terms": search_terms((cleaned_data.get("search") or "").lower()),
+    "date": cleaned_data.get("travel_date"),
+    "seats": cleaned_data.get("minimum_seats"),
+    "passengers_only": bool(cleaned_data.get("passengers_only")),
+    "near": [round(value, 5) for value in near_point] if near_point else None,
+    "radius_km": cleaned_data.get("radius_km") if near_point else None,
+    "near_side": cleaned_data.get("near_side") if near_point else None,
+    "cursor": cursor or "",
+    "size": size,
+  }
+  digest = hashlib.sha1(
+    json.dumps(normalized, cls=DjangoJSONEncoder, sort_keys=True).encode("utf-8")
+  ).hexdigest()
+  return f"search:{generation}:{digest}"
+
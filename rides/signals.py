@@ -0,0 +1,88 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .fuzzy import index_ride_values
+from .geocoding import set_ride_coordinates
+from .models import Person
+from .route_jobs import enqueue_route_jobs
+from .search_cache import bump_generation
+from .stats import STAT_FIELDS, apply_ride_change
+from .suggest import SUGGEST_FIELDS, update_ride_suggestions
+from .tiles import TILE_FIELDS, invalidate_ride_tiles
+
+# Columns whose previous values the post-save handlers need, to take a ride's
+# old contribution out of the suggestion index and the rollups, and to tell
+# whether the cached map tiles drew anything it changed.
+TRACKED_FIELDS = tuple(dict.fromkeys((*SUGGEST_FIELDS, *STAT_FIELDS, *TILE_FIELDS)))
+
+
+def _tracked_values(ride):
+  return {field: getattr(ride, field) for field in TRACKED_FIELDS}
+
+
+@receiver(pre_save, sender=Person)
+def fill_ride_coordinates(sender, instance, update_fields=None, **kwargs):
+  # Saving only other fields leaves the stored coordinates alone.
+  if update_fields is None or Person.PLACE_FIELDS & set(update_fields):
+    set_ride_coordinates(instance)
+
+
+@receiver(pre_save, sender=Person)
+def remember_stored_ride(sender, instance, update_fields=None, **kwargs):
+  # One read of the stored row, shared by the post-save handlers below.
+  tracked = update_fields is None or bool(set(update_fields) & set(TRACKED_FIELDS))
+  instance._tracked_change = tracked
+  instance._stored_values = None
+  if tracked and instance.pk is not None:
+    stored = Person.objects.filter(pk=instance.pk).values(*TRACKED_FIELDS)
+    instance._stored_values = stored.first()
+
+
+@receiver(post_save, sender=Person)
+def queue_ride_route(sender, instance, **kwargs):
+  # Covers the add-ride form, the admin and `loaddata`; bulk_create() skips
+  # signals, so bulk imports run `manage.py enqueue_route_jobs` afterwards.
+  enqueue_route_jobs([instance])
+
+
+@receiver(post_save, sender=Person)
+def index_ride_spellings(sender, instance, **kwargs):
+  index_ride_values(instance)
+
+
+@receiver(post_save, sender=Person)
+def track_ride_change(sender, instance, update_fields=None, **kwargs):
+  if not getattr(instance, "_tracked_change", True):
+    return
+  previous = getattr(instance, "_stored_values", None)
+  current = _tracked_values(instance)
+  if previous is not None and update_fields is not None:
+    # Only the saved columns changed in the database.
+    saved = {field: current[field] for field in update_fields if field in current}
+    current = {**previous, **saved}
+  update_ride_suggestions(previous, current)
+  apply_ride_change(previous, current)
+  instance._tile_change = (previous, current)
+
+
+@receiver(post_delete, sender=Person)
+def untrack_ride(sender, instance, **kwargs):
+  values = _tracked_values(instance)
+  update_ride_suggestions(values, None)
+  apply_ride_change(values, None)
+  instance._tile_change = (values, None)
+
+
+@receiver(post_save, sender=Person)
+@receiver(post_delete, sender=Person)
+def invalidate_ride_searches(sender, **kwargs):
+  bump_generation()
+
+
+@receiver(post_save, sender=Person)
+@receiver(post_delete, sender=Person)
+def drop_ride_tiles(sender, instance, **kwargs):
+  change = getattr(instance, "_tile_change", None)
+  if change is not None:
+    instance._tile_change = None
+    invalidate_ride_tiles(*change)
@@ -0,0 +1,76 @@
+from django.db.models import Q
+
+from .geometry import geohash_cover, haversine_km, radius_box
+from .models import Person
+
+SIDES = ("origin", "destination", "either")
+
+
+def _side_fields(side):
+  return ("origin", "destination") if side == "either" else (side,)
+
+
+def _box_filter(box, side):
+  # Index-friendly filter for rides with the given endpoint(s) inside `box`:
+  # one geohash range per covering cell narrows the scan, the lat/lng bounds
+  # make it exact.
+  south, west, north, east = box
+  query = Q()
+  for prefix_side in _side_fields(side):
+    cells = Q()
+    for prefix in geohash_cover(south, west, north, east):
+      if prefix:
+        cells |= Q(
+          **{f"{prefix_side}_geohash__gte": prefix, f"{prefix_side}_geohash__lt": prefix + "~"}
+        )
+    query |= cells & Q(
+      **{
+        f"{prefix_side}_lat__gte": south,
+        f"{prefix_side}_lat__lte": north,
+        f"{prefix_side}_lng__gte": west,
+        f"{prefix_side}_lng__lte": east,
+      }
+    )
+  return query
+
+
+def rides_in_box(box, side="either", queryset=None):
+  # Rides whose origin, destination or either endpoint lies inside
+  # (south, west, north, east).
+  queryset = Person.objects.all() if queryset is None else queryset
+  return queryset.filter(_box_filter(box, side))
+
+
+def rides_near(latitude, longitude, radius_km, side="either", queryset=None):
+  # {ride id: distance in km} for rides with an endpoint within `radius_km`
+  # of the point, nearest first. Candidates come from the geohash cells
+  # covering the circle's bounding box; exact distances are computed for all
+  # of them in one vectorized pass.
+  candidates = rides_in_box(radius_box(latitude, longitude, radius_km), side, queryset)
+  fields = _side_fields(side)
+  rows = list(
+    candidates.values_list(
+      "pk", *(f"{name}_{axis}" for name in fields for axis in ("lat", "lng"))
+    )
+  )
+  if not rows:
+    return {}
+
+  distances = None
+  for position in range(len(fields)):
+    side_distances = haversine_km(
+      latitude,
+      longitude,
+      [row[1 + 2 * position] for row in rows],
+      [row[2 + 2 * position] for row in rows],
+    )
+    distances = (
+      side_distances
+      if distances is None
+      else [min(first, second) for first, second in zip(distances, side_distances)]
+    )
+
+  nearby = sorted(
+    (distance, row[0]) for row, distance in zip(rows, distances) if distance <= radius_km
+  )
+  return {pk: distance for distance, pk in nearby}
@@ -0,0 +1,270 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import ExtractHour
+
+from .models import CorridorRollup, Person, RideRollup
+
+# Person columns the rollups are computed from.
+STAT_FIELDS = (
+  "date",
+  "time",
+  "taking_passengers",
+  "seats_available",
+  "origination",
+  "destination_city",
+  "destination_state",
+)
+
+
+def _rollup_key(kind, date=None, city="", state=""):
+  return f"{kind}:{date.isoformat() if date else ''}:{city}|{state}"
+
+
+def _corridor_key(kind, origination, city="", state="", hour=None):
+  return f"{kind}:{'' if hour is None else hour}:{origination}|{city}|{state}"
+
+
+def _contributions(values):
+  # {key: (row fields, counts)} one ride adds to RideRollup. `values` maps
+  # STAT_FIELDS to the ride's values.
+  # Unsaved instances may still hold strings, e.g. create(date="2026-03-01").
+  date = Person._meta.get_field("date").to_python(values["date"])
+  seats = int(values["seats_available"] or 0)
+  city, state = values["destination_city"], values["destination_state"]
+  rows = {
+    _rollup_key(RideRollup.TOTAL): ({"kind": RideRollup.TOTAL}, {"rides": 1, "seats": seats}),
+    _rollup_key(RideRollup.DESTINATION, city=city, state=state): (
+      {"kind": RideRollup.DESTINATION, "destination_city": city, "destination_state": state},
+      {"rides": 1},
+    ),
+  }
+  if values["taking_passengers"]:
+    rows[_rollup_key(RideRollup.OPEN_DAY, date)] = (
+      {"kind": RideRollup.OPEN_DAY, "date": date},
+      {"rides": 1, "seats": seats},
+    )
+  return rows
+
+
+def _corridor_counts(seats):
+  # A ride taking passengers is a driver; it is open while it has seats.
+  return {"rides": 1, "seats": seats, "drivers": 1} if seats > 0 else {"drivers": 1}
+
+
+def _corridor_contributions(values):
+  # Same as _contributions(), for CorridorRollup.
+  if not values["taking_passengers"]:
+    return {}
+  hour = Person._meta.get_field("time").to_python(values["time"]).hour
+  counts = _corridor_counts(int(values["seats_available"] or 0))
+  origination = values["origination"]
+  city, state = values["destination_city"], values["destination_state"]
+  corridor = {"origination": origination, "destination_city": city, "destination_state": state}
+  return {
+    _corridor_key(CorridorRollup.CORRIDOR, origination, city, state): (
+      {"kind": CorridorRollup.CORRIDOR, **corridor},
+      counts,
+    ),
+    _corridor_key(CorridorRollup.CORRIDOR_HOUR, origination, city, state, hour): (
+      {"kind": CorridorRollup.CORRIDOR_HOUR, "hour": hour, **corridor},
+      counts,
+    ),
+    _corridor_key(CorridorRollup.PICKUP, origination): (
+      {"kind": CorridorRollup.PICKUP, "origination": origination},
+      counts,
+    ),
+  }
+
+
+ROLLUPS = ((RideRollup, _contributions), (CorridorRollup, _corridor_contributions))
+
+
+def _apply_deltas(model, deltas):
+  for key, (fields, counts) in deltas.items():
+    counts = {column: amount for column, amount in counts.items() if amount}
+    if not counts:
+      continue
+    changes = {column: F(column) + amount for column, amount in counts.items()}
+    if model.objects.filter(key=key).update(**changes):
+      continue
+    try:
+      with transaction.atomic():
+        model.objects.create(key=key, **fields, **counts)
+    except IntegrityError:
+      # Another writer created the row first.
+      model.objects.filter(key=key).update(**changes)
+
+
+def apply_ride_change(previous, current):
+  # Move one ride's contribution from `previous` to `current` (dicts of
+  # STAT_FIELDS; None for a created or deleted ride) in every rollup. Rows
+  # whose counts do not change are not written.
+  for model, contributions in ROLLUPS:
+    deltas = {}
+    for values, sign in ((previous, -1), (current, 1)):
+      if values is None:
+        continue
+      for key, (fields, counts) in contributions(values).items():
+        totals = deltas.setdefault(key, (fields, Counter()))[1]
+        for column, amount in counts.items():
+          totals[column] += sign * amount
+    _apply_deltas(model, deltas)
+
+
+def rebuild_ride_rollup(person_model=Person, rollup_model=RideRollup):
+  # Recompute every rollup row from the rides table. The models are
+  # parameters so migrations can pass their historical versions.
+  rides = person_model.objects.order_by()
+  totals = rides.aggregate(rides=Count("id"), seats=Sum("seats_available"))
+  rows = [
+    rollup_model(
+      key=_rollup_key(RideRollup.TOTAL),
+      kind=RideRollup.TOTAL,
+      rides=totals["rides"],
+      seats=totals["seats"] or 0,
+    )
+  ]
+  for day in rides.filter(taking_passengers=True).values("date").annotate(
+    total=Count("id"), seats=Sum("seats_available")
+  ):
+    rows.append(
+      rollup_model(
+        key=_rollup_key(RideRollup.OPEN_DAY, day["date"]),
+        kind=RideRollup.OPEN_DAY,
+        date=day["date"],
+        rides=day["total"],
+        seats=day["seats"] or 0,
+      )
+    )
+  destinations = rides.values("destination_city", "destination_state").annotate(total=Count("id"))
+  for destination in destinations:
+    city, state = destination["destination_city"], destination["destination_state"]
+    rows.append(
+      rollup_model(
+        key=_rollup_key(RideRollup.DESTINATION, city=city, state=state),
+        kind=RideRollup.DESTINATION,
+        destination_city=city,
+        destination_state=state,
+        rides=destination["total"],
+      )
+    )
+
+  with transaction.atomic():
+    rollup_model.objects.all().delete()
+    rollup_model.objects.bulk_create(rows, batch_size=500)
+  return len(rows)
+
+
+def rebuild_corridor_rollup(person_model=Person, rollup_model=CorridorRollup):
+  # Recompute every corridor row from one GROUP BY over the rides taking
+  # passengers; corridor and pickup totals are summed from the hour rows.
+  groups = (
+    person_model.objects.order_by()
+    .filter(taking_passengers=True)
+    .values("origination", "destination_city", "destination_state", hour=ExtractHour("time"))
+    .annotate(
+      rides=Count("id", filter=Q(seats_available__gt=0)),
+      seats=Sum("seats_available", filter=Q(seats_available__gt=0)),
+      drivers=Count("id"),
+    )
+  )
+  rows = {}
+  for group in groups:
+    origination = group["origination"]
+    city, state = group["destination_city"], group["destination_state"]
+    corridor = {"origination": origination, "destination_city": city, "destination_state": state}
+    for key, fields in (
+      (
+        _corridor_key(CorridorRollup.CORRIDOR, origination, city, state),
+        {"kind": CorridorRollup.CORRIDOR, **corridor},
+      ),
+      (
+        _corridor_key(CorridorRollup.CORRIDOR_HOUR, origination, city, state, group["hour"]),
+        {"kind": CorridorRollup.CORRIDOR_HOUR, "hour": group["hour"], **corridor},
+      ),
+      (
+        _corridor_key(CorridorRollup.PICKUP, origination),
+        {"kind": CorridorRollup.PICKUP, "origination": origination},
+      ),
+    ):
+      row = rows.setdefault(key, rollup_model(key=key, **fields))
+      row.rides += group["rides"]
+      row.seats += group["seats"] or 0
+      row.drivers += group["drivers"]
+
+  with transaction.atomic():
+    rollup_model.objects.all().delete()
+    rollup_model.objects.bulk_create(rows.values(), batch_size=500)
+  return len(rows)
+
+
+def map_sidebar(corridors=8, hotspots=6):
+  # The busiest open corridors, each with its rides per departure hour, and
+  # the busiest pickup cities: three indexed reads of pre-sorted rollup rows.
+  top = list(
+    CorridorRollup.objects.filter(kind=CorridorRollup.CORRIDOR, rides__gt=0).order_by(
+      "-rides", "origination", "destination_city", "destination_state"
+    )[:corridors]
+  )
+  hours = {}
+  if top:
+    same_corridor = Q()
+    for row in top:
+      same_corridor |= Q(
+        origination=row.origination,
+        destination_city=row.destination_city,
+        destination_state=row.destination_state,
+      )
+    for row in CorridorRollup.objects.filter(
+      same_corridor, kind=CorridorRollup.CORRIDOR_HOUR, rides__gt=0
+    ):
+      corridor = (row.origination, row.destination_city, row.destination_state)
+      hours.setdefault(corridor, [0] * 24)[row.hour] = row.rides
+
+  pickups = (
+    CorridorRollup.objects.filter(kind=CorridorRollup.PICKUP, rides__gt=0)
+    .order_by("-rides", "origination")
+    .values("origination", total=F("rides"))[:hotspots]
+  )
+  return {
+    "corridors": [
+      {
+        "origination": row.origination,
+        "destination_city": row.destination_city,
+        "destination_state": row.destination_state,
+        "rides": row.rides,
+        "open_seats": row.seats,
+        "active_drivers": row.drivers,
+        "hours": hours.get(
+          (row.origination, row.destination_city, row.destination_state), [0] * 24
+        ),
+      }
+      for row in top
+    ],
+    "pickup_hotspots": list(pickups),
+  }
+
+
+def dashboard_stats(today, destinations=4):
+  # Home page numbers from two indexed reads of the rollup: total rides, open
+  # upcoming rides, seats across all rides and the busiest destinations.
+  totals = RideRollup.objects.filter(
+    Q(kind=RideRollup.TOTAL) | Q(kind=RideRollup.OPEN_DAY, date__gte=today)
+  ).aggregate(
+    total_rides=Sum("rides", filter=Q(kind=RideRollup.TOTAL)),
+    open_seats=Sum("seats", filter=Q(kind=RideRollup.TOTAL)),
+    open_rides=Sum("rides", filter=Q(kind=RideRollup.OPEN_DAY)),
+  )
+  popular = (
+    RideRollup.objects.filter(kind=RideRollup.DESTINATION, rides__gt=0)
+    .order_by("-rides", "destination_city")
+    .values("destination_city", "destination_state", total=F("rides"))[:destinations]
+  )
+  return {
+    "total_rides": totals["total_rides"] or 0,
+    "open_rides": totals["open_rides"] or 0,
+    "open_seats": totals["open_seats"] or 0,
+    "popular_destinations": list(popular),
+  }
@@ -0,0 +1,138 @@
+import bisect
+import heapq
+import re
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Person
+
+SUGGESTION_KINDS = ("city", "state", "interest")
+
+# Person columns suggestions are drawn from.
+SUGGEST_FIELDS = ("origination", "destination_city", "destination_state", "interests")
+
+# Most suggestions one lookup returns.
+SUGGEST_MAX_RESULTS = 20
+
+
+def _normalize(text):
+  return " ".join(re.findall(r"[a-z0-9]+", (text or "").lower()))
+
+
+def ride_suggestions(origination, destination_city, destination_state, interests):
+  # (kind, text) pairs a ride contributes to the index.
+  values = [("city", origination), ("city", destination_city), ("state", destination_state)]
+  values.extend(("interest", interest) for interest in (interests or "").split(","))
+  return [(kind, text.strip()) for kind, text in values if _normalize(text)]
+
+
+# Sorted in-memory prefix index over the distinct cities, states and interests
+# of all rides, with how many rides use each. Every word of a value is a key,
+# so "jo" finds "San Jose". A lookup is a binary search plus a walk over the
+# matching keys; writes adjust counts in place.
+class PrefixIndex:
+  def __init__(self, values=()):
+    self._lock = threading.Lock()
+    self._counts = {}
+    for entry in values:
+      self._counts[entry] = self._counts.get(entry, 0) + 1
+    self._keys = sorted(
+      key for kind, text in self._counts for key in self._entry_keys(kind, text)
+    )
+
+  def __len__(self):
+    return len(self._counts)
+
+  @staticmethod
+  def _entry_keys(kind, text):
+    words = _normalize(text).split()
+    return [(" ".join(words[start:]), kind, text) for start in range(len(words))]
+
+  def add(self, values):
+    with self._lock:
+      for kind, text in values:
+        entry = (kind, text)
+        if entry not in self._counts:
+          self._counts[entry] = 0
+          for key in self._entry_keys(kind, text):
+            bisect.insort(self._keys, key)
+        self._counts[entry] += 1
+
+  def remove(self, values):
+    with self._lock:
+      for kind, text in values:
+        entry = (kind, text)
+        if entry not in self._counts:
+          continue
+        self._counts[entry] -= 1
+        if self._counts[entry] <= 0:
+          del self._counts[entry]
+          for key in self._entry_keys(kind, text):
+            position = bisect.bisect_left(self._keys, key)
+            if position < len(self._keys) and self._keys[position] == key:
+              del self._keys[position]
+
+  def suggest(self, prefix, limit=8, kinds=SUGGESTION_KINDS):
+    # Up to `limit` {"text", "kind", "count"} dicts whose words start with
+    # `prefix`, most used first.
+    prefix = _normalize(prefix)
+    if not prefix or limit <= 0:
+      return []
+
+    with self._lock:
+      position = bisect.bisect_left(self._keys, (prefix,))
+      found = {}
+      while position < len(self._keys) and self._keys[position][0].startswith(prefix):
+        _, kind, text = self._keys[position]
+        if kind in kinds:
+          found[(kind, text)] = self._counts[(kind, text)]
+        position += 1
+
+    # Most used first, then shortest, then alphabetical.
+    best = heapq.nsmallest(
+      limit,
+      found.items(),
+      key=lambda item: (-item[1], len(item[0][1]), item[0][1], item[0][0]),
+    )
+    return [{"text": text, "kind": kind, "count": count} for (kind, text), count in best]
+
+
+_INDEX = None
+_INDEX_BUILT_AT = 0.0
+_INDEX_LOCK = threading.Lock()
+
+
+def get_suggest_index():
+  # Built from one pass over the rides on first use and every
+  # SUGGEST_INDEX_TTL seconds after, so other workers' writes show up; this
+  # worker's writes are applied straight away (see signals.py).
+  global _INDEX, _INDEX_BUILT_AT
+  with _INDEX_LOCK:
+    if _INDEX is None or time.monotonic() - _INDEX_BUILT_AT > settings.SUGGEST_INDEX_TTL:
+      rows = Person.objects.values_list(*SUGGEST_FIELDS)
+      _INDEX = PrefixIndex(
+        value for row in rows.iterator(chunk_size=2000) for value in ride_suggestions(*row)
+      )
+      _INDEX_BUILT_AT = time.monotonic()
+    return _INDEX
+
+
+def reset_suggest_index():
+  global _INDEX
+  with _INDEX_LOCK:
+    _INDEX = None
+
+
+def update_ride_suggestions(previous, current):
+  # Move one ride's values from `previous` to `current` (dicts with the
+  # ride_suggestions() fields; None for a created or deleted ride) in this
+  # worker's index, if it has been built.
+  with _INDEX_LOCK:
+    index = _INDEX
+  if index is None:
+    return
+  for values, apply in ((previous, index.remove), (current, index.add)):
+    if values is not None:
+      apply(ride_suggestions(**{field: values[field] for field in SUGGEST_FIELDS}))
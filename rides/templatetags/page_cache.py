@@ -0,0 +1,33 @@
+from django import template
+
+from rides.page_cache import cached_fragment
+
+register = template.Library()
+
+
+class CachedFragmentNode(template.Node):
+  def __init__(self, nodelist, name, variants):
+    self.nodelist = nodelist
+    self.name = name
+    self.variants = variants
+
+  def render(self, context):
+    variants = [variant.resolve(context) for variant in self.variants]
+    text, _ = cached_fragment(self.name, variants, lambda: self.nodelist.render(context))
+    return text
+
+
+@register.tag
+def cachedfragment(parser, token):
+  # {% cachedfragment "name" [variant ...] %}...{% endcachedfragment %}
+  # Renders the block once per ride data generation and set of variant values
+  # (see rides/page_cache.py); ride querysets inside it are only evaluated on
+  # a miss.
+  bits = token.split_contents()
+  if len(bits) < 2 or bits[1][0] not in "\"'" or bits[1][0] != bits[1][-1]:
+    raise template.TemplateSyntaxError(f"{bits[0]} needs a quoted fragment name.")
+  nodelist = parser.parse(("endcachedfragment",))
+  parser.delete_first_token()
+  return CachedFragmentNode(
+    nodelist, bits[1][1:-1], [parser.compile_filter(bit) for bit in bits[2:]]
+  )
@@ -1,14 +1,95 @@
+import asyncio
+import csv
+import datetime
+import io
 import json
-from unittest.mock import patch
+import os
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import skipUnless
+from unittest.mock import AsyncMock, patch
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from .models import Person
-from .views import ROUTE_COORDINATE_CACHE
+from .geometry import (
+  decode_polyline,
+  decode_polylines,
+  encode_polyline,
+  geohash_cover,
+  geohash_encode,
+  grid_clusters,
+  tile_range,
+  haversine_km,
+  pixel_tolerance,
+  simplify_path,
+)
+from .fuzzy import (
+  TrigramIndex,
+  fuzzy_search_rides,
+  get_fuzzy_index,
+  reset_fuzzy_index,
+  similarity,
+  trigrams,
+)
+from .gazetteer import Gazetteer, normalize_place_name, write_gazetteer
+from .geocoding import resolve_coordinates, set_ride_coordinates
+from .models import CorridorRollup, Person, RideRollup, RoadRoute, RouteJob
+from .page_cache import page_cache_stats, reset_page_cache
+from .pagination import encode_cursor
+from .osrm import AsyncOsrmClient, CircuitBreaker, CircuitOpen, OsrmClient, RouteUnavailable
+from .road_graph import OfflineRouter, RoadGraph, write_road_graph
+from .route_cache import MISSING, RouteCache, SingleFlight
+from .route_jobs import enqueue_route_jobs, process_route_jobs
+from .routing import (
+  OSRM_CLIENT,
+  ROUTE_COORDINATE_CACHE,
+  async_fetch_road_route,
+  async_fetch_road_routes,
+  build_route_key,
+)
+from .search import search_rides, search_terms, term_filter
+from .search_cache import (
+  SEARCH_RESULT_CACHE,
+  bump_generation,
+  current_generation,
+  search_cache_key,
+)
+from .spatial import rides_in_box, rides_near
+from .stats import dashboard_stats, map_sidebar, rebuild_corridor_rollup, rebuild_ride_rollup
+from .suggest import PrefixIndex, get_suggest_index, reset_suggest_index
+from .tiles import TILE_GENERATION, cached_tile, clear_tile_cache, render_tile
+
+
+def _ride(**overrides):
+  # Unsaved Person for an Austin to Dallas ride; keyword arguments override
+  # any field.
+  fields = {
+    "first_name": "Riley",
+    "origination": "Austin",
+    "destination_city": "Dallas",
+    "destination_state": "TX",
+    "date": "2026-03-03",
+    "time": "08:45",
+    "taking_passengers": True,
+    "seats_available": 3,
+  }
+  fields.update(overrides)
+  return Person(**fields)
 
 
 class PageRenderTests(TestCase):
+  def setUp(self):
+    reset_page_cache()
+
   def test_public_pages_render(self):
     pages = [
       reverse("rides:home"),
@@ -52,6 +133,7 @@ class PageRenderTests(TestCase):
 
 class RideSearchTests(TestCase):
   def setUp(self):
+    SEARCH_RESULT_CACHE.clear()
     Person.objects.create(
       first_name="Alex",
       origination="Austin",
@@ -100,18 +182,18 @@ class RideSearchTests(TestCase):
 
   def test_search_matches_state_abbreviation(self):
     response = self.client.get(reverse("rides:index"), {"search": "tx"})
-    people = response.context["people"]
-    self.assertEqual(people.count(), 2)
+    rides = list(response.context["page"])
+    self.assertEqual(len(rides), 2)
 
   def test_search_matches_destination_city(self):
     response = self.client.get(reverse("rides:index"), {"search": "dallas"})
-    people = response.context["people"]
-    self.assertEqual(people.count(), 2)
+    rides = list(response.context["page"])
+    self.assertEqual(len(rides), 2)
 
   def test_search_matches_origin_and_destination_terms(self):
     response = self.client.get(reverse("rides:index"), {"search": "austin dallas"})
-    people = response.context["people"]
-    self.assertEqual(people.count(), 2)
+    rides = list(response.context["page"])
+    self.assertEqual(len(rides), 2)
 
   def test_filter_passengers_only(self):
     response = self.client.get(
@@ -121,9 +203,9 @@ class RideSearchTests(TestCase):
         "passengers_only": "on",
       },
     )
-    people = response.context["people"]
-    self.assertEqual(people.count(), 1)
-    self.assertTrue(people.first().taking_passengers)
+    rides = list(response.context["page"])
+    self.assertEqual(len(rides), 1)
+    self.assertTrue(rides[0].taking_passengers)
 
   def test_filter_minimum_seats(self):
     response = self.client.get(
@@ -133,15 +215,853 @@ class RideSearchTests(TestCase):
         "minimum_seats": 2,
       },
     )
-    people = response.context["people"]
-    self.assertEqual(people.count(), 1)
-    self.assertEqual(people.first().first_name, "Alex")
+    rides = list(response.context["page"])
+    self.assertEqual(len(rides), 1)
+    self.assertEqual(rides[0].first_name, "Alex")
 
   def test_search_matches_interest_term(self):
     response = self.client.get(reverse("rides:index"), {"search": "running"})
-    people = response.context["people"]
-    self.assertEqual(people.count(), 1)
-    self.assertEqual(people.first().first_name, "Alex")
+    rides = list(response.context["page"])
+    self.assertEqual(len(rides), 1)
+    self.assertEqual(rides[0].first_name, "Alex")
+
+  def test_full_text_search_matches_substring_scan(self):
+    queries = (
+      "tx", "austin dallas", "single", "ing", "NETWORK", "art", "fl design", "o", "zzz", 'a"b'
+    )
+    for text in queries:
+      expected = Person.objects.all()
+      for term in search_terms(text):
+        expected = expected.filter(term_filter(term))
+      found = search_rides(Person.objects.all(), text)
+      self.assertEqual(
+        set(found.values_list("pk", flat=True)), set(expected.values_list("pk", flat=True)), text
+      )
+
+  def test_search_index_follows_writes(self):
+    alex = Person.objects.get(first_name="Alex")
+    alex.interests = "Hiking"
+    alex.save()
+    self.assertFalse(search_rides(Person.objects.all(), "running").exists())
+    self.assertEqual(search_rides(Person.objects.all(), "hiking").get(), alex)
+
+    Person.objects.filter(first_name="Jamie").update(occupation="Pilot")
+    self.assertEqual(search_rides(Person.objects.all(), "pilot").count(), 1)
+
+    alex.delete()
+    self.assertFalse(search_rides(Person.objects.all(), "hiking").exists())
+
+  def test_search_orders_by_relevance(self):
+    Person.objects.create(
+      first_name="Networking Nora",
+      origination="Houston",
+      destination_city="Dallas",
+      destination_state="TX",
+      date="2026-02-20",
+      time="07:00",
+      seats_available=1,
+      occupation="Networking engineer",
+      looking_for="Networking",
+    )
+    response = self.client.get(reverse("rides:index"), {"search": "networking"})
+    self.assertEqual(list(response.context["page"])[0].first_name, "Networking Nora")
+
+
+class FuzzySearchTests(TestCase):
+  def setUp(self):
+    SEARCH_RESULT_CACHE.clear()
+    reset_fuzzy_index()
+    for name, origin, destination in (
+      ("Avery", "San Jose", "Mountain View"),
+      ("Blake", "Santa Cruz", "San Francisco"),
+      ("Casey", "Sacramento", "Mountain View"),
+    ):
+      Person.objects.create(
+        first_name=name,
+        origination=origin,
+        destination_city=destination,
+        destination_state="CA",
+        date="2026-03-03",
+        time="08:45",
+        seats_available=2,
+      )
+
+  def test_similarity_matches_pg_trgm(self):
+    self.assertEqual(trigrams("Cat"), {"  c", " ca", "cat", "at "})
+    self.assertAlmostEqual(similarity("sna jose", "San Jose"), 0.5)
+    self.assertEqual(similarity("", "San Jose"), 0.0)
+
+  def test_index_ranks_close_spellings(self):
+    index = TrigramIndex(["San Jose", "san jose", "Santa Cruz", "Sacramento"])
+    self.assertEqual(len(index), 3)
+    matches = index.search("Sna Jose")
+    self.assertEqual([value for value, _ in matches], ["San Jose", "san jose"])
+    self.assertEqual(index.search("zzz"), [])
+
+  def test_search_falls_back_to_fuzzy_matches(self):
+    response = self.client.get(reverse("rides:index"), {"search": "Mountian View"})
+    self.assertTrue(response.context["fuzzy_search"])
+    self.assertEqual({ride.first_name for ride in response.context["page"]}, {"Avery", "Casey"})
+    self.assertContains(response, "closest spellings")
+
+    response = self.client.get(reverse("rides:index"), {"search": "Sna Jose"})
+    self.assertEqual([ride.first_name for ride in response.context["page"]], ["Avery"])
+
+  def test_exact_matches_skip_fuzzy_search(self):
+    response = self.client.get(reverse("rides:index"), {"search": "Sacramento"})
+    self.assertFalse(response.context["fuzzy_search"])
+
+  def test_new_rides_are_indexed_on_save(self):
+    fuzzy_search_rides(Person.objects.all(), "warmup")
+    Person.objects.create(
+      first_name="Drew",
+      origination="Monterey",
+      destination_city="Carmel",
+      destination_state="CA",
+      date="2026-03-04",
+      time="09:00",
+    )
+    found = fuzzy_search_rides(Person.objects.all(), "Montery")
+    self.assertEqual([ride.first_name for ride in found], ["Drew"])
+
+
+class SearchCacheTests(TestCase):
+  def setUp(self):
+    SEARCH_RESULT_CACHE.clear()
+    self.ride = Person.objects.create(
+      first_name="Alex",
+      origination="Austin",
+      destination_city="Dallas",
+      destination_state="TX",
+      date="2026-02-23",
+      time="09:00",
+      taking_passengers=True,
+      seats_available=2,
+    )
+
+  def _search(self, text):
+    return self.client.get(reverse("rides:index"), {"search": text})
+
+  def test_repeated_searches_are_served_from_cache(self):
+    self.assertEqual(self._search("Austin")["X-Search-Cache"], "miss")
+    # Generation lookup and the page's rides by id.
+    with self.assertNumQueries(2):
+      response = self._search("  austin, ")
+    self.assertEqual(response["X-Search-Cache"], "hit")
+    self.assertEqual([ride.first_name for ride in response.context["page"]], ["Alex"])
+    self.assertEqual(response.context["match_count"], 1)
+    self.assertEqual(SEARCH_RESULT_CACHE.stats()["hit_rate"], 0.5)
+
+  def test_ride_writes_invalidate_cached_searches(self):
+    self._search("Austin")
+    generation = current_generation()
+
+    Person.objects.create(
+      first_name="Blair",
+      origination="Austin",
+      destination_city="Houston",
+      destination_state="TX",
+      date="2026-02-24",
+      time="10:00",
+    )
+    self.assertEqual(current_generation(), generation + 1)
+    response = self._search("Austin")
+    self.assertEqual(response["X-Search-Cache"], "miss")
+    self.assertEqual(response.context["match_count"], 2)
+
+    self.ride.origination = "Waco"
+    self.ride.save()
+    self.assertEqual(self._search("Austin").context["match_count"], 1)
+
+    Person.objects.filter(first_name="Blair").delete()
+    self.assertEqual(self._search("Austin").context["match_count"], 0)
+
+  def test_cache_key_normalizes_filters(self):
+    first = search_cache_key(3, {"search": "Austin,  TX", "passengers_only": False}, None, 24)
+    second = search_cache_key(3, {"search": "austin tx", "passengers_only": None}, "", 24)
+    self.assertEqual(first, second)
+    self.assertNotEqual(first, search_cache_key(4, {"search": "austin tx"}, None, 24))
+
+  def test_stats_require_staff(self):
+    self._search("Austin")
+    response = self.client.get(reverse("rides:cache_stats"))
+    self.assertEqual(response.status_code, 302)
+
+    staff = User.objects.create_user("ops", password="pass", is_staff=True)
+    self.client.force_login(staff)
+    stats = self.client.get(reverse("rides:cache_stats")).json()
+    self.assertEqual(stats["search"]["misses"], 1)
+    self.assertEqual(stats["ride_generation"], current_generation())
+
+
+class SuggestTests(TestCase):
+  def setUp(self):
+    reset_suggest_index()
+    for name, origin, destination, state, interests in (
+      ("Avery", "San Jose", "Sacramento", "CA", "Tech, Running"),
+      ("Blake", "San Jose", "Santa Cruz", "CA", "Surfing, Tech"),
+      ("Casey", "Austin", "San Antonio", "TX", "Salsa"),
+    ):
+      Person.objects.create(
+        first_name=name,
+        origination=origin,
+        destination_city=destination,
+        destination_state=state,
+        date="2026-03-03",
+        time="08:45",
+        interests=interests,
+      )
+
+  def _suggest(self, **params):
+    return self.client.get(reverse("rides:suggest"), params)
+
+  def test_prefix_index_matches_word_starts_by_popularity(self):
+    index = PrefixIndex([("city", "San Jose"), ("city", "San Jose"), ("city", "Santa Cruz")])
+    self.assertEqual([item["text"] for item in index.suggest("san")], ["San Jose", "Santa Cruz"])
+    self.assertEqual(index.suggest("jo"), [{"text": "San Jose", "kind": "city", "count": 2}])
+
+    index.remove([("city", "Santa Cruz")])
+    index.add([("city", "Sausalito")])
+    self.assertEqual([item["text"] for item in index.suggest("sa")], ["San Jose", "Sausalito"])
+    self.assertEqual(index.suggest(""), [])
+
+  def test_suggest_api(self):
+    response = self._suggest(q="sa", limit=3)
+    self.assertEqual(response["Cache-Control"], "public, max-age=60")
+    suggestions = response.json()["suggestions"]
+    self.assertEqual(suggestions[0], {"text": "San Jose", "kind": "city", "count": 2})
+    self.assertEqual(len(suggestions), 3)
+
+    interests = self._suggest(q="s", kind="interest").json()["suggestions"]
+    self.assertEqual([item["text"] for item in interests], ["Salsa", "Surfing"])
+    self.assertEqual(self._suggest(q="t", kind="state").json()["suggestions"][0]["text"], "TX")
+    self.assertEqual(self._suggest(q="sa", limit="x").status_code, 400)
+
+  def test_writes_update_the_index_without_a_rebuild(self):
+    self._suggest(q="sa")
+    ride = Person.objects.get(first_name="Casey")
+    ride.destination_city = "Dallas"
+    ride.save()
+    Person.objects.get(first_name="Blake").delete()
+
+    with self.assertNumQueries(0):
+      cities = get_suggest_index().suggest("sa", kinds=("city",))
+      dallas = get_suggest_index().suggest("dal")
+    self.assertEqual([item["text"] for item in cities], ["San Jose", "Sacramento"])
+    self.assertEqual(cities[0]["count"], 1)
+    self.assertEqual(dallas[0]["text"], "Dallas")
+
+
+class RidePaginationTests(TestCase):
+  def setUp(self):
+    SEARCH_RESULT_CACHE.clear()
+    for index in range(7):
+      Person.objects.create(
+        first_name="Sam" if index < 4 else f"Rider {index}",
+        origination="Austin",
+        destination_city="Dallas",
+        destination_state="TX",
+        date="2026-03-03" if index % 2 else "2026-03-02",
+        time="08:45",
+        taking_passengers=True,
+        seats_available=2,
+        interests="Running" if index in (2, 5) else "Chess",
+      )
+    self.expected = list(
+      Person.objects.order_by("date", "time", "first_name", "id").values_list("pk", flat=True)
+    )
+
+  def _walk(self, params, link="next_cursor"):
+    seen = []
+    cursor = None
+    while True:
+      response = self.client.get(reverse("rides:index"), {**params, "cursor": cursor or ""})
+      page = response.context["page"]
+      seen.append([ride.pk for ride in page])
+      cursor = getattr(page, link)
+      if not cursor:
+        return seen, response
+
+  def test_pages_cover_every_ride_once_in_order(self):
+    pages, last = self._walk({"page_size": 3})
+    self.assertEqual([len(page) for page in pages], [3, 3, 1])
+    self.assertEqual(sum(pages, []), self.expected)
+    self.assertFalse(last.context["search_executed"])
+
+    # Walking back from the last page retraces the same pages.
+    cursor = last.context["page"].previous_cursor
+    response = self.client.get(reverse("rides:index"), {"page_size": 3, "cursor": cursor})
+    self.assertEqual([ride.pk for ride in response.context["page"]], pages[1])
+    self.assertIsNotNone(response.context["page"].previous_cursor)
+    self.assertContains(response, 'rel="next"')
+
+  def test_page_size_is_capped_and_bad_cursors_restart(self):
+    with self.settings(RIDES_MAX_PAGE_SIZE=2):
+      response = self.client.get(reverse("rides:index"), {"page_size": 50, "cursor": "garbage"})
+    self.assertEqual([ride.pk for ride in response.context["page"]], self.expected[:2])
+    self.assertIsNone(response.context["page"].previous_cursor)
+
+  def test_tampered_cursors_restart(self):
+    # Right shape, wrong types: ["after", ["x", "y", "z", "w"]] for the plain
+    # list and ["after", [1, 2, 3, 4, 5]] for a ranked search.
+    for params, expected in (
+      ({"cursor": "WyJhZnRlciIsWyJ4IiwieSIsInoiLCJ3Il1d"}, self.expected[:3]),
+      ({"search": "x", "cursor": "WyJhZnRlciIsWzEsMiwzLDQsNV1d"}, None),
+      ({"near": "Austin, TX", "cursor": encode_cursor("after", ["near", "x"])}, None),
+    ):
+      with self.subTest(params=params):
+        response = self.client.get(reverse("rides:index"), {"page_size": 3, **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context["page"].previous_cursor)
+        if expected is not None:
+          self.assertEqual([ride.pk for ride in response.context["page"]], expected)
+
+  def test_match_count_stops_at_limit(self):
+    with self.settings(RIDES_COUNT_LIMIT=5):
+      response = self.client.get(reverse("rides:index"))
+    self.assertEqual(response.context["match_count"], 5)
+    self.assertEqual(response.context["match_qualifier"], "over")
+    self.assertContains(response, "Over 5 public rides listed")
+
+  def test_ranked_search_pages(self):
+    pages, _ = self._walk({"search": "running", "page_size": 1})
+    runners = Person.objects.filter(interests="Running").values_list("pk", flat=True)
+    self.assertEqual([len(page) for page in pages], [1, 1])
+    self.assertEqual(sorted(sum(pages, [])), sorted(runners))
+
+
+@skipUnless(connection.vendor == "sqlite", "plans are read from SQLite's EXPLAIN QUERY PLAN")
+class PersonQueryPlanTests(TestCase):
+  # Runs each view against a seeded table and EXPLAINs every query it makes
+  # on rides_person; a plain "SCAN rides_person" (no index) is a regression.
+  @classmethod
+  def setUpTestData(cls):
+    routes = (
+      ("Austin", "Dallas", "TX"),
+      ("Miami", "Orlando", "FL"),
+      ("San Jose", "Palo Alto", "CA"),
+      ("Seattle", "Tacoma", "WA"),
+      ("Houston", "Austin", "TX"),
+    )
+    rides = []
+    for index in range(600):
+      origin, destination, state = routes[index % len(routes)]
+      ride = Person(
+        first_name=f"Rider {index:03d}",
+        origination=origin,
+        destination_city=destination,
+        destination_state=state,
+        date=datetime.date(2026, 3, 1) + datetime.timedelta(days=index % 60),
+        time=datetime.time(6 + index % 12, 15),
+        taking_passengers=index % 3 != 0,
+        seats_available=index % 4,
+        interests="Running, Coffee" if index % 2 else "Chess",
+      )
+      set_ride_coordinates(ride)
+      rides.append(ride)
+    Person.objects.bulk_create(rides)
+    with connection.cursor() as cursor:
+      cursor.execute("ANALYZE")
+    cls.rider = Person.objects.order_by("pk")[7]
+
+  def setUp(self):
+    SEARCH_RESULT_CACHE.clear()
+    reset_page_cache()
+    # The in-process indexes are built from deliberate full passes; build them
+    # before measuring so only the request path is checked.
+    reset_fuzzy_index()
+    get_fuzzy_index()
+    reset_suggest_index()
+    get_suggest_index()
+
+  def assertNoTableScans(self, url, params=None):
+    with CaptureQueriesContext(connection) as queries:
+      response = self.client.get(url, params or {})
+    self.assertEqual(response.status_code, 200)
+
+    checked = 0
+    scans = []
+    for query in queries:
+      sql = query["sql"]
+      if not sql.startswith("SELECT") or "rides_person" not in sql:
+        continue
+      checked += 1
+      with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        details = [row[-1] for row in cursor.fetchall()]
+      scans.extend(
+        f"{detail}\n  {sql}" for detail in details if re.fullmatch(r"SCAN rides_person", detail)
+      )
+    self.assertTrue(checked, f"{url} made no rides_person queries")
+    self.assertEqual(scans, [], f"full table scan on {url}")
+
+  def test_home(self):
+    with patch("rides.views.timezone.localdate", return_value=datetime.date(2026, 3, 20)):
+      self.assertNoTableScans(reverse("rides:home"))
+
+  def test_ride_list_pages(self):
+    first = self.client.get(reverse("rides:index"))
+    self.assertNoTableScans(reverse("rides:index"), {"cursor": first.context["page"].next_cursor})
+
+  def test_filtered_searches(self):
+    # Keyword terms under three characters ("tx") are too short for trigrams
+    # and are matched field by field, so they are not checked here.
+    for params in (
+      {"travel_date": "2026-03-05"},
+      {"minimum_seats": "3", "passengers_only": "on"},
+      {"search": "dallas"},
+      {"search": "Dalas"},
+      {"near": "Palo Alto, CA", "near_side": "destination"},
+    ):
+      with self.subTest(params=params):
+        SEARCH_RESULT_CACHE.clear()
+        self.assertNoTableScans(reverse("rides:index"), params)
+
+  def test_profiles_and_map(self):
+    self.assertNoTableScans(reverse("rides:rider_profile", args=[self.rider.pk]))
+    self.assertNoTableScans(reverse("rides:profile"))
+    self.assertNoTableScans(reverse("rides:map"))
+
+  def test_apis(self):
+    self.assertNoTableScans(
+      reverse("rides:rides_geojson"), {"bbox": "-122.3,37.2,-121.8,37.5", "zoom": "14"}
+    )
+    self.assertNoTableScans(
+      reverse("rides:nearby_rides"), {"lat": "37.44", "lng": "-122.14", "radius_km": "20"}
+    )
+    self.assertNoTableScans(reverse("rides:nearby_rides"), {"bbox": "-98,30,-97,31"})
+
+  def test_tiles(self):
+    # Not the zoom 0 tile: it is the whole map and draws every ride.
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    with override_settings(RIDE_TILE_CACHE_DIR=directory.name):
+      for zoom, x, y in ((4, 2, 6), (10, 164, 396)):
+        with self.subTest(tile=(zoom, x, y)):
+          self.assertNoTableScans(reverse("rides:ride_tile", args=[zoom, x, y]))
+
+
+class RideExportTests(TestCase):
+  def setUp(self):
+    for name, origin, destination, state, passengers in (
+      ("Alex", "Austin", "Dallas", "TX", True),
+      ("Jamie", "Miami", "Orlando", "FL", True),
+      ("Taylor", "Austin", "Dallas", "TX", False),
+    ):
+      Person.objects.create(
+        first_name=name,
+        origination=origin,
+        destination_city=destination,
+        destination_state=state,
+        date="2026-02-23",
+        time="09:00",
+        taking_passengers=passengers,
+        seats_available=2,
+        bio="Likes \"quotes\", commas\nand newlines",
+      )
+    self.staff = User.objects.create_user("organizer", password="pass", is_staff=True)
+
+  def _export(self, **params):
+    self.client.force_login(self.staff)
+    return self.client.get(reverse("rides:export_rides"), params)
+
+  def test_export_requires_staff(self):
+    response = self.client.get(reverse("rides:export_rides"))
+    self.assertEqual(response.status_code, 302)
+
+  def test_csv_export_streams_every_ride(self):
+    response = self._export()
+    self.assertTrue(response.streaming)
+    self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+    self.assertIn("attachment;", response["Content-Disposition"])
+
+    rows = list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode("utf-8"))))
+    self.assertEqual(rows[0][:3], ["id", "first_name", "origination"])
+    self.assertEqual([row[1] for row in rows[1:]], ["Alex", "Jamie", "Taylor"])
+    self.assertEqual(rows[1][15], "Likes \"quotes\", commas\nand newlines")
+
+  def test_csv_export_defuses_spreadsheet_formulas(self):
+    Person.objects.filter(first_name="Alex").update(
+      bio="=HYPERLINK(\"http://example.com\")", interests="@SUM(A1)", occupation="-2+3"
+    )
+    response = self._export()
+    rows = list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode("utf-8"))))
+    alex = dict(zip(rows[0], rows[1]))
+    self.assertEqual(alex["bio"], "'=HYPERLINK(\"http://example.com\")")
+    self.assertEqual(alex["interests"], "'@SUM(A1)")
+    self.assertEqual(alex["occupation"], "'-2+3")
+    # Numbers are written as they are.
+    self.assertEqual(float(alex["origin_lng"]), Person.objects.get(first_name="Alex").origin_lng)
+
+  def test_ndjson_export_applies_search_filters(self):
+    response = self._export(format="ndjson", search="austin dallas", passengers_only="on")
+    self.assertEqual(response["Content-Type"], "application/x-ndjson")
+    lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+    self.assertEqual(len(lines), 1)
+    ride = json.loads(lines[0])
+    self.assertEqual(
+      (ride["first_name"], ride["date"], ride["time"]), ("Alex", "2026-02-23", "09:00:00")
+    )
+
+  def test_export_rejects_bad_parameters(self):
+    self.assertEqual(self._export(format="xml").status_code, 400)
+    self.assertEqual(self._export(minimum_seats="nine").json()["error"], "invalid_filters")
+
+  def test_export_command(self):
+    output = io.StringIO()
+    call_command("export_rides", format="ndjson", search="fl", stdout=output)
+    names = [json.loads(line)["first_name"] for line in output.getvalue().splitlines()]
+    self.assertEqual(names, ["Jamie"])
+
+    handle, path = tempfile.mkstemp(suffix=".csv")
+    os.close(handle)
+    try:
+      errors = io.StringIO()
+      call_command("export_rides", output=path, stderr=errors)
+      with open(path, encoding="utf-8", newline="") as exported:
+        self.assertEqual(len(list(csv.reader(exported))), 4)
+      self.assertEqual(errors.getvalue().strip(), f"Wrote 3 rides to {path}")
+    finally:
+      os.unlink(path)
+
+    with self.assertRaises(CommandError):
+      call_command("export_rides", near="Atlantis, ZZ", stdout=io.StringIO())
+
+
+class DashboardStatsTests(TestCase):
+  def setUp(self):
+    reset_page_cache()
+    self.rides = [
+      Person.objects.create(
+        first_name=name,
+        origination="Austin",
+        destination_city=city,
+        destination_state=state,
+        date=date,
+        time="09:00",
+        taking_passengers=passengers,
+        seats_available=seats,
+      )
+      for name, city, state, date, passengers, seats in (
+        ("Alex", "Dallas", "TX", "2026-03-01", True, 2),
+        ("Jamie", "Dallas", "TX", "2026-03-05", True, 3),
+        ("Taylor", "Houston", "TX", "2026-03-05", False, 0),
+        ("Morgan", "Orlando", "FL", "2026-02-01", True, 1),
+      )
+    ]
+
+  def _rollup(self):
+    rows = {
+      row.key: (row.rides, row.seats)
+      for row in RideRollup.objects.all()
+      if row.rides or row.seats
+    }
+    rows.update(
+      (row.key, (row.rides, row.seats, row.drivers))
+      for row in CorridorRollup.objects.all()
+      if row.rides or row.seats or row.drivers
+    )
+    return rows
+
+  def test_writes_keep_the_rollup_in_step_with_a_rebuild(self):
+    alex, jamie, taylor, morgan = self.rides
+    alex.destination_city = "Houston"
+    alex.save()
+    jamie.seats_available = 1
+    jamie.save(update_fields=["seats_available"])
+    taylor.taking_passengers = True
+    taylor.seats_available = 2
+    taylor.date = "2026-03-09"
+    taylor.save()
+    taylor.time = "17:30"
+    taylor.save(update_fields=["time"])
+    morgan.seats_available = 0
+    morgan.save()
+    morgan.delete()
+    Person.objects.get(pk=alex.pk).save(update_fields=["bio"])
+
+    incremental = self._rollup()
+    rebuild_ride_rollup()
+    rebuild_corridor_rollup()
+    self.assertEqual(incremental, self._rollup())
+
+  def test_home_reads_stats_from_the_rollup(self):
+    with patch("rides.views.timezone.localdate", return_value=datetime.date(2026, 3, 2)):
+      # Ride generation, rollup totals, top destinations, featured rides and
+      # upcoming preview.
+      with self.assertNumQueries(5):
+        response = self.client.get(reverse("rides:home"))
+
+    self.assertEqual(response.context["stat_total_rides"], 4)
+    self.assertEqual(response.context["stat_open_rides"], 1)
+    self.assertEqual(response.context["stat_open_seats"], 6)
+    self.assertEqual(
+      response.context["popular_destinations"][0],
+      {"destination_city": "Dallas", "destination_state": "TX", "total": 2},
+    )
+    self.assertContains(response, "Dallas, TX")
+
+  def test_map_sidebar_reads_the_corridor_rollup(self):
+    # Full rides still count as active drivers but not as open rides.
+    Person.objects.create(
+      first_name="Riley",
+      origination="Austin",
+      destination_city="Dallas",
+      destination_state="TX",
+      date="2026-03-02",
+      time="17:15",
+      taking_passengers=True,
+      seats_available=0,
+    )
+    with self.assertNumQueries(3):
+      sidebar = map_sidebar()
+
+    dallas = sidebar["corridors"][0]
+    self.assertEqual(
+      (dallas["destination_city"], dallas["rides"], dallas["open_seats"]), ("Dallas", 2, 5)
+    )
+    self.assertEqual(dallas["active_drivers"], 3)
+    self.assertEqual(dallas["hours"][9], 2)
+    self.assertEqual(sum(dallas["hours"]), 2)
+    cities = [corridor["destination_city"] for corridor in sidebar["corridors"]]
+    self.assertEqual(cities, ["Dallas", "Orlando"])
+    self.assertEqual(sidebar["pickup_hotspots"], [{"origination": "Austin", "total": 3}])
+
+    response = self.client.get(reverse("rides:map"))
+    card = response.context["corridor_cards"][0]
+    self.assertEqual(card["route"], "Austin to Dallas, TX")
+    self.assertEqual(card["hour_levels"][9], 100)
+    self.assertContains(response, "Busiest departures around 9 AM")
+
+  def test_rebuild_command_restores_bulk_writes(self):
+    Person.objects.bulk_create(
+      [
+        Person(
+          first_name="Bulk",
+          origination="Austin",
+          destination_city="Dallas",
+          destination_state="TX",
+          date="2026-03-01",
+          time="10:00",
+          seats_available=4,
+        )
+      ]
+    )
+    output = io.StringIO()
+    call_command("rebuild_ride_stats", stdout=output)
+    self.assertEqual(dashboard_stats(datetime.date(2026, 1, 1))["total_rides"], 5)
+    self.assertIn("rollup rows", output.getvalue())
+
+
+class PageCacheTests(TestCase):
+  def setUp(self):
+    reset_page_cache()
+    self.ride = Person.objects.create(
+      first_name="Alex",
+      origination="Austin",
+      destination_city="Dallas",
+      destination_state="TX",
+      date="2026-03-01",
+      time="09:00",
+      taking_passengers=True,
+      seats_available=2,
+    )
+
+  def test_home_and_map_are_served_from_the_cache_until_a_ride_changes(self):
+    with patch("rides.views.timezone.localdate", return_value=datetime.date(2026, 2, 1)):
+      for name in ("rides:home", "rides:map"):
+        with self.subTest(page=name):
+          first = self.client.get(reverse(name))
+          self.assertEqual(first["X-Page-Cache"], "miss")
+          with self.assertNumQueries(1):
+            cached = self.client.get(reverse(name))
+          self.assertEqual(cached["X-Page-Cache"], "hit")
+          self.assertEqual(cached.content, first.content)
+
+      self.ride.destination_city = "Houston"
+      self.ride.save()
+      response = self.client.get(reverse("rides:home"))
+      self.assertEqual(response["X-Page-Cache"], "miss")
+      self.assertContains(response, "Houston, TX")
+
+    # A new day is a new page: the dashboard counts open rides from today.
+    with patch("rides.views.timezone.localdate", return_value=datetime.date(2026, 3, 2)):
+      self.assertEqual(self.client.get(reverse("rides:home"))["X-Page-Cache"], "miss")
+
+    stats = page_cache_stats()
+    self.assertEqual(stats["home"]["hits"], 1)
+    self.assertEqual(stats["home"]["misses"], 3)
+    self.assertEqual(stats["map"]["hit_rate"], 0.5)
+
+  def test_profile_caches_only_the_ride_fragment(self):
+    self.client.get(reverse("rides:profile"))
+    response = self.client.post(
+      reverse("rides:profile"),
+      {
+        "music_focus": ["indie"],
+        "conversation_style": "balanced",
+        "climate_preference": "neutral",
+      },
+    )
+    self.assertContains(response, "csrfmiddlewaretoken")
+    self.assertContains(response, "Alex")
+    self.assertEqual(page_cache_stats()["profile_upcoming_rides"]["hits"], 1)
+
+    staff = User.objects.create_user("ops", password="pass", is_staff=True)
+    self.client.force_login(staff)
+    self.client.get(reverse("rides:profile"))
+    # The fragment varies by signed-in user.
+    self.assertEqual(page_cache_stats()["profile_upcoming_rides"]["misses"], 2)
+    stats = self.client.get(reverse("rides:cache_stats")).json()
+    self.assertEqual(stats["pages"]["profile_upcoming_rides"]["hits"], 1)
+
+  def test_file_backend(self):
+    with tempfile.TemporaryDirectory() as directory:
+      pages = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": directory,
+      }
+      with override_settings(CACHES={**settings.CACHES, "pages": pages}):
+        self.client.get(reverse("rides:map"))
+        self.assertEqual(self.client.get(reverse("rides:map"))["X-Page-Cache"], "hit")
+        self.assertTrue(os.listdir(directory))
+
+
+class RideTileTests(TestCase):
+  def setUp(self):
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    tile_settings = override_settings(RIDE_TILE_CACHE_DIR=directory.name)
+    tile_settings.enable()
+    self.addCleanup(tile_settings.disable)
+
+    self.rides = [
+      Person.objects.create(
+        first_name=name,
+        origination=origin,
+        destination_city=city,
+        destination_state=state,
+        date="2026-03-03",
+        time="08:45",
+        taking_passengers=True,
+        seats_available=2,
+      )
+      for name, origin, city, state in (
+        ("Alex", "Austin", "Dallas", "TX"),
+        ("Jamie", "Austin", "Dallas", "TX"),
+        ("Avery", "Palo Alto", "San Jose", "CA"),
+      )
+    ]
+
+  def _tile(self, zoom, latitude, longitude):
+    x, _, y, _ = tile_range((latitude, longitude, latitude, longitude), zoom)
+    return self.client.get(reverse("rides:ride_tile", args=[zoom, x, y]))
+
+  def test_tile_layers(self):
+    tile = self._tile(6, 30.2672, -97.7431).json()
+    self.assertEqual(
+      [feature["properties"]["count"] for feature in tile["density"]["features"]], [2]
+    )
+    corridors = tile["corridors"]["features"]
+    self.assertEqual(
+      [(line["properties"]["route"], line["properties"]["rides"]) for line in corridors],
+      [("Austin to Dallas, TX", 2)],
+    )
+    self.assertEqual(corridors[0]["geometry"]["coordinates"][0], [-97.7431, 30.2672])
+
+    # The whole world at zoom 0 has both corridors and both origin cells.
+    world = self.client.get(reverse("rides:ride_tile", args=[0, 0, 0])).json()
+    self.assertEqual(len(world["corridors"]["features"]), 2)
+    self.assertEqual(sum(f["properties"]["count"] for f in world["density"]["features"]), 3)
+
+    for args in ([15, 0, 0], [2, 4, 0]):
+      with self.subTest(args=args):
+        self.assertEqual(self.client.get(reverse("rides:ride_tile", args=args)).status_code, 404)
+
+  def test_ride_writes_start_a_new_tile_generation(self):
+    austin, bay_area = (30.2672, -97.7431), (37.4419, -122.143)
+    for point in (austin, bay_area):
+      self.assertEqual(self._tile(8, *point)["X-Tile-Cache"], "miss")
+      self.assertEqual(self._tile(8, *point)["X-Tile-Cache"], "hit")
+
+    # Fields the tiles do not draw leave them cached.
+    alex = self.rides[0]
+    alex.bio = "Road trip playlist ready."
+    alex.save()
+    self.assertEqual(self._tile(8, *austin)["X-Tile-Cache"], "hit")
+
+    alex.seats_available = 1
+    alex.save(update_fields=["seats_available"])
+    for point in (austin, bay_area):
+      self.assertEqual(self._tile(8, *point)["X-Tile-Cache"], "miss")
+    # The first render of the new generation pruned the old one.
+    generation = current_generation(TILE_GENERATION)
+    self.assertEqual(os.listdir(settings.RIDE_TILE_CACHE_DIR), [f"g{generation}"])
+
+    alex.origination = "Palo Alto"
+    alex.destination_city = "San Jose"
+    alex.destination_state = "CA"
+    alex.save()
+    tile = self._tile(8, *bay_area)
+    self.assertEqual(tile["X-Tile-Cache"], "miss")
+    self.assertEqual(sum(f["properties"]["count"] for f in tile.json()["density"]["features"]), 2)
+
+    self.rides[2].delete()
+    self.assertEqual(self._tile(8, *bay_area)["X-Tile-Cache"], "miss")
+
+  def test_a_write_on_another_host_drops_cached_tiles(self):
+    # Another host's write only reaches this one through the database.
+    self.assertEqual(self._tile(8, 30.2672, -97.7431)["X-Tile-Cache"], "miss")
+    Person.objects.filter(pk=self.rides[0].pk).update(seats_available=0)
+    bump_generation(TILE_GENERATION)
+    tile = self._tile(8, 30.2672, -97.7431)
+    self.assertEqual(tile["X-Tile-Cache"], "miss")
+    self.assertEqual(tile.json()["corridors"]["features"][0]["properties"]["open_seats"], 2)
+
+  def test_a_write_racing_a_render_does_not_leave_a_stale_tile(self):
+    austin = (30.2672, -97.7431)
+    x, _, y, _ = tile_range((*austin, *austin), 8)
+    alex = self.rides[0]
+    store = os.replace
+
+    def write_ride(seats):
+      alex.seats_available = seats
+      alex.save()
+
+    def render_then_write(zoom, x, y):
+      tile = render_tile(zoom, x, y)
+      write_ride(0)
+      return tile
+
+    def write_then_store(source, destination):
+      write_ride(1)
+      store(source, destination)
+
+    # The ride changes once the tile has been drawn from the old row, either
+    # while the render is still running or just before the tile is stored.
+    for hook, seats, target in (
+      ("rides.tiles.render_tile", 0, render_then_write),
+      ("rides.tiles.os.replace", 1, write_then_store),
+    ):
+      with self.subTest(hook=hook):
+        clear_tile_cache()
+        with patch(hook, target):
+          _, status = cached_tile(8, x, y)
+        self.assertEqual(status, "miss")
+
+        tile = self._tile(8, *austin)
+        self.assertEqual(tile["X-Tile-Cache"], "miss")
+        corridor = tile.json()["corridors"]["features"][0]
+        self.assertEqual(corridor["properties"]["open_seats"], 2 + seats)
+
+  def test_bulk_writers_clear_the_tile_cache(self):
+    self.client.get(reverse("rides:ride_tile", args=[0, 0, 0]))
+    output = io.StringIO()
+    call_command("rebuild_ride_stats", stdout=output)
+    self.assertIn("dropped 1 cached tiles", output.getvalue())
+    self.assertEqual(
+      self.client.get(reverse("rides:ride_tile", args=[0, 0, 0]))["X-Tile-Cache"], "miss"
+    )
 
 
 class RideCreationTests(TestCase):
@@ -168,11 +1088,30 @@ class RideCreationTests(TestCase):
     self.assertEqual(ride.destination_state, "TX")
 
 
+  def test_create_ride_with_a_non_ascii_state(self):
+    response = self.client.post(
+      reverse("rides:add_ride"),
+      {
+        "first_name": "Riley",
+        "origination": "Austin",
+        "destination_city": "Dallas",
+        "destination_state": "Çx",
+        "date": "2026-03-03",
+        "time": "08:45",
+        "seats_available": "3",
+      },
+      follow=True,
+    )
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(Person.objects.get().destination_state, "ÇX")
+
+
 class _MockResponse:
   def __init__(self, payload):
     self.payload = payload
 
-  def read(self):
+  def read(self, size=-1):
     return json.dumps(self.payload).encode("utf-8")
 
   def __enter__(self):
@@ -185,8 +1124,9 @@ class _MockResponse:
 class RoadRouteApiTests(TestCase):
   def setUp(self):
     ROUTE_COORDINATE_CACHE.clear()
+    OSRM_CLIENT.breaker.reset()
 
-  @patch("rides.views.urlopen")
+  @patch("rides.osrm.urlopen")
   def test_route_api_returns_coordinates_from_geojson(self, mock_urlopen):
     mock_urlopen.return_value = _MockResponse(
       {
@@ -233,7 +1173,7 @@ class RoadRouteApiTests(TestCase):
     self.assertEqual(response.status_code, 400)
     self.assertEqual(response.json()["error"], "invalid_coordinates")
 
-  @patch("rides.views.urlopen")
+  @patch("rides.osrm.urlopen")
   def test_route_api_caches_lookup_results(self, mock_urlopen):
     mock_urlopen.return_value = _MockResponse(
       {
@@ -262,3 +1202,1094 @@ class RoadRouteApiTests(TestCase):
     self.assertEqual(first_response.status_code, 200)
     self.assertEqual(second_response.status_code, 200)
     self.assertEqual(mock_urlopen.call_count, 1)
+
+
+class RoadRouteHttpCachingTests(TestCase):
+  def setUp(self):
+    ROUTE_COORDINATE_CACHE.clear()
+    OSRM_CLIENT.breaker.reset()
+    self.query = {
+      "origin_lat": "37.4688",
+      "origin_lng": "-122.1411",
+      "destination_lat": "37.3382",
+      "destination_lng": "-121.8863",
+    }
+
+  @patch("rides.osrm.urlopen")
+  def test_route_response_is_cacheable_and_revalidates_without_a_lookup(self, mock_urlopen):
+    mock_urlopen.return_value = _MockResponse(
+      {"routes": [{"geometry": {"coordinates": [[-122.1411, 37.4688], [-121.8863, 37.3382]]}}]}
+    )
+
+    response = self.client.get(reverse("rides:road_route"), self.query)
+    etag = response["ETag"]
+
+    self.assertIn("max-age=604800", response["Cache-Control"])
+    self.assertIn("public", response["Cache-Control"])
+    self.assertEqual(self.client.get(reverse("rides:road_route"), self.query)["ETag"], etag)
+
+    ROUTE_COORDINATE_CACHE.clear()
+    with patch("rides.views.fetch_road_route") as fetch:
+      revalidated = self.client.get(
+        reverse("rides:road_route"), self.query, HTTP_IF_NONE_MATCH=etag
+      )
+    fetch.assert_not_called()
+    self.assertEqual(revalidated.status_code, 304)
+    self.assertEqual(revalidated["ETag"], etag)
+
+  def test_etag_depends_on_format_and_detail_level(self):
+    ROUTE_COORDINATE_CACHE.set(
+      build_route_key([37.4688, -122.1411], [37.3382, -121.8863]),
+      [[37.4688, -122.1411], [37.3382, -121.8863]],
+    )
+
+    etags = {
+      self.client.get(reverse("rides:road_route"), dict(self.query, **extra))["ETag"]
+      for extra in ({}, {"format": "polyline"}, {"zoom": "8"}, {"zoom": "8", "tolerance": "2"})
+    }
+
+    self.assertEqual(len(etags), 4)
+
+  @patch("rides.osrm.urlopen", side_effect=TimeoutError("slow upstream"))
+  def test_fallback_is_cached_briefly_without_an_etag(self, mock_urlopen):
+    with self.settings(ROUTE_FALLBACK_MAX_AGE=30):
+      response = self.client.get(reverse("rides:road_route"), self.query)
+
+    self.assertTrue(response.json()["fallback"])
+    self.assertIn("max-age=30", response["Cache-Control"])
+    self.assertFalse(response.has_header("ETag"))
+
+  def test_stale_etag_gets_a_full_response(self):
+    ROUTE_COORDINATE_CACHE.set(
+      build_route_key([37.4688, -122.1411], [37.3382, -121.8863]),
+      [[37.4688, -122.1411], [37.3382, -121.8863]],
+    )
+
+    response = self.client.get(
+      reverse("rides:road_route"), self.query, HTTP_IF_NONE_MATCH='"not-the-route"'
+    )
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(len(response.json()["coordinates"]), 2)
+
+
+class RouteCacheTests(TestCase):
+  def test_local_tier_evicts_least_recently_used_entry(self):
+    cache = RouteCache(max_entries=2, shared=False)
+    cache.set("a", [[1, 1], [2, 2]])
+    cache.set("b", [[3, 3], [4, 4]])
+    cache.get("a")
+    cache.set("c", [[5, 5], [6, 6]])
+
+    self.assertIs(cache.get("b"), MISSING)
+    self.assertEqual(cache.get("a"), [[1, 1], [2, 2]])
+    self.assertEqual(cache.stats()["evictions"], 1)
+
+  def test_local_tier_respects_byte_budget(self):
+    cache = RouteCache(max_bytes=40, shared=False)
+    cache.set("a", [[1.5, 1.5]] * 3)
+    cache.set("b", [[2.5, 2.5]] * 3)
+
+    self.assertEqual(len(cache), 1)
+    self.assertLessEqual(cache.stats()["bytes"], 40)
+
+  def test_expired_entries_are_misses(self):
+    cache = RouteCache(shared=False)
+    cache.set("a", None, ttl=60)
+
+    with patch("rides.route_cache.time.time", return_value=time.time() + 120):
+      self.assertIs(cache.get("a"), MISSING)
+
+    self.assertEqual(cache.stats()["expirations"], 1)
+
+  def test_shared_tier_is_visible_to_other_workers(self):
+    first_worker = RouteCache()
+    first_worker.set("a", [[1.0, 2.0], [3.0, 4.0]])
+
+    second_worker = RouteCache()
+    self.assertEqual(second_worker.get("a"), [[1.0, 2.0], [3.0, 4.0]])
+    self.assertEqual(second_worker.stats()["shared_hits"], 1)
+    self.assertEqual(RoadRoute.objects.count(), 1)
+
+  def test_shared_tier_stores_routes_as_polylines(self):
+    routes = {
+      "a": [[30.2672, -97.7431], [32.7767, -96.797]],
+      "b": [[37.4419, -122.143], [37.3382, -121.8863], [37.3, -121.9]],
+    }
+    first_worker = RouteCache()
+    for key, route in routes.items():
+      first_worker.set(key, route)
+    first_worker.set("c", None)
+    self.assertEqual(
+      RoadRoute.objects.get(key="a").coordinates, encode_polyline(routes["a"], precision=6)
+    )
+
+    # Rows written as JSON lists before still read back.
+    RoadRoute.objects.create(key="d", coordinates=[[1.5, 2.5], [3.5, 4.5]])
+    self.assertEqual(
+      RouteCache().get_many(["a", "b", "c", "d"]),
+      {**routes, "c": None, "d": [[1.5, 2.5], [3.5, 4.5]]},
+    )
+    self.assertEqual(RouteCache().get("b"), routes["b"])
+
+  def test_none_is_cached_as_a_value(self):
+    cache = RouteCache(shared=False)
+    cache.set("a", None)
+
+    self.assertIsNone(cache.get("a"))
+    self.assertEqual(cache.stats()["hits"], 1)
+
+
+class RoadRouteBatchApiTests(TestCase):
+  def setUp(self):
+    ROUTE_COORDINATE_CACHE.clear()
+    OSRM_CLIENT.breaker.reset()
+
+  def _post(self, pairs):
+    return self.client.post(
+      reverse("rides:road_route_batch"),
+      json.dumps({"pairs": pairs}),
+      content_type="application/json",
+    )
+
+  @patch("rides.routing.ASYNC_OSRM_CLIENT")
+  def test_batch_dedupes_identical_routes(self, client):
+    client.route = AsyncMock(
+      return_value={"geometry": {"coordinates": [[-97.7431, 30.2672], [-96.797, 32.7767]]}}
+    )
+
+    response = self._post(
+      [
+        [30.2672, -97.7431, 32.7767, -96.797],
+        [30.2672, -97.7431, 32.7767, -96.797],
+        [95.0, -97.7431, 32.7767, -96.797],
+      ]
+    )
+
+    self.assertEqual(response.status_code, 200)
+    payload = response.json()
+    self.assertEqual(payload["keys"][0], payload["keys"][1])
+    self.assertIsNone(payload["keys"][2])
+    self.assertEqual(
+      payload["routes"][payload["keys"][0]],
+      [[30.2672, -97.7431], [32.7767, -96.797]],
+    )
+    self.assertEqual(client.route.await_count, 1)
+
+  @patch("rides.routing.ASYNC_OSRM_CLIENT")
+  def test_batch_serves_cache_hits_without_upstream_calls(self, client):
+    client.route = AsyncMock()
+    ROUTE_COORDINATE_CACHE.set(
+      "30.26720|-97.74310|32.77670|-96.79700", [[30.2672, -97.7431], [32.7767, -96.797]]
+    )
+
+    response = self._post([[30.2672, -97.7431, 32.7767, -96.797]])
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(len(response.json()["routes"]), 1)
+    client.route.assert_not_awaited()
+
+  def test_batch_rejects_oversized_requests(self):
+    response = self._post([[30.0, -97.0, 32.0, -96.0]] * 501)
+
+    self.assertEqual(response.status_code, 400)
+    self.assertEqual(response.json()["error"], "too_many_pairs")
+
+  def test_batch_requires_post(self):
+    response = self.client.get(reverse("rides:road_route_batch"))
+    self.assertEqual(response.status_code, 405)
+
+
+class SingleFlightTests(TestCase):
+  def test_concurrent_callers_share_one_call(self):
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def slow_lookup():
+      calls.append(1)
+      release.wait(5)
+      return [[1.0, 2.0], [3.0, 4.0]]
+
+    def caller():
+      results.append(flight.do("route", slow_lookup))
+
+    threads = [threading.Thread(target=caller) for _ in range(5)]
+    for thread in threads:
+      thread.start()
+    while flight.stats()["coalesced"] < 4:
+      time.sleep(0.01)
+    release.set()
+    for thread in threads:
+      thread.join(5)
+
+    self.assertEqual(len(calls), 1)
+    self.assertEqual(sorted(leader for _, leader in results), [False] * 4 + [True])
+    self.assertEqual(flight.stats(), {"leaders": 1, "coalesced": 4, "in_flight": 0})
+
+  def test_errors_propagate_to_waiters_and_clear_the_key(self):
+    flight = SingleFlight()
+
+    def failing_lookup():
+      raise TimeoutError
+
+    with self.assertRaises(TimeoutError):
+      flight.do("route", failing_lookup)
+    self.assertEqual(flight.do("route", lambda: None), (None, True))
+
+  def test_single_and_batch_lookups_of_one_key_share_a_fetch(self):
+    origin, destination = (30.27, -97.74), (32.78, -96.8)
+    key = build_route_key(origin, destination)
+    route = [[30.27, -97.74], [31.5, -97.1], [32.78, -96.8]]
+    calls = []
+
+    async def slow_request(origin, destination):
+      calls.append((origin, destination))
+      await asyncio.sleep(0.05)
+      return route, None
+
+    async def lookups():
+      return await asyncio.gather(
+        async_fetch_road_route(origin, destination),
+        async_fetch_road_routes({key: (origin, destination)}),
+      )
+
+    with (
+      patch("rides.routing.ROUTE_COORDINATE_CACHE", RouteCache(shared=False)),
+      patch("rides.routing.async_request_road_route", slow_request),
+    ):
+      single, batch = asyncio.run(lookups())
+
+    self.assertEqual(len(calls), 1)
+    self.assertEqual((single, batch), (route, {key: route}))
+
+  def test_fetch_lease_is_exclusive_across_workers(self):
+    first_worker = RouteCache()
+    second_worker = RouteCache()
+
+    token, claimed = first_worker.claim(["a", "b"])
+    _, second_claimed = second_worker.claim(["b", "c"])
+    self.assertEqual(claimed, {"a", "b"})
+    self.assertEqual(second_claimed, {"c"})
+
+    first_worker.set("b", [[1.0, 2.0], [3.0, 4.0]])
+    first_worker.release(token)
+
+    self.assertEqual(second_worker.wait_for(["b"]), {"b": [[1.0, 2.0], [3.0, 4.0]]})
+    self.assertEqual(second_worker.stats()["remote_fills"], 1)
+
+
+class _FakeOsrmHandler(BaseHTTPRequestHandler):
+  # Each request pops the next (status, payload, delay) from the server's script
+  # and the last entry repeats once the script runs out.
+  def do_GET(self):
+    server = self.server
+    server.hits += 1
+    status, payload, delay = server.script[0] if len(server.script) == 1 else server.script.pop(0)
+    time.sleep(delay)
+    body = json.dumps(payload).encode("utf-8")
+    try:
+      self.send_response(status)
+      self.send_header("Content-Type", "application/json")
+      self.send_header("Content-Length", str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+    except (BrokenPipeError, ConnectionResetError):
+      # The client gave up on a slow response; that is what the test wanted.
+      self.close_connection = True
+
+  def log_message(self, format, *args):
+    pass
+
+
+_FAKE_ROUTE = {
+  "code": "Ok",
+  "routes": [{"geometry": {"coordinates": [[-97.7431, 30.2672], [-96.797, 32.7767]]}}],
+}
+
+
+class OsrmClientTests(TestCase):
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeOsrmHandler)
+    cls.server.daemon_threads = True
+    cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+    cls.server_thread.start()
+    cls.base_url = f"http://127.0.0.1:{cls.server.server_port}/route/v1/driving/"
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.shutdown()
+    cls.server.server_close()
+    super().tearDownClass()
+
+  def setUp(self):
+    ROUTE_COORDINATE_CACHE.clear()
+    self.server.hits = 0
+    self.server.script = [(200, _FAKE_ROUTE, 0)]
+
+  def _client(self, **kwargs):
+    kwargs.setdefault("backoff", 0.01)
+    return OsrmClient(self.base_url, **kwargs)
+
+  def test_transient_errors_are_retried(self):
+    self.server.script = [(503, {}, 0), (503, {}, 0), (200, _FAKE_ROUTE, 0)]
+
+    route = self._client().route([30.2672, -97.7431], [32.7767, -96.797])
+
+    self.assertEqual(route, _FAKE_ROUTE["routes"][0])
+    self.assertEqual(self.server.hits, 3)
+
+  def test_no_route_answer_is_not_a_failure(self):
+    self.server.script = [(400, {"code": "NoRoute"}, 0)]
+    client = self._client()
+
+    self.assertIsNone(client.route([30.2672, -97.7431], [32.7767, -96.797]))
+    self.assertEqual(self.server.hits, 1)
+    self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+  def test_slow_upstream_is_cut_off_by_the_budget(self):
+    self.server.script = [(200, _FAKE_ROUTE, 1.0)]
+    client = self._client(budget=0.3)
+
+    started = time.monotonic()
+    with self.assertRaises(RouteUnavailable):
+      client.route([30.2672, -97.7431], [32.7767, -96.797])
+    self.assertLess(time.monotonic() - started, 0.9)
+
+  def test_breaker_trips_and_recovers(self):
+    self.server.script = [(503, {}, 0)]
+    client = self._client(max_attempts=1, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.2))
+
+    for _ in range(2):
+      with self.assertRaises(RouteUnavailable):
+        client.route([30.2672, -97.7431], [32.7767, -96.797])
+    with self.assertRaises(CircuitOpen):
+      client.route([30.2672, -97.7431], [32.7767, -96.797])
+    self.assertEqual(self.server.hits, 2)
+
+    time.sleep(0.25)
+    self.server.script = [(200, _FAKE_ROUTE, 0)]
+    self.assertIsNotNone(client.route([30.2672, -97.7431], [32.7767, -96.797]))
+    self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+  def test_route_api_falls_back_to_straight_line_when_breaker_is_open(self):
+    client = self._client(breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+    client.breaker.record_failure()
+
+    with patch("rides.routing.ROUTING_BACKEND", client):
+      response = self.client.get(
+        reverse("rides:road_route"),
+        {
+          "origin_lat": "30.2672",
+          "origin_lng": "-97.7431",
+          "destination_lat": "32.7767",
+          "destination_lng": "-96.797",
+        },
+      )
+
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue(response.json()["fallback"])
+    self.assertEqual(response.json()["coordinates"], [[30.2672, -97.7431], [32.7767, -96.797]])
+    self.assertEqual(self.server.hits, 0)
+    self.assertEqual(RoadRoute.objects.count(), 0)
+
+  def test_failed_lookups_are_cached_with_the_negative_ttl(self):
+    self.server.script = [(503, {}, 0)]
+    client = self._client(max_attempts=1)
+
+    with patch("rides.routing.ROUTING_BACKEND", client), self.settings(ROUTE_NEGATIVE_CACHE_TTL=60):
+      self.client.get(
+        reverse("rides:road_route"),
+        {
+          "origin_lat": "30.2672",
+          "origin_lng": "-97.7431",
+          "destination_lat": "32.7767",
+          "destination_lng": "-96.797",
+        },
+      )
+
+    entry = RoadRoute.objects.get()
+    self.assertIsNone(entry.coordinates)
+    self.assertLess((entry.expires_at - entry.fetched_at).total_seconds(), 61)
+
+
+class _KeepAliveOsrmHandler(_FakeOsrmHandler):
+  protocol_version = "HTTP/1.1"
+
+  def do_GET(self):
+    # Paths under /moved/ redirect to the same route under /route/.
+    if self.path.startswith("/moved/"):
+      self.send_response(301)
+      self.send_header("Location", self.path.replace("/moved/", "/route/", 1))
+      self.send_header("Content-Length", "0")
+      self.end_headers()
+      return
+    super().do_GET()
+
+
+class AsyncOsrmClientTests(TestCase):
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveOsrmHandler)
+    cls.server.daemon_threads = True
+    cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+    cls.server_thread.start()
+    cls.base_url = f"http://127.0.0.1:{cls.server.server_port}/route/v1/driving/"
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.shutdown()
+    cls.server.server_close()
+    super().tearDownClass()
+
+  def setUp(self):
+    ROUTE_COORDINATE_CACHE.clear()
+    OSRM_CLIENT.breaker.reset()
+    self.server.hits = 0
+    self.server.script = [(200, _FAKE_ROUTE, 0)]
+
+  def _client(self, base_url=None, **kwargs):
+    kwargs.setdefault("backoff", 0.01)
+    return AsyncOsrmClient(base_url or self.base_url, **kwargs)
+
+  def test_requests_reuse_pooled_connections(self):
+    client = self._client(max_connections=4)
+
+    async def run():
+      try:
+        routes = await asyncio.gather(
+          *(client.route([30.0 + index / 100, -97.7431], [32.7767, -96.797]) for index in range(40))
+        )
+        return routes, client.stats()
+      finally:
+        await client.aclose()
+
+    routes, stats = asyncio.run(run())
+
+    self.assertEqual(routes, [_FAKE_ROUTE["routes"][0]] * 40)
+    self.assertEqual(self.server.hits, 40)
+    self.assertLessEqual(stats["connections_opened"], 4)
+
+  def test_transient_errors_are_retried_and_trip_the_shared_breaker(self):
+    self.server.script = [(503, {}, 0), (200, _FAKE_ROUTE, 0)]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    client = self._client(breaker=breaker)
+
+    self.assertEqual(
+      asyncio.run(client.route([30.2672, -97.7431], [32.7767, -96.797])),
+      _FAKE_ROUTE["routes"][0],
+    )
+    self.assertEqual(self.server.hits, 2)
+
+    self.server.script = [(503, {}, 0)]
+    with self.assertRaises(RouteUnavailable):
+      asyncio.run(self._client(breaker=breaker, max_attempts=1).route([1, 2], [3, 4]))
+    self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+  def test_redirects_are_followed(self):
+    client = self._client(base_url=self.base_url.replace("/route/", "/moved/"))
+
+    self.assertEqual(
+      asyncio.run(client.route([30.2672, -97.7431], [32.7767, -96.797])),
+      _FAKE_ROUTE["routes"][0],
+    )
+    self.assertEqual(self.server.hits, 1)
+
+  def test_oversized_responses_are_not_read_to_the_end(self):
+    client = self._client(max_attempts=1)
+
+    with patch("rides.osrm.OSRM_MAX_RESPONSE_BYTES", 16):
+      with self.assertRaises(RouteUnavailable) as raised:
+        asyncio.run(client.route([30.2672, -97.7431], [32.7767, -96.797]))
+    self.assertIn("response too large", str(raised.exception))
+
+  def test_async_route_api_returns_coordinates(self):
+    with patch("rides.routing.ASYNC_OSRM_CLIENT", self._client()):
+      response = self.client.get(
+        reverse("rides:road_route_async"),
+        {
+          "origin_lat": "30.2672",
+          "origin_lng": "-97.7431",
+          "destination_lat": "32.7767",
+          "destination_lng": "-96.797",
+          "format": "polyline",
+        },
+      )
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(
+      decode_polyline(response.json()["polyline"]), [[30.2672, -97.7431], [32.7767, -96.797]]
+    )
+    self.assertEqual(self.server.hits, 1)
+    self.assertIn(build_route_key([30.2672, -97.7431], [32.7767, -96.797]), ROUTE_COORDINATE_CACHE)
+
+  def test_async_route_api_falls_back_when_breaker_is_open(self):
+    for _ in range(OSRM_CLIENT.breaker.failure_threshold):
+      OSRM_CLIENT.breaker.record_failure()
+
+    with patch("rides.routing.ASYNC_OSRM_CLIENT", self._client(breaker=OSRM_CLIENT.breaker)):
+      response = self.client.get(
+        reverse("rides:road_route_async"),
+        {
+          "origin_lat": "30.2672",
+          "origin_lng": "-97.7431",
+          "destination_lat": "32.7767",
+          "destination_lng": "-96.797",
+        },
+      )
+
+    self.assertTrue(response.json()["fallback"])
+    self.assertEqual(self.server.hits, 0)
+
+  def test_async_route_api_rejects_invalid_coordinates(self):
+    response = self.client.get(reverse("rides:road_route_async"), {"origin_lat": "x"})
+
+    self.assertEqual(response.status_code, 400)
+    self.assertEqual(response.json()["error"], "invalid_coordinates")
+
+
+class RouteSimplificationTests(TestCase):
+  def setUp(self):
+    ROUTE_COORDINATE_CACHE.clear()
+    OSRM_CLIENT.breaker.reset()
+    # A dense, gently wiggling Austin -> Dallas path.
+    self.path = [
+      [30.2672 + index * 0.0025, -97.7431 + index * 0.001 + (index % 2) * 0.00001]
+      for index in range(1000)
+    ]
+
+  def test_simplify_path_keeps_endpoints_and_drops_redundant_points(self):
+    simplified = simplify_path(self.path, pixel_tolerance(6))
+
+    self.assertEqual(simplified[0], self.path[0])
+    self.assertEqual(simplified[-1], self.path[-1])
+    self.assertLess(len(simplified), len(self.path) // 10)
+
+  def test_simplify_path_keeps_real_corners(self):
+    path = [[0.0, 0.0], [0.0, 0.5], [0.0, 1.0], [1.0, 1.0]]
+    self.assertEqual(simplify_path(path, pixel_tolerance(4)), [[0.0, 0.0], [0.0, 1.0], [1.0, 1.0]])
+
+  @patch("rides.osrm.urlopen")
+  def test_route_api_returns_and_caches_simplified_geometry(self, mock_urlopen):
+    mock_urlopen.return_value = _MockResponse(
+      {"routes": [{"geometry": {"coordinates": [[lng, lat] for lat, lng in self.path]}}]}
+    )
+    params = {
+      "origin_lat": "30.2672",
+      "origin_lng": "-97.7431",
+      "destination_lat": "32.7647",
+      "destination_lng": "-96.7441",
+      "zoom": "6",
+    }
+
+    response = self.client.get(reverse("rides:road_route"), params)
+
+    self.assertEqual(response.status_code, 200)
+    self.assertLess(len(response.json()["coordinates"]), 100)
+    self.assertTrue(RoadRoute.objects.filter(key__endswith="|z6|t1").exists())
+
+    ROUTE_COORDINATE_CACHE.clear(shared=False)
+    ROUTE_COORDINATE_CACHE.delete("30.26720|-97.74310|32.76470|-96.74410")
+    cached_response = self.client.get(reverse("rides:road_route"), params)
+    self.assertEqual(cached_response.json(), response.json())
+    self.assertEqual(mock_urlopen.call_count, 1)
+
+  def test_route_api_rejects_invalid_zoom(self):
+    response = self.client.get(
+      reverse("rides:road_route"),
+      {
+        "origin_lat": "30.2672",
+        "origin_lng": "-97.7431",
+        "destination_lat": "32.7767",
+        "destination_lng": "-96.797",
+        "zoom": "40",
+      },
+    )
+
+    self.assertEqual(response.status_code, 400)
+    self.assertEqual(response.json()["error"], "invalid_detail_level")
+
+
+class PolylineFormatTests(TestCase):
+  def setUp(self):
+    ROUTE_COORDINATE_CACHE.clear()
+    OSRM_CLIENT.breaker.reset()
+
+  def test_encode_matches_reference_polyline(self):
+    path = [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]
+    self.assertEqual(encode_polyline(path), "_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+    self.assertEqual(decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@"), path)
+
+  def test_batched_decoder_matches_single_decoder(self):
+    paths = [
+      "_p~iF~ps|U_ulLnnqC_mqNvxq`@",
+      "",
+      "_p~iF",
+      "abc",
+      encode_polyline([[30.2672, -97.7431], [32.7767, -96.797]]),
+    ]
+
+    batched = decode_polylines(paths)
+
+    self.assertEqual(len(batched), len(paths))
+    for decoded, path in zip(batched, paths):
+      expected = decode_polyline(path)
+      self.assertEqual(len(decoded), len(expected))
+      for point, expected_point in zip(decoded, expected):
+        self.assertAlmostEqual(point[0], expected_point[0])
+        self.assertAlmostEqual(point[1], expected_point[1])
+
+  @patch("rides.osrm.urlopen")
+  def test_route_api_can_return_encoded_polylines(self, mock_urlopen):
+    mock_urlopen.return_value = _MockResponse(
+      {"routes": [{"geometry": {"coordinates": [[-97.7431, 30.2672], [-96.797, 32.7767]]}}]}
+    )
+
+    response = self.client.get(
+      reverse("rides:road_route"),
+      {
+        "origin_lat": "30.2672",
+        "origin_lng": "-97.7431",
+        "destination_lat": "32.7767",
+        "destination_lng": "-96.797",
+        "format": "polyline",
+      },
+    )
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(
+      decode_polyline(response.json()["polyline"]),
+      [[30.2672, -97.7431], [32.7767, -96.797]],
+    )
+
+  def test_route_api_rejects_unknown_format(self):
+    response = self.client.get(
+      reverse("rides:road_route"),
+      {
+        "origin_lat": "30.2672",
+        "origin_lng": "-97.7431",
+        "destination_lat": "32.7767",
+        "destination_lng": "-96.797",
+        "format": "xml",
+      },
+    )
+
+    self.assertEqual(response.status_code, 400)
+    self.assertEqual(response.json()["error"], "invalid_format")
+
+
+class RoutePrecomputeTests(TestCase):
+  def setUp(self):
+    reset_page_cache()
+    ROUTE_COORDINATE_CACHE.clear()
+    OSRM_CLIENT.breaker.reset()
+
+  def test_saving_rides_queues_one_job_per_corridor(self):
+    _ride().save()
+    _ride(first_name="Sam").save()
+    _ride(origination="Miami", destination_city="Orlando", destination_state="FL").save()
+
+    self.assertEqual(RouteJob.objects.count(), 2)
+    self.assertEqual(enqueue_route_jobs(Person.objects.all()), 0)
+
+  @patch("rides.osrm.urlopen")
+  def test_worker_stores_routes_that_the_map_embeds(self, mock_urlopen):
+    mock_urlopen.return_value = _MockResponse(
+      {"routes": [{"geometry": {"coordinates": [[-97.7431, 30.2672], [-96.797, 32.7767]]}}]}
+    )
+    _ride().save()
+
+    self.assertEqual(process_route_jobs(), {"done": 1, "retried": 0, "failed": 0})
+    route = RoadRoute.objects.get(key=RouteJob.objects.get().key)
+    self.assertIsNone(route.expires_at)
+
+    ROUTE_COORDINATE_CACHE.clear(shared=False)
+    mock_urlopen.reset_mock()
+    response = self.client.get(
+      reverse("rides:rides_geojson"), {"bbox": "-98,30,-97,31", "zoom": "14"}
+    )
+
+    self.assertEqual(
+      decode_polyline(response.json()["features"][0]["properties"]["route"]),
+      [[30.2672, -97.7431], [32.7767, -96.797]],
+    )
+    mock_urlopen.assert_not_called()
+
+  @patch("rides.osrm.urlopen")
+  def test_failed_jobs_are_retried_later(self, mock_urlopen):
+    mock_urlopen.side_effect = TimeoutError
+    _ride().save()
+
+    with patch("rides.osrm.time.sleep"):
+      self.assertEqual(process_route_jobs(), {"done": 0, "retried": 1, "failed": 0})
+
+    job = RouteJob.objects.get()
+    self.assertEqual(job.status, RouteJob.PENDING)
+    self.assertEqual(job.attempts, 1)
+    self.assertEqual(process_route_jobs(), {"done": 0, "retried": 0, "failed": 0})
+
+
+class OfflineRoutingTests(TestCase):
+  def setUp(self):
+    ROUTE_COORDINATE_CACHE.clear()
+    handle, self.graph_path = tempfile.mkstemp(suffix=".bin")
+    os.close(handle)
+    self.addCleanup(os.unlink, self.graph_path)
+
+  def _write_graph(self, nodes, edges):
+    write_road_graph(self.graph_path, nodes, edges)
+    return OfflineRouter(self.graph_path, max_snap_meters=2000)
+
+  def test_shortest_path_takes_the_cheaper_detour(self):
+    nodes = [(30.0, -97.0), (30.0, -96.99), (30.01, -96.995), (30.0, -96.98)]
+    # 0 -> 1 -> 3 is shorter on the map but 1 -> 3 is a slow 10 km road.
+    edges = [(0, 1, 1000), (1, 3, 10000), (0, 2, 1700), (2, 3, 1700)]
+    router = self._write_graph(nodes, edges)
+
+    route = router.route([30.0001, -97.0], [30.0, -96.9801])
+
+    self.assertEqual(
+      route["geometry"]["coordinates"], [[-97.0, 30.0], [-96.995, 30.01], [-96.98, 30.0]]
+    )
+    self.assertAlmostEqual(route["distance"], 3400, places=0)
+
+  def test_unreachable_or_far_endpoints_have_no_route(self):
+    router = self._write_graph([(30.0, -97.0), (30.0, -96.99)], [(0, 1, 1000)])
+
+    self.assertIsNone(router.route([30.0, -96.99], [30.0, -97.0]))
+    self.assertIsNone(router.route([30.0, -97.0], [45.0, -120.0]))
+
+  def test_missing_graph_file_is_unavailable(self):
+    with self.assertRaises(RouteUnavailable):
+      OfflineRouter(self.graph_path + ".missing").route([30.0, -97.0], [30.0, -96.99])
+
+  def test_build_command_joins_lines_and_respects_oneway(self):
+    geojson_path = self.graph_path + ".geojson"
+    self.addCleanup(os.unlink, geojson_path)
+    with open(geojson_path, "w", encoding="utf-8") as handle:
+      json.dump(
+        {
+          "type": "FeatureCollection",
+          "features": [
+            {
+              "type": "Feature",
+              "properties": {},
+              "geometry": {"type": "LineString", "coordinates": [[-97.0, 30.0], [-96.99, 30.0]]},
+            },
+            {
+              "type": "Feature",
+              "properties": {"oneway": "yes"},
+              "geometry": {"type": "LineString", "coordinates": [[-96.99, 30.0], [-96.98, 30.0]]},
+            },
+          ],
+        },
+        handle,
+      )
+
+    call_command("build_road_graph", geojson_path, output=self.graph_path, stdout=io.StringIO())
+    graph = RoadGraph(self.graph_path)
+    self.addCleanup(graph.close)
+
+    self.assertEqual((graph.node_count, graph.edge_count), (3, 3))
+    router = OfflineRouter(self.graph_path, max_snap_meters=100)
+    self.assertEqual(len(router.route([30.0, -97.0], [30.0, -96.98])["geometry"]["coordinates"]), 3)
+    self.assertIsNone(router.route([30.0, -96.98], [30.0, -97.0]))
+
+  def test_route_api_uses_the_offline_backend_without_network(self):
+    router = OfflineRouter(settings.ROAD_GRAPH_PATH, settings.ROAD_GRAPH_MAX_SNAP_METERS)
+
+    with patch("rides.routing.ROUTING_BACKEND", router), patch("rides.osrm.urlopen") as mock_urlopen:
+      response = self.client.get(
+        reverse("rides:road_route"),
+        {
+          "origin_lat": "30.2672",
+          "origin_lng": "-97.7431",
+          "destination_lat": "32.7767",
+          "destination_lng": "-96.797",
+        },
+      )
+
+    mock_urlopen.assert_not_called()
+    coordinates = response.json()["coordinates"]
+    self.assertEqual(coordinates[0], [30.2672, -97.7431])
+    self.assertEqual(coordinates[-1], [32.7767, -96.797])
+    self.assertNotIn("fallback", response.json())
+
+
+class GazetteerTests(TestCase):
+  def setUp(self):
+    handle, self.path = tempfile.mkstemp(suffix=".bin")
+    os.close(handle)
+    self.addCleanup(os.unlink, self.path)
+    write_gazetteer(
+      self.path,
+      [
+        ("MO", "St. Louis", 38.627, -90.1994),
+        ("IL", "Springfield", 39.7817, -89.6501),
+        ("MA", "Springfield", 42.1015, -72.5898),
+        ("CA", "San José", 37.3382, -121.8863),
+        ("CA", "San Diego", 32.7157, -117.1611),
+        ("CA", "Santa Cruz", 36.9741, -122.0308),
+      ],
+    )
+    self.gazetteer = Gazetteer(self.path)
+    self.addCleanup(self.gazetteer.close)
+
+  def test_names_are_normalized(self):
+    self.assertEqual(normalize_place_name("  St. Louis "), "saint louis")
+    self.assertEqual(normalize_place_name("San José"), "san jose")
+    self.assertEqual(
+      self.gazetteer.coordinates(self.gazetteer.find("saint louis", "mo")), (38.627, -90.1994)
+    )
+    self.assertIsNotNone(self.gazetteer.find("SAN JOSE", "CA"))
+    self.assertIsNone(self.gazetteer.find("San Jose", "TX"))
+
+  def test_lookup_across_states(self):
+    self.assertEqual(len(self.gazetteer.find_anywhere("springfield")), 2)
+    self.assertEqual(len(self.gazetteer.find_anywhere("St Louis")), 1)
+
+  def test_prefix_lookup(self):
+    self.assertEqual(
+      [place["name"] for place in self.gazetteer.prefix("san", state="ca")],
+      ["San Diego", "San José", "Santa Cruz"],
+    )
+    self.assertEqual(
+      [place["state"] for place in self.gazetteer.prefix("spring")], ["IL", "MA"]
+    )
+    self.assertEqual(len(self.gazetteer.prefix("san", state="ca", limit=1)), 1)
+
+  def test_fuzzy_lookup_tolerates_typos(self):
+    index = self.gazetteer.find_fuzzy("Sna Diego", "CA")
+
+    self.assertEqual(self.gazetteer.coordinates(index), (32.7157, -117.1611))
+    self.assertIsNone(self.gazetteer.find_fuzzy("Sacramento", "CA"))
+
+  def test_build_command_strips_census_suffixes(self):
+    source_path = self.path + ".tsv"
+    self.addCleanup(os.unlink, source_path)
+    with open(source_path, "w", encoding="utf-8") as handle:
+      handle.write("USPS\tGEOID\tNAME\tINTPTLAT\tINTPTLONG   \n")
+      handle.write("NJ\t3436000\tJersey City city\t40.7178\t-74.0431\n")
+      handle.write("CA\t0673906\tStanford CDP\t37.4275\t-122.1697\n")
+      handle.write("NV\t3209700\tCarson City\t39.1638\t-119.7674\n")
+
+    call_command("build_gazetteer", source_path, output=self.path, stdout=io.StringIO())
+    gazetteer = Gazetteer(self.path)
+    self.addCleanup(gazetteer.close)
+
+    self.assertEqual(len(gazetteer), 3)
+    self.assertIsNotNone(gazetteer.find("Jersey City", "NJ"))
+    self.assertIsNotNone(gazetteer.find("Stanford", "CA"))
+    self.assertIsNotNone(gazetteer.find("Carson City", "NV"))
+
+  def test_rides_resolve_through_the_bundled_gazetteer(self):
+    self.assertEqual(resolve_coordinates("austin", "tx"), (30.2672, -97.7431))
+    self.assertEqual(resolve_coordinates("Ft. Worth", "TX"), (32.7555, -97.3308))
+    # Origins are entered with the destination's state; unique names still resolve.
+    self.assertEqual(resolve_coordinates("Miami", "TX"), (25.7617, -80.1918))
+    self.assertEqual(resolve_coordinates("Nowhere", "TX"), (31.9686, -99.9018))
+    self.assertIsNone(resolve_coordinates("Nowhere", "ZZ"))
+
+
+class RideCoordinateTests(TestCase):
+  def setUp(self):
+    reset_page_cache()
+
+  def test_coordinates_are_filled_on_save_and_follow_edits(self):
+    ride = _ride()
+    ride.save()
+    ride.refresh_from_db()
+
+    self.assertEqual((ride.origin_lat, ride.origin_lng), (30.2672, -97.7431))
+    self.assertEqual((ride.destination_lat, ride.destination_lng), (32.7767, -96.797))
+
+    ride.destination_city = "Houston"
+    ride.save(update_fields=["destination_city"])
+    ride.refresh_from_db()
+    self.assertEqual((ride.destination_lat, ride.destination_lng), (29.7604, -95.3698))
+
+  def test_saving_other_fields_does_not_geocode(self):
+    ride = _ride()
+    ride.save()
+
+    with patch("rides.signals.set_ride_coordinates") as geocode:
+      ride.seats_available = 1
+      ride.save(update_fields=["seats_available"])
+    geocode.assert_not_called()
+
+  def test_backfill_is_batched_and_resumable(self):
+    # bulk_create() bypasses signals, like rows that predate the columns.
+    Person.objects.bulk_create([_ride(first_name=f"Rider {index}") for index in range(5)])
+    Person.objects.bulk_create(
+      [_ride(origination="Atlantis", destination_city="Atlantis", destination_state="ZZ")]
+    )
+    ids = list(Person.objects.order_by("pk").values_list("pk", flat=True))
+
+    call_command(
+      "backfill_ride_coordinates", batch_size=2, start_after=ids[2], stdout=io.StringIO()
+    )
+    self.assertEqual(Person.objects.filter(origin_lat__isnull=False).count(), 2)
+
+    output = io.StringIO()
+    call_command("backfill_ride_coordinates", batch_size=2, stdout=output)
+    self.assertEqual(Person.objects.filter(origin_lat__isnull=False).count(), 5)
+    # The unresolvable ride stays null and is revisited on every run.
+    self.assertEqual(output.getvalue().splitlines()[-1], "Done: 4 rides visited, 3 updated.")
+
+  def test_map_reads_stored_coordinates(self):
+    ride = _ride()
+    ride.save()
+    Person.objects.bulk_create([_ride(first_name="Ungeocoded")])
+
+    with patch("rides.geocoding.resolve_coordinates") as geocode:
+      response = self.client.get(reverse("rides:map"))
+      features = self.client.get(
+        reverse("rides:rides_geojson"), {"bbox": "-98,30,-97,31", "zoom": "14"}
+      ).json()["features"]
+
+    geocode.assert_not_called()
+    self.assertEqual(response.context["plotted_ride_count"], 1)
+    self.assertEqual(response.context["unresolved_ride_count"], 1)
+    self.assertEqual(features[0]["geometry"]["coordinates"], [-97.7431, 30.2672])
+
+
+class SpatialSearchTests(TestCase):
+  def setUp(self):
+    SEARCH_RESULT_CACHE.clear()
+    reset_page_cache()
+    for name, origin, destination, state in (
+      ("Avery", "Palo Alto", "San Jose", "CA"),
+      ("Blake", "Menlo Park", "San Jose", "CA"),
+      ("Casey", "San Jose", "Palo Alto", "CA"),
+      ("Drew", "Austin", "Dallas", "TX"),
+    ):
+      Person.objects.create(
+        first_name=name,
+        origination=origin,
+        destination_city=destination,
+        destination_state=state,
+        date="2026-03-03",
+        time="08:45",
+        taking_passengers=True,
+        seats_available=2,
+      )
+
+  def test_grid_clusters(self):
+    points = [("a", 37.44, -122.14, 2), ("b", 37.45, -122.18, 1), ("c", 30.27, -97.74, 3)]
+    clusters = grid_clusters(points, 5, 60)
+    self.assertEqual(len(clusters), 2)
+    keys, latitude, longitude, weight, bounds = clusters[0]
+    self.assertEqual(keys, ["a", "b"])
+    self.assertAlmostEqual(latitude, 37.445)
+    self.assertAlmostEqual(longitude, -122.16)
+    self.assertEqual(weight, 3)
+    self.assertEqual(bounds, (37.44, -122.18, 37.45, -122.14))
+    self.assertEqual(len(grid_clusters(points, 15, 60)), 3)
+
+  def test_map_features_cluster_at_low_zoom(self):
+    url = reverse("rides:rides_geojson")
+    collection = self.client.get(url, {"bbox": "-125,24,-66,50", "zoom": "4"}).json()
+    self.assertEqual(collection["type"], "FeatureCollection")
+    clusters = [f for f in collection["features"] if f["properties"].get("cluster")]
+    rides = [f for f in collection["features"] if not f["properties"].get("cluster")]
+    # Bay Area rides are grouped (a cell edge may split them); Austin stands alone.
+    self.assertTrue(clusters)
+    self.assertEqual(sum(cluster["properties"]["count"] for cluster in clusters) + len(rides), 4)
+    for cluster in clusters:
+      self.assertEqual(cluster["properties"]["seats_available"], 2 * cluster["properties"]["count"])
+      west, south, east, north = cluster["bbox"]
+      self.assertTrue(west < east and south < north)
+    self.assertIn("Drew", [ride["properties"]["first_name"] for ride in rides])
+
+    # Zoomed in, only the rides in view come back, each on its own.
+    collection = self.client.get(url, {"bbox": "-122.3,37.2,-121.8,37.5", "zoom": "14"}).json()
+    self.assertEqual(
+      sorted(feature["properties"]["first_name"] for feature in collection["features"]),
+      ["Avery", "Blake", "Casey"],
+    )
+    self.assertIsNotNone(collection["features"][0]["properties"]["destination_lat"])
+
+    for params in ({"bbox": "-122,37", "zoom": "4"}, {"bbox": "-125,24,-66,50", "zoom": "30"}):
+      with self.subTest(params=params):
+        self.assertEqual(self.client.get(url, params).status_code, 400)
+
+  def test_map_page_leaves_rides_to_the_api(self):
+    response = self.client.get(reverse("rides:map"))
+    self.assertNotContains(response, "map-rides-data")
+    self.assertContains(response, reverse("rides:rides_geojson"))
+    south, west, north, east = response.context["map_bounds"]
+    self.assertLess(south, 30.3)
+    self.assertGreater(north, 37.4)
+
+  def test_geohash_encode_and_cover(self):
+    self.assertEqual(geohash_encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+    cells = geohash_cover(37.3, -122.2, 37.5, -121.8)
+    self.assertTrue(cells and len(cells) <= 16)
+    self.assertTrue(any(geohash_encode(37.4419, -122.143).startswith(cell) for cell in cells))
+    self.assertEqual(geohash_cover(-80, -170, 80, 170), [""])
+
+  def test_haversine_km(self):
+    distances = haversine_km(37.4419, -122.143, [37.4419, 37.3382], [-122.143, -121.8863])
+    self.assertAlmostEqual(distances[0], 0.0)
+    self.assertAlmostEqual(distances[1], 25.0, delta=1.0)
+
+  def test_rides_near_ranks_by_distance(self):
+    distances = rides_near(37.4419, -122.143, 10, side="origin")
+    names = [Person.objects.get(pk=pk).first_name for pk in distances]
+    self.assertEqual(names, ["Avery", "Blake"])
+    self.assertLess(list(distances.values())[0], 0.1)
+
+    either = rides_near(37.4419, -122.143, 10, side="either")
+    self.assertEqual(len(either), 3)
+
+  def test_rides_in_box(self):
+    texas = rides_in_box((25.0, -107.0, 37.0, -93.0), side="destination")
+    self.assertEqual([ride.first_name for ride in texas], ["Drew"])
+
+  def test_search_form_filters_and_orders_by_distance(self):
+    response = self.client.get(
+      reverse("rides:index"), {"near": "Menlo Park, CA", "radius_km": "5", "near_side": "origin"}
+    )
+    rides = list(response.context["page"])
+    self.assertEqual([ride.first_name for ride in rides], ["Blake", "Avery"])
+    self.assertEqual(response.context["match_count"], 2)
+    self.assertContains(response, "Distance:")
+
+  def test_search_form_rejects_unknown_place(self):
+    response = self.client.get(reverse("rides:index"), {"near": "Atlantis, ZZ"})
+    self.assertIn("near", response.context["form"].errors)
+
+  def test_search_form_folds_non_ascii_states(self):
+    response = self.client.get(reverse("rides:index"), {"near": "Menlo Park, Ça", "radius_km": "5"})
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.context["match_count"], 2)
+
+    response = self.client.get(reverse("rides:index"), {"near": "Menlo Park, Ωx"})
+    self.assertIn("near", response.context["form"].errors)
+
+  def test_nearby_api(self):
+    response = self.client.get(
+      reverse("rides:nearby_rides"),
+      {"lat": "37.4419", "lng": "-122.143", "radius_km": "10", "side": "either", "limit": "2"},
+    )
+    payload = response.json()
+    self.assertEqual(payload["count"], 3)
+    self.assertEqual([ride["first_name"] for ride in payload["rides"]], ["Avery", "Casey"])
+    self.assertIn("distance_km", payload["rides"][0])
+
+    response = self.client.get(reverse("rides:nearby_rides"), {"bbox": "-123,37,-121.5,37.6"})
+    self.assertEqual(response.json()["count"], 3)
+
+    # A negative limit must not slice from the end of the results.
+    response = self.client.get(
+      reverse("rides:nearby_rides"), {"bbox": "-123,37,-121.5,37.6", "limit": "-5"}
+    )
+    self.assertEqual(len(response.json()["rides"]), 1)
+
+    response = self.client.get(reverse("rides:nearby_rides"), {"bbox": "1,2,3"})
+    self.assertEqual(response.status_code, 400)
+    self.assertEqual(response.json()["error"], "invalid_bbox")
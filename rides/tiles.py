@@ -0,0 +1,204 @@
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Greatest, Least
+
+from .geometry import geohash_cover, grid_clusters, tile_box
+from .models import Person
+from .search_cache import bump_generation, current_generation
+from .spatial import rides_in_box
+
+# Deepest zoom tiles are rendered at; the map scales them up past it.
+TILE_MAX_ZOOM = 14
+
+# Ride origins are counted in square cells this many pixels wide (16 x 16
+# cells per 256-pixel tile).
+TILE_DENSITY_CELL_PIXELS = 16
+
+# Busiest corridors drawn per tile.
+TILE_MAX_CORRIDORS = 500
+
+# Generation the cached tiles are filed under (see cached_tile).
+TILE_GENERATION = "ride_tiles"
+
+# Person columns a tile is drawn from; a write that changes none of them
+# leaves the cached tiles alone.
+TILE_FIELDS = (
+  "origin_lat",
+  "origin_lng",
+  "destination_lat",
+  "destination_lng",
+  "seats_available",
+  "origination",
+  "destination_city",
+  "destination_state",
+)
+
+
+def valid_tile(zoom, x, y):
+  return 0 <= zoom <= TILE_MAX_ZOOM and 0 <= x < 2 ** zoom and 0 <= y < 2 ** zoom
+
+
+def render_tile(zoom, x, y):
+  # Two GeoJSON layers, like the layers of a vector tile: "density" has a
+  # point per occupied cell with the number of rides starting there, and
+  # "corridors" a line per distinct origin/destination pair crossing the
+  # tile, busiest first. Lines are not clipped to the tile.
+  south, west, north, east = tile_box(zoom, x, y)
+  origins = rides_in_box((south, west, north, east), "origin").values_list(
+    "pk", "origin_lat", "origin_lng"
+  )
+  density = [
+    {
+      "type": "Feature",
+      "geometry": {"type": "Point", "coordinates": [round(lng, 5), round(lat, 5)]},
+      "properties": {"count": len(keys)},
+    }
+    for keys, lat, lng, _, _ in grid_clusters(
+      ((pk, lat, lng, 0) for pk, lat, lng in origins), zoom, TILE_DENSITY_CELL_PIXELS
+    )
+  ]
+
+  # A corridor crosses the tile when the box around its two endpoints does;
+  # the line itself may still pass beside a corner. That box lies inside the
+  # corridor's geohash cell, and two cells overlap only when one is a prefix
+  # of the other, so candidates are rides whose cell contains a covering cell
+  # (an exact match on one of its shorter prefixes) or is one or sits inside
+  # one (a range).
+  # The exact matches are written as one-value ranges: SQLite prices an IN
+  # list by the average rows per value, which over a few busy corridors
+  # comes out as most of the table and a full scan.
+  covering = geohash_cover(south, west, north, east)
+  cells = Q()
+  for cell in sorted({prefix[:length] for prefix in covering for length in range(len(prefix))}):
+    cells |= Q(corridor_geohash__range=(cell, cell))
+  for prefix in covering:
+    cells |= Q(corridor_geohash__gte=prefix, corridor_geohash__lt=prefix + "~")
+  corridors = (
+    Person.objects.filter(cells)
+    .alias(
+      low_lat=Least("origin_lat", "destination_lat"),
+      high_lat=Greatest("origin_lat", "destination_lat"),
+      low_lng=Least("origin_lng", "destination_lng"),
+      high_lng=Greatest("origin_lng", "destination_lng"),
+    )
+    .filter(low_lat__lte=north, high_lat__gte=south, low_lng__lte=east, high_lng__gte=west)
+    .values(
+      "origin_lat",
+      "origin_lng",
+      "destination_lat",
+      "destination_lng",
+      "origination",
+      "destination_city",
+      "destination_state",
+    )
+    .annotate(rides=Count("id"), seats=Sum("seats_available"))
+    .order_by("-rides", "origination", "destination_city")[:TILE_MAX_CORRIDORS]
+  )
+  lines = [
+    {
+      "type": "Feature",
+      "geometry": {
+        "type": "LineString",
+        "coordinates": [
+          [round(corridor["origin_lng"], 5), round(corridor["origin_lat"], 5)],
+          [round(corridor["destination_lng"], 5), round(corridor["destination_lat"], 5)],
+        ],
+      },
+      "properties": {
+        "route": (
+          f"{corridor['origination']} to "
+          f"{corridor['destination_city']}, {corridor['destination_state']}"
+        ),
+        "rides": corridor["rides"],
+        "open_seats": corridor["seats"] or 0,
+      },
+    }
+    for corridor in corridors
+  ]
+  return {
+    "zoom": zoom,
+    "x": x,
+    "y": y,
+    "density": {"type": "FeatureCollection", "features": density},
+    "corridors": {"type": "FeatureCollection", "features": lines},
+  }
+
+
+def _generation_directory(generation):
+  return Path(settings.RIDE_TILE_CACHE_DIR) / f"g{generation}"
+
+
+def _tile_path(generation, zoom, x, y):
+  return _generation_directory(generation) / str(zoom) / str(x) / f"{y}.json"
+
+
+def _prune_tile_generations(current):
+  # Deletes the cached tiles of generations before `current` (and anything
+  # else left in the cache directory) and returns how many there were.
+  try:
+    entries = list(os.scandir(settings.RIDE_TILE_CACHE_DIR))
+  except FileNotFoundError:
+    return 0
+  deleted = 0
+  for entry in entries:
+    number = entry.name[1:]
+    if entry.name.startswith("g") and number.isdigit() and int(number) >= current:
+      continue
+    if entry.is_dir(follow_symlinks=False):
+      deleted += sum(1 for _ in Path(entry.path).rglob("*.json"))
+      shutil.rmtree(entry.path, ignore_errors=True)
+  return deleted
+
+
+def cached_tile(zoom, x, y):
+  # (JSON bytes, "hit" or "miss") for a tile, from the on-disk cache when it
+  # is there. Tiles are filed under the tile generation, which ride writes
+  # bump in the database, so every worker and host stops reading a tile as
+  # soon as the write commits; the first tile of a new generation on a host
+  # prunes the older ones.
+  generation = current_generation(TILE_GENERATION)
+  path = _tile_path(generation, zoom, x, y)
+  try:
+    return path.read_bytes(), "hit"
+  except FileNotFoundError:
+    pass
+
+  # The generation is read before the rows, so a tile drawn from rows a
+  # write has since replaced is filed under a generation nobody reads.
+  content = json.dumps(render_tile(zoom, x, y), separators=(",", ":")).encode("utf-8")
+  if not _generation_directory(generation).exists():
+    _prune_tile_generations(generation)
+  temporary = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+  try:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary.write_bytes(content)
+    os.replace(temporary, path)
+  except OSError:
+    # Another worker pruned this (by now old) generation mid-write.
+    temporary.unlink(missing_ok=True)
+  return content, "miss"
+
+
+def invalidate_ride_tiles(previous, current):
+  # Moves the tile cache to a new generation when a ride write changes
+  # anything a tile draws (dicts with TILE_FIELDS; None for a created or
+  # deleted ride). Returns whether it did.
+  if previous is not None and current is not None:
+    if all(previous[field] == current[field] for field in TILE_FIELDS):
+      return False
+  bump_generation(TILE_GENERATION)
+  return True
+
+
+def clear_tile_cache():
+  # For writers that skip model signals (bulk_create(), update(), ...).
+  # Returns how many tiles this host dropped; other hosts drop theirs on
+  # their next render.
+  bump_generation(TILE_GENERATION)
+  return _prune_tile_generations(current_generation(TILE_GENERATION))
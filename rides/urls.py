@@ -12,6 +12,14 @@ urlpatterns = [
     path("rides/<int:person_id>/", views.rider_profile, name="ride_profile"),
     path("riders/<int:person_id>/", views.rider_profile, name="rider_profile"),
     path("api/road-route/", views.road_route, name="road_route"),
+    path("api/road-route/async/", views.road_route_async, name="road_route_async"),
+    path("api/rides/nearby/", views.nearby_rides, name="nearby_rides"),
+    path("api/rides.geojson", views.rides_geojson, name="rides_geojson"),
+    path("api/rides/export/", views.export_rides, name="export_rides"),
+    path("api/suggest/", views.suggest, name="suggest"),
+    path("api/cache-stats/", views.cache_stats, name="cache_stats"),
+    path("api/road-routes/", views.road_route_batch, name="road_route_batch"),
+    path("tiles/<int:zoom>/<int:x>/<int:y>", views.ride_tile, name="ride_tile"),
     path("signin/", views.sign_in, name="sign_in"),
     path("profile/", views.profile, name="profile"),
     path("map/", views.map_view, name="map"),
@@ -1,13 +1,25 @@
+import datetime
+import hashlib
 import json
-from urllib.error import HTTPError, URLError
-from urllib.parse import urlencode
-from urllib.request import Request, urlopen
 
-from django.db.models import Count, Q, Sum
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import Greatest, Least
+from django.http import (
+  HttpResponse,
+  HttpResponseNotModified,
+  JsonResponse,
+  StreamingHttpResponse,
+)
 from django.utils import timezone
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
 from .forms import (
   CreateAccountForm,
@@ -17,182 +29,158 @@ from .forms import (
   SignInForm,
   SupportRequestForm,
 )
+from .export import EXPORT_FORMATS, export_lines, export_rows
+from .geometry import encode_polyline, grid_clusters
 from .models import Person
+from .page_cache import cached_response, page_cache_stats
+from .pagination import (
+  Page,
+  approximate_count,
+  keyset_page,
+  list_page,
+  page_size,
+)
+from .route_cache import MISSING
+from .routing import (
+  ROUTE_COORDINATE_CACHE,
+  ROUTE_EMBED_LEVEL,
+  async_fetch_road_route,
+  async_fetch_road_routes,
+  build_route_key,
+  detail_key,
+  fetch_road_route,
+  parse_detail_level,
+  simplify_road_route,
+  stored_routes,
+)
+from .search import matching_rides
+from .search_cache import SEARCH_RESULT_CACHE, current_generation, search_cache_key
+from .spatial import SIDES, rides_in_box, rides_near
+from .stats import dashboard_stats, map_sidebar
+from .tiles import TILE_MAX_ZOOM, cached_tile, valid_tile
+from .suggest import SUGGEST_MAX_RESULTS, SUGGESTION_KINDS, get_suggest_index
 
-CITY_COORDINATES = {
-  ("east palo alto", "ca"): (37.4688, -122.1411),
-  ("stanford", "ca"): (37.4275, -122.1697),
-  ("san diego", "ca"): (32.7157, -117.1611),
-  ("cupertino", "ca"): (37.3229, -122.0322),
-  ("portola valley", "ca"): (37.3721, -122.2180),
-  ("monte sereno", "ca"): (37.2369, -121.9922),
-  ("santa cruz", "ca"): (36.9741, -122.0308),
-  ("los altos", "ca"): (37.3852, -122.1141),
-  ("torrance", "ca"): (33.8358, -118.3406),
-  ("san jose", "ca"): (37.3382, -121.8863),
-  ("carmel valley", "ca"): (36.4791, -121.7328),
-  ("los altos hills", "ca"): (37.3791, -122.1375),
-  ("bakersfield", "ca"): (35.3733, -119.0187),
-  ("menlo park", "ca"): (37.4530, -122.1817),
-  ("austin", "tx"): (30.2672, -97.7431),
-  ("dallas", "tx"): (32.7767, -96.7970),
-  ("miami", "fl"): (25.7617, -80.1918),
-  ("orlando", "fl"): (28.5383, -81.3792),
-  ("seattle", "wa"): (47.6062, -122.3321),
-  ("south san francisco", "ca"): (37.6547, -122.4077),
-  ("riverside", "ca"): (33.9806, -117.3755),
-  ("mountain view", "ca"): (37.3861, -122.0839),
-  ("santa rosa", "ca"): (38.4405, -122.7144),
-  ("merced", "ca"): (37.3022, -120.4829),
-  ("oakland", "ca"): (37.8044, -122.2711),
-  ("san carlos", "ca"): (37.5072, -122.2605),
-}
-
-STATE_CENTERS = {
-  "CA": (36.7783, -119.4179),
-  "TX": (31.9686, -99.9018),
-  "FL": (27.6648, -81.5158),
-  "WA": (47.7511, -120.7401),
-}
-
-OSRM_BASE_URL = "https://router.project-osrm.org/route/v1/driving/"
-ROUTE_COORDINATE_CACHE = {}
+# How long browsers may reuse a suggestion list (seconds).
+SUGGEST_MAX_AGE = 60
 
+# Upper bound on rides returned by the nearby-rides API.
+NEARBY_RIDES_MAX_RESULTS = 200
+NEARBY_RIDES_MAX_RADIUS_KM = 500
 
-def _split_csv(value):
-  return [item.strip() for item in (value or "").split(",") if item.strip()]
+# Map rides API: below MAP_CLUSTER_MAX_ZOOM, rides whose origins share a grid
+# cell this many screen pixels wide come back as one cluster.
+MAP_CLUSTER_CELL_PIXELS = 60
+MAP_CLUSTER_MAX_ZOOM = 13
+MAP_MAX_ZOOM = 19
 
+# Rides listed beside the map; the map itself shows every ride in view.
+MAP_RIDE_LIST_LIMIT = 20
 
-def _compatibility_score(person):
-  profile_bonus = min(12, len(_split_csv(person.interests)) * 2)
-  intent_bonus = 4 if person.looking_for else 0
-  seats_bonus = min(8, person.seats_available * 2)
-  score = min(98, 68 + profile_bonus + intent_bonus + seats_bonus)
-  return f"{score}%"
+# How long browsers may reuse a density/corridor tile (seconds). The server
+# drops its cached copy as soon as a ride in it changes.
+TILE_MAX_AGE = 60
 
+# Upper bound on origin/destination pairs per batch request.
+ROUTE_BATCH_MAX_PAIRS = 500
 
-def _resolve_coordinates(city_name, state_code):
-  city = (city_name or "").strip().lower()
-  state = (state_code or "").strip().upper()
+# Wire formats for route geometry: nested [lat, lng] lists, or a Google
+# encoded polyline string (precision 5), which is several times smaller.
+ROUTE_FORMATS = ("json", "polyline")
 
-  if (city, state.lower()) in CITY_COORDINATES:
-    return CITY_COORDINATES[(city, state.lower())]
+# Part of every route ETag; bump it when the geometry served for a key changes
+# (new routing backend, new simplification), so browsers and CDNs refetch.
+ROUTE_ETAG_VERSION = 1
 
-  if state in STATE_CENTERS:
-    return STATE_CENTERS[state]
 
-  return None
+def _split_csv(value):
+  return [item.strip() for item in (value or "").split(",") if item.strip()]
 
 
-def _build_route_key(origin, destination):
-  return (
-    f"{origin[0]:.5f}|{origin[1]:.5f}|"
-    f"{destination[0]:.5f}|{destination[1]:.5f}"
-  )
+def _parse_bbox(value):
+  # "west,south,east,north" -> (south, west, north, east), or None.
+  try:
+    west, south, east, north = (float(item) for item in value.split(","))
+  except ValueError:
+    return None
+  if (
+    not (_valid_lat_lng(south, west) and _valid_lat_lng(north, east))
+    or south > north
+    or west > east
+  ):
+    return None
+  return south, west, north, east
 
 
-def _decode_polyline(encoded_path, precision=5):
-  if not encoded_path:
-    return []
+def _compatibility_score(person):
+  profile_bonus = min(12, len(_split_csv(person.interests)) * 2)
+  intent_bonus = 4 if person.looking_for else 0
+  seats_bonus = min(8, person.seats_available * 2)
+  score = min(98, 68 + profile_bonus + intent_bonus + seats_bonus)
+  return f"{score}%"
 
-  factor = 10 ** precision
-  latitude = 0
-  longitude = 0
-  index = 0
-  points = []
 
-  try:
-    while index < len(encoded_path):
-      result = 1
-      shift = 0
-      while True:
-        byte = ord(encoded_path[index]) - 63 - 1
-        index += 1
-        result += byte << shift
-        shift += 5
-        if byte < 0x1f:
-          break
-      latitude += ~(result >> 1) if (result & 1) else (result >> 1)
-
-      result = 1
-      shift = 0
-      while True:
-        byte = ord(encoded_path[index]) - 63 - 1
-        index += 1
-        result += byte << shift
-        shift += 5
-        if byte < 0x1f:
-          break
-      longitude += ~(result >> 1) if (result & 1) else (result >> 1)
-
-      points.append([latitude / factor, longitude / factor])
-  except (IndexError, TypeError):
-    return []
-
-  return points
-
-
-def _normalize_route_coordinates(raw_coordinates):
-  coordinates = []
-  for point in raw_coordinates:
-    if not isinstance(point, (list, tuple)) or len(point) < 2:
-      continue
+def _parse_route_pair(raw_pair):
+  if not isinstance(raw_pair, (list, tuple)) or len(raw_pair) != 4:
+    return None
 
-    try:
-      longitude = float(point[0])
-      latitude = float(point[1])
-    except (TypeError, ValueError):
-      continue
+  try:
+    origin_lat, origin_lng, destination_lat, destination_lng = (
+      float(value) for value in raw_pair
+    )
+  except (TypeError, ValueError):
+    return None
 
-    coordinates.append([latitude, longitude])
+  if not _valid_lat_lng(origin_lat, origin_lng) or not _valid_lat_lng(
+    destination_lat, destination_lng
+  ):
+    return None
 
-  return coordinates
+  return [origin_lat, origin_lng], [destination_lat, destination_lng]
 
 
-def _extract_route_coordinates(route):
-  if not isinstance(route, dict):
-    return None
+def _encode_route(coordinates, route_format):
+  if route_format == "polyline":
+    return encode_polyline(coordinates)
+  return coordinates
 
-  geometry = route.get("geometry")
 
-  if isinstance(geometry, dict):
-    coordinates = _normalize_route_coordinates(geometry.get("coordinates") or [])
-    return coordinates if len(coordinates) > 1 else None
+def _route_etag(key, level, route_format):
+  # Derived from the request alone, so a conditional request can be answered
+  # before the route is looked up.
+  level_part = detail_key("", level) if level else "full"
+  digest = hashlib.sha1(
+    f"{ROUTE_ETAG_VERSION}|{key}|{level_part}|{route_format}".encode("ascii")
+  ).hexdigest()
+  return quote_etag(digest[:24])
 
-  if isinstance(geometry, str):
-    for precision in (5, 6):
-      decoded = _decode_polyline(geometry, precision=precision)
-      if len(decoded) > 1:
-        return decoded
 
-  return None
+def _cache_route_response(response, etag=None, fallback=False):
+  # Geometry for a key never changes, so real routes may be cached for a long
+  # time; fallbacks only until the routing backend is likely to be back.
+  if fallback:
+    patch_cache_control(response, public=True, max_age=settings.ROUTE_FALLBACK_MAX_AGE)
+  else:
+    patch_cache_control(response, public=True, max_age=settings.ROUTE_RESPONSE_MAX_AGE)
+    if etag:
+      response["ETag"] = etag
+  return response
 
 
-def _fetch_road_route(origin, destination):
-  key = _build_route_key(origin, destination)
-  if key in ROUTE_COORDINATE_CACHE:
-    return ROUTE_COORDINATE_CACHE[key]
+def _route_not_modified(request, etag):
+  if etag not in parse_etags(request.headers.get("If-None-Match", "")):
+    return None
+  return _cache_route_response(HttpResponseNotModified(), etag)
 
-  request_url = (
-    f"{OSRM_BASE_URL}{origin[1]},{origin[0]};{destination[1]},{destination[0]}?"
-    + urlencode({"overview": "full", "geometries": "geojson"})
-  )
-  request = Request(
-    request_url,
-    headers={"User-Agent": "HandyRides/1.0"},
-  )
 
-  try:
-    with urlopen(request, timeout=8) as response:
-      payload = json.loads(response.read().decode("utf-8"))
-  except (HTTPError, URLError, TimeoutError, ValueError, json.JSONDecodeError):
-    ROUTE_COORDINATE_CACHE[key] = None
-    return None
+def _route_response(coordinates, route_format, fallback=False, etag=None):
+  if route_format == "polyline":
+    payload = {"polyline": encode_polyline(coordinates), "precision": 5}
+  else:
+    payload = {"coordinates": coordinates}
 
-  route = (payload.get("routes") or [None])[0] if isinstance(payload, dict) else None
-  coordinates = _extract_route_coordinates(route)
-  ROUTE_COORDINATE_CACHE[key] = coordinates
-  return coordinates
+  if fallback:
+    payload["fallback"] = True
+  return _cache_route_response(JsonResponse(payload), etag, fallback)
 
 
 def _valid_lat_lng(latitude, longitude):
@@ -200,16 +188,16 @@ def _valid_lat_lng(latitude, longitude):
 
 
 def home(request):
+  # Rebuilt once per ride data generation and day.
   today = timezone.localdate()
-  all_rides = Person.objects.all()
-  upcoming_rides = all_rides.filter(date__gte=today).order_by("date", "time")
-  open_rides = upcoming_rides.filter(taking_passengers=True)
+  return cached_response("home", request, (today,), lambda: _render_home(request, today))
 
-  popular_destinations = (
-    all_rides.values("destination_city", "destination_state")
-    .annotate(total=Count("id"))
-    .order_by("-total", "destination_city")[:4]
-  )
+
+def _render_home(request, today):
+  upcoming_rides = Person.objects.filter(date__gte=today).order_by("date", "time")
+  open_rides = upcoming_rides.filter(taking_passengers=True)
+  # Totals and destinations come from the incrementally maintained rollup.
+  stats = dashboard_stats(today)
 
   featured_matches = []
   for ride in open_rides[:4]:
@@ -223,78 +211,104 @@ def home(request):
   context = {
     "nav_page": "home",
     "featured_matches": featured_matches,
-    "popular_destinations": popular_destinations,
-    "stat_total_rides": all_rides.count(),
-    "stat_open_rides": open_rides.count(),
-    "stat_open_seats": all_rides.aggregate(total=Sum("seats_available"))["total"] or 0,
+    "popular_destinations": stats["popular_destinations"],
+    "stat_total_rides": stats["total_rides"],
+    "stat_open_rides": stats["open_rides"],
+    "stat_open_seats": stats["open_seats"],
     "upcoming_preview": upcoming_rides[:5],
   }
   return render(request, "index.html", context)
 
 
+def _search_results(cleaned_data, cursor, size):
+  # One page of results as (summary, rides). The summary holds only ids and
+  # plain values so it can be cached and the page rebuilt from it.
+  people, ordering, fuzzy = matching_rides(cleaned_data)
+
+  near_point = cleaned_data and cleaned_data["near_point"]
+  if near_point:
+    # Nearest first. Matches are bounded by the radius, so they are ranked
+    # and paged in memory.
+    distances = rides_near(
+      *near_point, cleaned_data["radius_km"], cleaned_data["near_side"], people
+    )
+    people = sorted(people.filter(pk__in=distances), key=lambda ride: (distances[ride.pk], ride.pk))
+    for ride in people:
+      ride.distance_km = distances[ride.pk]
+    page = list_page(people, lambda ride: (ride.distance_km, ride.pk), cursor, size)
+    match_count, match_qualifier = len(people), ""
+  else:
+    page = keyset_page(people, ordering, cursor, size)
+    match_count, match_qualifier = approximate_count(people, settings.RIDES_COUNT_LIMIT)
+
+  summary = {
+    "rides": [[ride.pk, getattr(ride, "distance_km", None)] for ride in page],
+    "next_cursor": page.next_cursor,
+    "previous_cursor": page.previous_cursor,
+    "match_count": match_count,
+    "match_qualifier": match_qualifier,
+    "fuzzy_search": fuzzy,
+    "near_search": bool(near_point),
+  }
+  return summary, page.rides
+
+
+def _cached_rides(summary):
+  by_id = Person.objects.in_bulk([pk for pk, _ in summary["rides"]])
+  rides = []
+  for pk, distance_km in summary["rides"]:
+    # A ride deleted since the page was cached bumps the generation, so this
+    # only skips rows removed by a bulk delete.
+    if pk in by_id:
+      ride = by_id[pk]
+      if distance_km is not None:
+        ride.distance_km = distance_km
+      rides.append(ride)
+  return rides
+
+
 def index(request):
-  form = RideForm(request.GET or None)
-  default_people = Person.objects.all().order_by("date", "time", "first_name")
+  # Cursor and page size are not filters; a bare ?cursor= is still the
+  # unfiltered ride list.
+  filters = request.GET.copy()
+  cursor = filters.pop("cursor", [None])[-1]
+  size = page_size(
+    filters.pop("page_size", [None])[-1], settings.RIDES_PAGE_SIZE, settings.RIDES_MAX_PAGE_SIZE
+  )
+  form = RideForm(filters or None)
   context = {
     "form": form,
-    "people": default_people,
-    "search_executed": False,
-    "match_count": default_people.count(),
+    "search_executed": form.is_bound,
     "nav_page": "search",
   }
 
-  if form.is_bound:
-    context["search_executed"] = True
-
-    if form.is_valid():
-      people = Person.objects.all()
-      search = form.cleaned_data["search"].strip()
-      travel_date = form.cleaned_data["travel_date"]
-      minimum_seats = form.cleaned_data["minimum_seats"]
-      passengers_only = form.cleaned_data["passengers_only"]
-
-      if search:
-        terms = search.replace(",", " ").split()
-        query = Q()
-
-        for term in terms:
-          term_query = (
-            Q(first_name__icontains=term)
-            | Q(origination__icontains=term)
-            | Q(destination_city__icontains=term)
-            | Q(occupation__icontains=term)
-            | Q(interests__icontains=term)
-            | Q(personality_style__icontains=term)
-            | Q(looking_for__icontains=term)
-            | Q(relationship_status__icontains=term)
-          )
-
-          # Treat 2-character tokens as potential state abbreviations.
-          if len(term) == 2:
-            term_query = term_query | Q(destination_state__iexact=term)
-          else:
-            term_query = term_query | Q(destination_state__icontains=term)
-
-          query &= term_query
-
-        people = people.filter(query)
-
-      if travel_date:
-        people = people.filter(date=travel_date)
-
-      if minimum_seats:
-        people = people.filter(seats_available__gte=minimum_seats)
-
-      if passengers_only:
-        people = people.filter(taking_passengers=True)
-
-      people = people.order_by("date", "time", "first_name")
-      context["people"] = people
-      context["match_count"] = people.count()
-    else:
-      context["people"] = Person.objects.none()
-
-  return render(request, "index_view.html", context)
+  if form.is_bound and not form.is_valid():
+    context.update(page=Page([]), match_count=0, match_qualifier="")
+    return render(request, "index_view.html", context)
+
+  # Result pages are cached per worker, keyed by the normalized filters and
+  # the ride data generation, which every ride write bumps.
+  cleaned_data = form.cleaned_data if form.is_bound else None
+  key = search_cache_key(current_generation(), cleaned_data or {}, cursor, size)
+  summary = SEARCH_RESULT_CACHE.get(key)
+  if summary is MISSING:
+    summary, rides = _search_results(cleaned_data, cursor, size)
+    SEARCH_RESULT_CACHE.set(key, summary)
+    cache_status = "miss"
+  else:
+    rides = _cached_rides(summary)
+    cache_status = "hit"
+
+  context.update(
+    page=Page(rides, summary["next_cursor"], summary["previous_cursor"]),
+    match_count=summary["match_count"],
+    match_qualifier=summary["match_qualifier"],
+    fuzzy_search=summary["fuzzy_search"],
+    near_search=summary["near_search"],
+  )
+  response = render(request, "index_view.html", context)
+  response["X-Search-Cache"] = cache_status
+  return response
 
 
 def create(request):
@@ -429,63 +443,36 @@ def profile(request):
 
 
 def map_view(request):
+  # Rebuilt once per ride data generation. Routes the worker finishes later
+  # are fetched by the map script until the entry expires (PAGE_CACHE_TTL).
+  return cached_response("map", request, (), lambda: _render_map(request))
+
+
+def _render_map(request):
   available_rides = Person.objects.filter(taking_passengers=True, seats_available__gt=0).order_by(
     "date", "time"
   )
-
-  map_rides = []
-  unresolved_rides = []
-
-  for ride in available_rides:
-    origin_coordinates = _resolve_coordinates(ride.origination, ride.destination_state)
-    destination_coordinates = _resolve_coordinates(
-      ride.destination_city, ride.destination_state
-    )
-
-    # If one side cannot be resolved, fall back to the side that is known.
-    if not origin_coordinates and destination_coordinates:
-      origin_coordinates = destination_coordinates
-    if not destination_coordinates and origin_coordinates:
-      destination_coordinates = origin_coordinates
-
-    if not origin_coordinates or not destination_coordinates:
-      unresolved_rides.append(ride)
-      continue
-
-    map_rides.append(
-      {
-        "id": ride.id,
-        "first_name": ride.first_name,
-        "occupation": ride.occupation,
-        "looking_for": ride.looking_for,
-        "origination": ride.origination,
-        "destination_city": ride.destination_city,
-        "destination_state": ride.destination_state,
-        "date": ride.date.isoformat(),
-        "time": ride.time.strftime("%H:%M"),
-        "seats_available": ride.seats_available,
-        "rider_profile_url": reverse("rides:rider_profile", args=[ride.id]),
-        "origin_lat": origin_coordinates[0],
-        "origin_lng": origin_coordinates[1],
-        "destination_lat": destination_coordinates[0],
-        "destination_lng": destination_coordinates[1],
-      }
-    )
-
-  corridors = (
-    available_rides.values("origination", "destination_city", "destination_state")
-    .annotate(
-      total_rides=Count("id"),
-      open_seats=Sum("seats_available"),
-      active_drivers=Count("id", filter=Q(taking_passengers=True)),
-    )
-    .order_by("-total_rides", "origination")[:8]
+  # The map script loads the rides in view from rides_geojson; the page only
+  # carries totals and the box to open the map on.
+  plotted = Q(origin_lat__isnull=False, destination_lat__isnull=False)
+  network = available_rides.aggregate(
+    rides=Count("id"),
+    seats=Sum("seats_available"),
+    plotted=Count("id", filter=plotted),
+    south=Min(Least("origin_lat", "destination_lat"), filter=plotted),
+    west=Min(Least("origin_lng", "destination_lng"), filter=plotted),
+    north=Max(Greatest("origin_lat", "destination_lat"), filter=plotted),
+    east=Max(Greatest("origin_lng", "destination_lng"), filter=plotted),
   )
+  map_bounds = []
+  if network["plotted"]:
+    map_bounds = [network["south"], network["west"], network["north"], network["east"]]
 
+  # Corridors and hotspots come from the incrementally maintained rollup.
+  sidebar = map_sidebar()
   corridor_cards = []
-  for corridor in corridors:
-    rides = corridor["total_rides"]
-    seats = corridor["open_seats"] or 0
+  for corridor in sidebar["corridors"]:
+    rides = corridor["rides"]
 
     if rides >= 3:
       load_label = "High demand"
@@ -494,6 +481,8 @@ def map_view(request):
     else:
       load_label = "Light"
 
+    busiest = max(corridor["hours"])
+    peak_hour = corridor["hours"].index(busiest)
     corridor_cards.append(
       {
         "route": (
@@ -502,59 +491,195 @@ def map_view(request):
         ),
         "load": load_label,
         "rides": rides,
-        "open_seats": seats,
+        "open_seats": corridor["open_seats"],
         "active_drivers": corridor["active_drivers"],
+        # Bar heights (percent of the busiest hour) for the departure chart.
+        "hour_levels": [
+          round(100 * count / busiest) if busiest else 0 for count in corridor["hours"]
+        ],
+        "peak_hour": datetime.time(peak_hour) if busiest else None,
       }
     )
 
-  pickup_hotspots = (
-    available_rides.values("origination")
-    .annotate(total=Count("id"))
-    .order_by("-total", "origination")[:6]
-  )
-
-  plotted_ride_ids = [entry["id"] for entry in map_rides]
-  plotted_rides = available_rides.filter(id__in=plotted_ride_ids).order_by("date", "time")
+  plotted_rides = available_rides.filter(plotted)[:MAP_RIDE_LIST_LIMIT]
 
   return render(
     request,
     "map.html",
     {
       "nav_page": "map",
-      "map_rides": map_rides,
+      "map_bounds": map_bounds,
       "available_rides": plotted_rides,
-      "plotted_ride_count": len(map_rides),
-      "unresolved_ride_count": len(unresolved_rides),
+      "plotted_ride_count": network["plotted"],
+      "unresolved_ride_count": network["rides"] - network["plotted"],
       "corridor_cards": corridor_cards,
-      "pickup_hotspots": pickup_hotspots,
-      "network_rides": available_rides.count(),
-      "network_seats": available_rides.aggregate(total=Sum("seats_available"))["total"] or 0,
+      "pickup_hotspots": sidebar["pickup_hotspots"],
+      "network_rides": network["rides"],
+      "network_seats": network["seats"] or 0,
     },
   )
 
 
-def road_route(request):
+def _parse_road_route_query(query):
+  # Returns (origin, destination, level, route_format, None), or a 400
+  # response in the last slot when the query is invalid.
   try:
-    origin_lat = float(request.GET.get("origin_lat", ""))
-    origin_lng = float(request.GET.get("origin_lng", ""))
-    destination_lat = float(request.GET.get("destination_lat", ""))
-    destination_lng = float(request.GET.get("destination_lng", ""))
+    origin_lat = float(query.get("origin_lat", ""))
+    origin_lng = float(query.get("origin_lng", ""))
+    destination_lat = float(query.get("destination_lat", ""))
+    destination_lng = float(query.get("destination_lng", ""))
   except (TypeError, ValueError):
-    return JsonResponse({"coordinates": None, "error": "invalid_coordinates"}, status=400)
+    return None, None, None, None, JsonResponse(
+      {"coordinates": None, "error": "invalid_coordinates"}, status=400
+    )
 
   if not _valid_lat_lng(origin_lat, origin_lng) or not _valid_lat_lng(
     destination_lat, destination_lng
   ):
-    return JsonResponse({"coordinates": None, "error": "invalid_coordinates"}, status=400)
+    return None, None, None, None, JsonResponse(
+      {"coordinates": None, "error": "invalid_coordinates"}, status=400
+    )
 
-  origin = [origin_lat, origin_lng]
-  destination = [destination_lat, destination_lng]
+  try:
+    level = parse_detail_level(query.get("zoom"), query.get("tolerance"))
+  except (TypeError, ValueError):
+    return None, None, None, None, JsonResponse(
+      {"coordinates": None, "error": "invalid_detail_level"}, status=400
+    )
+
+  route_format = query.get("format") or "json"
+  if route_format not in ROUTE_FORMATS:
+    return None, None, None, None, JsonResponse(
+      {"coordinates": None, "error": "invalid_format"}, status=400
+    )
+
+  return [origin_lat, origin_lng], [destination_lat, destination_lng], level, route_format, None
+
+
+def road_route(request):
+  origin, destination, level, route_format, error = _parse_road_route_query(request.GET)
+  if error is not None:
+    return error
+
+  if origin == destination:
+    return _route_response([origin, destination], route_format)
+
+  key = build_route_key(origin, destination)
+  etag = _route_etag(key, level, route_format)
+  not_modified = _route_not_modified(request, etag)
+  if not_modified is not None:
+    return not_modified
+
+  if level:
+    simplified = ROUTE_COORDINATE_CACHE.get(detail_key(key, level))
+    if simplified is not MISSING:
+      return _route_response(simplified, route_format, etag=etag)
+
+  coordinates = fetch_road_route(origin, destination)
+  if coordinates is None:
+    return _route_response([origin, destination], route_format, fallback=True)
+
+  return _route_response(simplify_road_route(key, coordinates, level), route_format, etag=etag)
+
+
+async def road_route_async(request):
+  # Same contract as road_route. Served under ASGI it never blocks the worker
+  # on the routing backend, so one process can keep hundreds of lookups in
+  # flight over a bounded pool of keep-alive connections.
+  origin, destination, level, route_format, error = _parse_road_route_query(request.GET)
+  if error is not None:
+    return error
 
   if origin == destination:
-    return JsonResponse({"coordinates": [origin, destination]})
+    return _route_response([origin, destination], route_format)
+
+  key = build_route_key(origin, destination)
+  etag = _route_etag(key, level, route_format)
+  not_modified = _route_not_modified(request, etag)
+  if not_modified is not None:
+    return not_modified
 
-  coordinates = _fetch_road_route(origin, destination)
-  return JsonResponse({"coordinates": coordinates})
+  if level:
+    simplified = await sync_to_async(ROUTE_COORDINATE_CACHE.get)(detail_key(key, level))
+    if simplified is not MISSING:
+      return _route_response(simplified, route_format, etag=etag)
+
+  coordinates = await async_fetch_road_route(origin, destination)
+  if coordinates is None:
+    return _route_response([origin, destination], route_format, fallback=True)
+
+  if level:
+    coordinates = await sync_to_async(simplify_road_route)(key, coordinates, level)
+  return _route_response(coordinates, route_format, etag=etag)
+
+
+def _simplify_road_routes(routes, level):
+  return {key: simplify_road_route(key, coordinates, level) for key, coordinates in routes.items()}
+
+
+# Read-only lookup with no user state, so the map script can POST without a
+# CSRF token.
+@csrf_exempt
+@require_POST
+async def road_route_batch(request):
+  try:
+    payload = json.loads(request.body or b"{}")
+  except ValueError:
+    return JsonResponse({"routes": None, "error": "invalid_payload"}, status=400)
+
+  raw_pairs = payload.get("pairs") if isinstance(payload, dict) else None
+  if not isinstance(raw_pairs, list):
+    return JsonResponse({"routes": None, "error": "invalid_payload"}, status=400)
+
+  if len(raw_pairs) > ROUTE_BATCH_MAX_PAIRS:
+    return JsonResponse({"routes": None, "error": "too_many_pairs"}, status=400)
+
+  try:
+    level = parse_detail_level(payload.get("zoom"), payload.get("tolerance"))
+  except (TypeError, ValueError):
+    return JsonResponse({"routes": None, "error": "invalid_detail_level"}, status=400)
+
+  route_format = payload.get("format") or "json"
+  if route_format not in ROUTE_FORMATS:
+    return JsonResponse({"routes": None, "error": "invalid_format"}, status=400)
+
+  # Identical corridors collapse onto one route key and one lookup.
+  keys = []
+  pairs = {}
+  for raw_pair in raw_pairs:
+    endpoints = _parse_route_pair(raw_pair)
+    if endpoints is None:
+      keys.append(None)
+      continue
+
+    key = build_route_key(*endpoints)
+    keys.append(key)
+    pairs.setdefault(key, endpoints)
+
+  # Already-simplified routes skip the full geometry entirely.
+  simplified = {}
+  if level:
+    detail_keys = {key: detail_key(key, level) for key in pairs}
+    cached = await sync_to_async(ROUTE_COORDINATE_CACHE.get_many)(list(detail_keys.values()))
+    simplified = {key: cached[name] for key, name in detail_keys.items() if name in cached}
+
+  # Served under ASGI, the upstream lookups for the misses run concurrently
+  # without holding a thread.
+  routes = await async_fetch_road_routes(
+    {key: endpoints for key, endpoints in pairs.items() if key not in simplified}
+  )
+  if level:
+    routes = await sync_to_async(_simplify_road_routes)(routes, level)
+  routes.update(simplified)
+
+  # Corridors without a road route come back as a straight line and are listed
+  # in "fallbacks" so the map can draw them differently.
+  fallbacks = [key for key, coordinates in routes.items() if coordinates is None]
+  for key in fallbacks:
+    routes[key] = list(pairs[key])
+
+  routes = {key: _encode_route(coordinates, route_format) for key, coordinates in routes.items()}
+  return JsonResponse({"keys": keys, "routes": routes, "fallbacks": fallbacks})
 
 
 def rider_profile(request, person_id):
@@ -644,3 +769,230 @@ def faq(request):
       "support_sent": support_sent,
     },
   )
+
+
+def _nearby_ride_payload(ride, distance_km=None):
+  payload = {
+    "id": ride.id,
+    "first_name": ride.first_name,
+    "origination": ride.origination,
+    "destination_city": ride.destination_city,
+    "destination_state": ride.destination_state,
+    "date": ride.date.isoformat(),
+    "time": ride.time.strftime("%H:%M"),
+    "taking_passengers": ride.taking_passengers,
+    "seats_available": ride.seats_available,
+    "origin": [ride.origin_lat, ride.origin_lng],
+    "destination": [ride.destination_lat, ride.destination_lng],
+  }
+  if distance_km is not None:
+    payload["distance_km"] = round(distance_km, 3)
+  return payload
+
+
+def nearby_rides(request):
+  # Rides with an endpoint near a point (lat, lng, radius_km), nearest first,
+  # or inside a box (bbox=west,south,east,north), in date order. `side` picks
+  # which endpoint counts: origin (default), destination or either.
+  side = request.GET.get("side") or "origin"
+  if side not in SIDES:
+    return JsonResponse({"rides": None, "error": "invalid_side"}, status=400)
+
+  try:
+    limit = int(request.GET.get("limit") or NEARBY_RIDES_MAX_RESULTS)
+    limit = max(1, min(limit, NEARBY_RIDES_MAX_RESULTS))
+  except ValueError:
+    return JsonResponse({"rides": None, "error": "invalid_limit"}, status=400)
+
+  rides = Person.objects.all()
+  if request.GET.get("open") in ("1", "true"):
+    rides = rides.filter(taking_passengers=True, seats_available__gt=0)
+
+  if request.GET.get("bbox"):
+    box = _parse_bbox(request.GET["bbox"])
+    if box is None:
+      return JsonResponse({"rides": None, "error": "invalid_bbox"}, status=400)
+
+    matches = rides_in_box(box, side, rides).order_by("date", "time", "id")
+    count = matches.count()
+    payload = [_nearby_ride_payload(ride) for ride in matches[:limit]]
+    return JsonResponse({"count": count, "rides": payload})
+
+  try:
+    latitude = float(request.GET.get("lat", ""))
+    longitude = float(request.GET.get("lng", ""))
+    radius_km = float(request.GET.get("radius_km") or 25)
+  except ValueError:
+    return JsonResponse({"rides": None, "error": "invalid_coordinates"}, status=400)
+  if not _valid_lat_lng(latitude, longitude) or not 0 < radius_km <= NEARBY_RIDES_MAX_RADIUS_KM:
+    return JsonResponse({"rides": None, "error": "invalid_coordinates"}, status=400)
+
+  distances = rides_near(latitude, longitude, radius_km, side, rides)
+  nearest = list(distances)[:limit]
+  by_id = Person.objects.in_bulk(nearest)
+  payload = [_nearby_ride_payload(by_id[pk], distances[pk]) for pk in nearest if pk in by_id]
+  return JsonResponse({"count": len(distances), "rides": payload})
+
+
+def _map_ride_payload(ride):
+  return {
+    "id": ride.id,
+    "first_name": ride.first_name,
+    "occupation": ride.occupation,
+    "looking_for": ride.looking_for,
+    "origination": ride.origination,
+    "destination_city": ride.destination_city,
+    "destination_state": ride.destination_state,
+    "date": ride.date.isoformat(),
+    "time": ride.time.strftime("%H:%M"),
+    "seats_available": ride.seats_available,
+    "rider_profile_url": reverse("rides:rider_profile", args=[ride.id]),
+    "destination_lat": ride.destination_lat,
+    "destination_lng": ride.destination_lng,
+  }
+
+
+def _point_feature(latitude, longitude, properties):
+  return {
+    "type": "Feature",
+    "geometry": {"type": "Point", "coordinates": [longitude, latitude]},
+    "properties": properties,
+  }
+
+
+def _map_features(box, zoom):
+  rides = Person.objects.filter(
+    taking_passengers=True, seats_available__gt=0, destination_lat__isnull=False
+  )
+  points = rides_in_box(box, "origin", rides).values_list(
+    "pk", "origin_lat", "origin_lng", "seats_available"
+  )
+  if zoom < MAP_CLUSTER_MAX_ZOOM:
+    clusters = grid_clusters(points, zoom, MAP_CLUSTER_CELL_PIXELS)
+  else:
+    clusters = [([pk], lat, lng, seats, None) for pk, lat, lng, seats in sorted(points)]
+
+  # Full rows only for rides drawn on their own, with any road route the
+  # route worker has already stored; the map script fetches the rest.
+  by_id = Person.objects.in_bulk([keys[0] for keys, *_ in clusters if len(keys) == 1])
+  route_keys = {
+    pk: build_route_key(
+      (ride.origin_lat, ride.origin_lng), (ride.destination_lat, ride.destination_lng)
+    )
+    for pk, ride in by_id.items()
+  }
+  ready_routes = stored_routes(set(route_keys.values()), ROUTE_EMBED_LEVEL)
+
+  features = []
+  for keys, latitude, longitude, seats, bounds in clusters:
+    if len(keys) > 1:
+      feature = _point_feature(
+        latitude, longitude, {"cluster": True, "count": len(keys), "seats_available": seats}
+      )
+      south, west, north, east = bounds
+      feature["bbox"] = [west, south, east, north]
+      features.append(feature)
+    elif keys[0] in by_id:
+      ride = by_id[keys[0]]
+      route = ready_routes.get(route_keys[ride.pk])
+      properties = _map_ride_payload(ride)
+      properties["route"] = encode_polyline(route) if route else None
+      features.append(_point_feature(ride.origin_lat, ride.origin_lng, properties))
+  return features
+
+
+def rides_geojson(request):
+  # Open rides whose origin is inside ?bbox=west,south,east,north, as a
+  # GeoJSON FeatureCollection for the map at ?zoom=. Below
+  # MAP_CLUSTER_MAX_ZOOM, rides sharing a grid cell come back as one
+  # {"cluster": true, "count", "seats_available"} feature with a bbox.
+  box = _parse_bbox(request.GET.get("bbox") or "")
+  if box is None:
+    return JsonResponse({"features": None, "error": "invalid_bbox"}, status=400)
+  try:
+    zoom = int(request.GET.get("zoom") or "")
+  except ValueError:
+    zoom = -1
+  if not 0 <= zoom <= MAP_MAX_ZOOM:
+    return JsonResponse({"features": None, "error": "invalid_zoom"}, status=400)
+
+  # Cached per ride data generation and exact query string, so repeat views
+  # of the same area (such as the map's opening view) skip the work.
+  return cached_response(
+    "rides_geojson",
+    request,
+    (),
+    lambda: JsonResponse(
+      {
+        "type": "FeatureCollection",
+        "zoom": zoom,
+        "cluster_max_zoom": MAP_CLUSTER_MAX_ZOOM,
+        "features": _map_features(box, zoom),
+      }
+    ),
+  )
+
+
+def ride_tile(request, zoom, x, y):
+  # Ride density and corridor layers for slippy-map tile zoom/x/y as JSON
+  # (see tiles.render_tile), served from the on-disk tile cache.
+  if not valid_tile(zoom, x, y):
+    return JsonResponse({"error": "invalid_tile", "max_zoom": TILE_MAX_ZOOM}, status=404)
+
+  content, cache_status = cached_tile(zoom, x, y)
+  response = HttpResponse(content, content_type="application/json")
+  response["X-Tile-Cache"] = cache_status
+  patch_cache_control(response, public=True, max_age=TILE_MAX_AGE)
+  return response
+
+
+@staff_member_required
+def export_rides(request):
+  # Every matching ride as CSV (default) or NDJSON (?format=ndjson), streamed
+  # row by row. Takes the ride search's filters (search, travel_date, ...).
+  filters = request.GET.copy()
+  export_format = filters.pop("format", ["csv"])[-1]
+  if export_format not in EXPORT_FORMATS:
+    return JsonResponse({"error": "invalid_format"}, status=400)
+
+  form = RideForm(filters)
+  if not form.is_valid():
+    return JsonResponse({"error": "invalid_filters", "fields": form.errors}, status=400)
+
+  response = StreamingHttpResponse(
+    export_lines(export_format, export_rows(form.cleaned_data)),
+    content_type=EXPORT_FORMATS[export_format],
+  )
+  filename = f"rides-{timezone.localdate():%Y%m%d}.{export_format}"
+  response["Content-Disposition"] = f'attachment; filename="{filename}"'
+  response["Cache-Control"] = "no-store"
+  return response
+
+
+@staff_member_required
+def cache_stats(request):
+  # Hit rates and sizes of this worker's caches.
+  return JsonResponse(
+    {
+      "search": SEARCH_RESULT_CACHE.stats(),
+      "road_routes": ROUTE_COORDINATE_CACHE.stats(),
+      "pages": page_cache_stats(),
+      "ride_generation": current_generation(),
+    }
+  )
+
+
+def suggest(request):
+  # Typeahead for the search box: cities, states and interests starting with
+  # ?q=, most used first. ?kind= (repeatable) narrows the kinds.
+  query = request.GET.get("q", "")[:64]
+  kinds = tuple(kind for kind in request.GET.getlist("kind") if kind in SUGGESTION_KINDS)
+  try:
+    limit = max(1, min(int(request.GET.get("limit") or 8), SUGGEST_MAX_RESULTS))
+  except ValueError:
+    return JsonResponse({"suggestions": None, "error": "invalid_limit"}, status=400)
+
+  suggestions = get_suggest_index().suggest(query, limit, kinds or SUGGESTION_KINDS)
+  response = JsonResponse({"query": query, "suggestions": suggestions})
+  patch_cache_control(response, public=True, max_age=SUGGEST_MAX_AGE)
+  return response
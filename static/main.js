@@ -8,13 +8,15 @@ function checkForm() {
   var dateField = form.querySelector("input[name='travel_date']");
   var seatsField = form.querySelector("input[name='minimum_seats']");
   var passengersField = form.querySelector("input[name='passengers_only']");
+  var nearField = form.querySelector("input[name='near']");
 
   var hasSearch = searchField && searchField.value.trim() !== "";
   var hasDate = dateField && dateField.value.trim() !== "";
   var hasSeats = seatsField && seatsField.value.trim() !== "";
   var hasPassengersOnly = passengersField && passengersField.checked;
+  var hasNear = nearField && nearField.value.trim() !== "";
 
-  return hasSearch || hasDate || hasSeats || hasPassengersOnly;
+  return hasSearch || hasDate || hasSeats || hasPassengersOnly || hasNear;
 }
 
 function initSearchHints() {
@@ -36,6 +38,53 @@ function initSearchHints() {
   });
 }
 
+function initSearchSuggestions() {
+  var form = document.querySelector(".search-form[data-suggest-url]");
+  var list = document.getElementById("search-suggestions");
+  var searchField = form && form.querySelector("input[name='search']");
+  if (!form || !list || !searchField || !window.fetch) {
+    return;
+  }
+
+  var url = form.getAttribute("data-suggest-url");
+  var timer = null;
+  var latest = "";
+
+  // Suggest for the word being typed, keeping the words before it.
+  searchField.addEventListener("input", function () {
+    window.clearTimeout(timer);
+    timer = window.setTimeout(function () {
+      var value = searchField.value;
+      var words = value.split(/[\s,]+/);
+      var prefix = words.pop() || "";
+      var lead = value.slice(0, value.length - prefix.length);
+      latest = value;
+      if (prefix.length < 2) {
+        list.innerHTML = "";
+        return;
+      }
+
+      fetch(url + "?q=" + encodeURIComponent(prefix) + "&limit=8")
+        .then(function (response) {
+          return response.ok ? response.json() : { suggestions: [] };
+        })
+        .then(function (payload) {
+          if (latest !== value) {
+            return;
+          }
+          list.innerHTML = "";
+          (payload.suggestions || []).forEach(function (suggestion) {
+            var option = document.createElement("option");
+            option.value = lead + suggestion.text;
+            option.label = suggestion.kind;
+            list.appendChild(option);
+          });
+        })
+        .catch(function () {});
+    }, 150);
+  });
+}
+
 function initFaqAccordion() {
   var faqContainer = document.querySelector("[data-faq-list]");
   if (!faqContainer) {
@@ -170,17 +219,29 @@ function escapeHtml(value) {
     .replace(/'/g, "&#039;");
 }
 
-function readMapRides() {
-  var script = document.getElementById("map-rides-data");
-  if (!script) {
-    return [];
+// "south,west,north,east" of every plotted ride, set by the map page.
+function readMapBounds(mapElement) {
+  var values = (mapElement.dataset.bounds || "").split(",").map(toFiniteNumber);
+  if (values.length !== 4 || values.indexOf(null) !== -1) {
+    return null;
   }
+  return [
+    [values[0], values[1]],
+    [values[2], values[3]],
+  ];
+}
 
-  try {
-    return JSON.parse(script.textContent);
-  } catch (error) {
-    return [];
-  }
+function rideFeaturesUrl(baseUrl, map, zoom) {
+  var bounds = map.getBounds();
+  var bbox = [
+    Math.max(bounds.getWest(), -180),
+    Math.max(bounds.getSouth(), -90),
+    Math.min(bounds.getEast(), 180),
+    Math.min(bounds.getNorth(), 90),
+  ].map(function (value) {
+    return value.toFixed(4);
+  });
+  return baseUrl + "?bbox=" + bbox.join(",") + "&zoom=" + zoom;
 }
 
 function renderRidePopup(ride) {
@@ -273,38 +334,104 @@ function normalizePathCoordinates(rawCoordinates) {
   return coordinates.length > 1 ? coordinates : null;
 }
 
-async function fetchRoadRoute(origin, destination, routeCache) {
-  var key = buildRouteKey(origin, destination);
-  if (Object.prototype.hasOwnProperty.call(routeCache, key)) {
-    return routeCache[key];
+// Keep in step with ROUTE_BATCH_MAX_PAIRS in rides/views.py and
+// ROUTE_FULL_DETAIL_ZOOM in rides/routing.py.
+var ROAD_ROUTE_BATCH_SIZE = 200;
+var ROAD_ROUTE_FULL_DETAIL_ZOOM = 17;
+
+// Zoom level of the routes included in the map rides API (ROUTE_EMBED_LEVEL
+// in rides/routing.py).
+var EMBEDDED_ROUTE_ZOOM = 10;
+
+// Decode a Google encoded polyline (precision 5) into [lat, lng] pairs.
+function decodePolyline(encoded) {
+  if (typeof encoded !== "string") {
+    return null;
+  }
+
+  var points = [];
+  var index = 0;
+  var latitude = 0;
+  var longitude = 0;
+
+  function readValue() {
+    var result = 0;
+    var shift = 0;
+    var byte;
+    do {
+      if (index >= encoded.length) {
+        throw new Error("Truncated polyline");
+      }
+      byte = encoded.charCodeAt(index) - 63;
+      index += 1;
+      result += (byte & 0x1f) * Math.pow(2, shift);
+      shift += 5;
+    } while (byte >= 0x20);
+    return result % 2 ? -(result + 1) / 2 : result / 2;
+  }
+
+  try {
+    while (index < encoded.length) {
+      latitude += readValue();
+      longitude += readValue();
+      points.push([latitude / 1e5, longitude / 1e5]);
+    }
+  } catch (error) {
+    return null;
   }
 
-  var url =
-    "/api/road-route/?" +
-    "origin_lat=" +
-    encodeURIComponent(origin[0]) +
-    "&origin_lng=" +
-    encodeURIComponent(origin[1]) +
-    "&destination_lat=" +
-    encodeURIComponent(destination[0]) +
-    "&destination_lng=" +
-    encodeURIComponent(destination[1]);
+  return points;
+}
+
+async function fetchRoadRouteBatch(pairs, zoom) {
+  var emptyResults = pairs.map(function () {
+    return null;
+  });
 
   try {
-    var response = await fetch(url, { headers: { Accept: "application/json" } });
+    var response = await fetch("/api/road-routes/", {
+      method: "POST",
+      headers: { Accept: "application/json", "Content-Type": "application/json" },
+      body: JSON.stringify({
+        zoom: zoom,
+        format: "polyline",
+        pairs: pairs.map(function (pair) {
+          return [pair[0][0], pair[0][1], pair[1][0], pair[1][1]];
+        }),
+      }),
+    });
     if (!response.ok) {
-      routeCache[key] = null;
-      return null;
+      return emptyResults;
     }
 
     var payload = await response.json();
-    var coordinates = normalizePathCoordinates(payload && payload.coordinates);
-    routeCache[key] = coordinates;
-    return coordinates;
+    var keys = (payload && payload.keys) || [];
+    var routes = (payload && payload.routes) || {};
+    var fallbacks = (payload && payload.fallbacks) || [];
+
+    // Straight-line fallbacks are drawn by the caller as dashed lines.
+    return pairs.map(function (pair, index) {
+      var key = keys[index];
+      if (!key || fallbacks.indexOf(key) !== -1) {
+        return null;
+      }
+      return normalizePathCoordinates(decodePolyline(routes[key]));
+    });
   } catch (error) {
-    routeCache[key] = null;
-    return null;
+    return emptyResults;
+  }
+}
+
+async function fetchRoadRoutes(pairs, zoom) {
+  var chunks = [];
+  for (var start = 0; start < pairs.length; start += ROAD_ROUTE_BATCH_SIZE) {
+    chunks.push(pairs.slice(start, start + ROAD_ROUTE_BATCH_SIZE));
   }
+
+  var chunkResults = await mapWithConcurrency(chunks, 2, function (chunk) {
+    return fetchRoadRouteBatch(chunk, zoom);
+  });
+  return [].concat.apply([], chunkResults);
 }
 
 async function mapWithConcurrency(items, concurrency, worker) {
@@ -329,13 +456,139 @@ async function mapWithConcurrency(items, concurrency, worker) {
   return results;
 }
 
+// Keep in step with TILE_MAX_ZOOM in rides/tiles.py.
+var RIDE_TILE_URL = "/tiles/{z}/{x}/{y}";
+var RIDE_TILE_MAX_ZOOM = 14;
+
+function drawRideTile(canvas, map, coords, tileSize, payload) {
+  var context = canvas.getContext("2d");
+  var origin = coords.scaleBy(tileSize);
+
+  function toPixel(lngLat) {
+    return map.project([lngLat[1], lngLat[0]], coords.z).subtract(origin);
+  }
+
+  context.lineCap = "round";
+  ((payload.corridors && payload.corridors.features) || []).forEach(function (feature) {
+    var start = toPixel(feature.geometry.coordinates[0]);
+    var end = toPixel(feature.geometry.coordinates[1]);
+    context.strokeStyle = "rgba(122, 184, 255, 0.45)";
+    context.lineWidth = Math.min(6, 1 + Math.log2(feature.properties.rides));
+    context.beginPath();
+    context.moveTo(start.x, start.y);
+    context.lineTo(end.x, end.y);
+    context.stroke();
+  });
+
+  ((payload.density && payload.density.features) || []).forEach(function (feature) {
+    var point = toPixel(feature.geometry.coordinates);
+    var count = feature.properties.count;
+    context.fillStyle = "rgba(255, 106, 0, " + Math.min(0.85, 0.25 + count / 40) + ")";
+    context.beginPath();
+    context.arc(point.x, point.y, Math.min(12, 3 + 2 * Math.sqrt(count)), 0, 2 * Math.PI);
+    context.fill();
+  });
+}
+
+// Ride density and corridor overlay for the whole network, drawn on canvas
+// from the cached tiles at /tiles/{z}/{x}/{y}.
+function createRideDensityLayer() {
+  var DensityLayer = window.L.GridLayer.extend({
+    createTile: function (coords, done) {
+      var tile = document.createElement("canvas");
+      var tileSize = this.getTileSize();
+      tile.width = tileSize.x;
+      tile.height = tileSize.y;
+
+      var map = this._map;
+      var url = RIDE_TILE_URL.replace("{z}", coords.z)
+        .replace("{x}", coords.x)
+        .replace("{y}", coords.y);
+      fetch(url, { headers: { Accept: "application/json" } })
+        .then(function (response) {
+          return response.ok ? response.json() : null;
+        })
+        .then(function (payload) {
+          if (payload) {
+            drawRideTile(tile, map, coords, tileSize, payload);
+          }
+          done(null, tile);
+        })
+        .catch(function (error) {
+          done(error, tile);
+        });
+      return tile;
+    },
+  });
+  return new DensityLayer({ maxNativeZoom: RIDE_TILE_MAX_ZOOM, opacity: 0.9 });
+}
+
+function renderRideCluster(map, feature, clusterMaxZoom) {
+  var coordinates = feature.geometry.coordinates;
+  var count = feature.properties.count;
+  var size = count < 10 ? 30 : count < 100 ? 38 : 46;
+  var marker = window.L.marker([coordinates[1], coordinates[0]], {
+    icon: window.L.divIcon({
+      className: "ride-cluster",
+      html: "<span>" + escapeHtml(count) + "</span>",
+      iconSize: [size, size],
+    }),
+    title: count + " rides, " + feature.properties.seats_available + " open seats",
+  });
+
+  marker.on("click", function () {
+    var bbox = feature.bbox;
+    map.fitBounds(
+      [
+        [bbox[1], bbox[0]],
+        [bbox[3], bbox[2]],
+      ],
+      { padding: [24, 24], maxZoom: clusterMaxZoom }
+    );
+  });
+  return marker;
+}
+
+function renderRide(layer, entry, coordinates) {
+  var hasRoadRoute = Array.isArray(coordinates) && coordinates.length > 1;
+  var popup = renderRidePopup(entry.ride);
+
+  entry.line = window.L.polyline(hasRoadRoute ? coordinates : [entry.origin, entry.destination], {
+    color: "#ff6a00",
+    weight: 3,
+    opacity: 0.78,
+    dashArray: hasRoadRoute ? null : "6 6",
+  })
+    .addTo(layer)
+    .bindPopup(popup);
+
+  window.L.circleMarker(entry.origin, {
+    radius: 6,
+    color: "#2f1b0d",
+    weight: 1,
+    fillColor: "#ff8a33",
+    fillOpacity: 0.95,
+  })
+    .addTo(layer)
+    .bindPopup("<strong>Origin</strong><br>" + popup);
+
+  window.L.circleMarker(entry.destination, {
+    radius: 6,
+    color: "#26140a",
+    weight: 1,
+    fillColor: "#ff6a00",
+    fillOpacity: 0.95,
+  })
+    .addTo(layer)
+    .bindPopup("<strong>Destination</strong><br>" + popup);
+}
+
 async function initRideMap() {
   var mapElement = document.getElementById("rides-map");
   if (!mapElement || typeof window.L === "undefined") {
     return;
   }
 
-  var rides = readMapRides();
   var map = window.L.map(mapElement, { scrollWheelZoom: true });
 
   window.L.tileLayer("https://{s}.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}{r}.png", {
@@ -343,109 +596,162 @@ async function initRideMap() {
     attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors &copy; CARTO',
   }).addTo(map);
 
-  if (!rides.length) {
+  var initialBounds = readMapBounds(mapElement);
+  if (!initialBounds) {
     map.setView([39.8283, -98.5795], 4);
     setMapRouteStatus("No rides available to route.");
     return;
   }
+  map.fitBounds(initialBounds, { padding: [24, 24] });
+
+  var ridesLayer = window.L.layerGroup().addTo(map);
+  window.L.control
+    .layers(null, { "Rides in view": ridesLayer, "Network density": createRideDensityLayer() })
+    .addTo(map);
+  // Road geometry already drawn, by route key: { zoom, coordinates }, where
+  // coordinates is null for corridors that only have a straight-line fallback.
+  var knownRoutes = {};
+  var currentRequest = null;
+  var reloadTimer = null;
+
+  // Rides come from the server for the area in view on every pan and zoom;
+  // at low zoom nearby rides arrive as numbered clusters.
+  async function loadVisibleRides() {
+    if (currentRequest) {
+      currentRequest.abort();
+    }
+    var request = new AbortController();
+    currentRequest = request;
+
+    var zoom = Math.round(map.getZoom());
+    var payload;
+    try {
+      var response = await fetch(rideFeaturesUrl(mapElement.dataset.ridesUrl, map, zoom), {
+        headers: { Accept: "application/geo+json, application/json" },
+        signal: request.signal,
+      });
+      if (!response.ok) {
+        throw new Error("Ride request failed");
+      }
+      payload = await response.json();
+    } catch (error) {
+      if (error.name !== "AbortError") {
+        setMapRouteStatus("Could not load rides for this part of the map.");
+      }
+      return;
+    }
+    if (currentRequest !== request) {
+      return;
+    }
 
-  setMapRouteStatus("Computing road routes...");
-
-  var routeCache = {};
-  var bounds = [];
-  var roadRouteCount = 0;
-  var fallbackRouteCount = 0;
-  var maxConcurrentRouteRequests = 4;
+    ridesLayer.clearLayers();
+    var detailZoom = Math.min(zoom, ROAD_ROUTE_FULL_DETAIL_ZOOM);
+    var rideCount = 0;
+    var clusterCount = 0;
+    var pendingByKey = {};
+    var pendingKeys = [];
+    var entries = [];
+
+    (payload.features || []).forEach(function (feature) {
+      if (feature.properties.cluster) {
+        clusterCount += 1;
+        rideCount += feature.properties.count;
+        renderRideCluster(map, feature, payload.cluster_max_zoom).addTo(ridesLayer);
+        return;
+      }
 
-  var routedRides = await mapWithConcurrency(
-    rides,
-    maxConcurrentRouteRequests,
-    async function (ride) {
-      var origin = toLatLngPair(ride.origin_lat, ride.origin_lng);
+      var ride = feature.properties;
+      var origin = toLatLngPair(feature.geometry.coordinates[1], feature.geometry.coordinates[0]);
       var destination = toLatLngPair(ride.destination_lat, ride.destination_lng);
       if (!origin || !destination) {
-        fallbackRouteCount += 1;
-        return null;
+        return;
       }
 
-      var roadCoordinates = await fetchRoadRoute(origin, destination, routeCache);
-      var hasRoadRoute = Array.isArray(roadCoordinates) && roadCoordinates.length > 1;
-
-      if (hasRoadRoute) {
-        roadRouteCount += 1;
-      } else {
-        fallbackRouteCount += 1;
+      rideCount += 1;
+      var key = buildRouteKey(origin, destination);
+      var known = knownRoutes[key];
+      if (!known && ride.route) {
+        var includedRoute = normalizePathCoordinates(decodePolyline(ride.route));
+        if (includedRoute) {
+          known = knownRoutes[key] = { zoom: EMBEDDED_ROUTE_ZOOM, coordinates: includedRoute };
+        }
       }
 
-      return {
-        ride: ride,
-        origin: origin,
-        destination: destination,
-        path: hasRoadRoute ? roadCoordinates : [origin, destination],
-        hasRoadRoute: hasRoadRoute,
-      };
-    }
-  );
-
-  routedRides.forEach(function (entry) {
-    if (!entry) {
-      return;
-    }
-
-    var popup = renderRidePopup(entry.ride);
+      var entry = { ride: ride, origin: origin, destination: destination, key: key };
+      renderRide(ridesLayer, entry, known && known.coordinates);
+      entries.push(entry);
 
-    window.L.polyline(entry.path, {
-      color: "#ff6a00",
-      weight: 3,
-      opacity: 0.78,
-      dashArray: entry.hasRoadRoute ? null : "6 6",
-    })
-      .addTo(map)
-      .bindPopup(popup);
-
-    window.L.circleMarker(entry.origin, {
-      radius: 6,
-      color: "#2f1b0d",
-      weight: 1,
-      fillColor: "#ff8a33",
-      fillOpacity: 0.95,
-    })
-      .addTo(map)
-      .bindPopup("<strong>Origin</strong><br>" + popup);
-
-    window.L.circleMarker(entry.destination, {
-      radius: 6,
-      color: "#26140a",
-      weight: 1,
-      fillColor: "#ff6a00",
-      fillOpacity: 0.95,
-    })
-      .addTo(map)
-      .bindPopup("<strong>Destination</strong><br>" + popup);
+      // Corridors never fetched, or drawn coarser than this zoom, are asked
+      // for once each.
+      if (!known || (known.coordinates && known.zoom < detailZoom)) {
+        if (!pendingByKey[key]) {
+          pendingByKey[key] = [];
+          pendingKeys.push(key);
+        }
+        pendingByKey[key].push(entry);
+      }
+    });
 
-    bounds.push(entry.origin);
-    bounds.push(entry.destination);
-  });
+    if (pendingKeys.length) {
+      setMapRouteStatus("Computing road routes...");
+      var fetchedRoutes = await fetchRoadRoutes(
+        pendingKeys.map(function (key) {
+          var entry = pendingByKey[key][0];
+          return [entry.origin, entry.destination];
+        }),
+        detailZoom
+      );
+      fetchedRoutes.forEach(function (coordinates, position) {
+        var key = pendingKeys[position];
+        if (coordinates) {
+          knownRoutes[key] = { zoom: detailZoom, coordinates: coordinates };
+        } else if (!knownRoutes[key]) {
+          knownRoutes[key] = { zoom: detailZoom, coordinates: null };
+        }
+        if (currentRequest !== request || !coordinates) {
+          return;
+        }
+        pendingByKey[key].forEach(function (entry) {
+          entry.line.setLatLngs(coordinates);
+          entry.line.setStyle({ dashArray: null });
+        });
+      });
+      if (currentRequest !== request) {
+        return;
+      }
+    }
 
-  if (bounds.length) {
-    map.fitBounds(bounds, { padding: [24, 24] });
-  } else {
-    map.setView([39.8283, -98.5795], 4);
+    var roadRouteCount = entries.filter(function (entry) {
+      var known = knownRoutes[entry.key];
+      return known && known.coordinates;
+    }).length;
+    var fallbackRouteCount = entries.length - roadRouteCount;
+    setMapRouteStatus(
+      rideCount +
+        " ride" +
+        (rideCount === 1 ? "" : "s") +
+        " in view" +
+        (clusterCount ? " (" + clusterCount + " clustered groups)" : "") +
+        ". Road routes: " +
+        roadRouteCount +
+        " routed on roads, " +
+        fallbackRouteCount +
+        " fallback line" +
+        (fallbackRouteCount === 1 ? "" : "s") +
+        "."
+    );
   }
 
-  setMapRouteStatus(
-    "Road routes ready: " +
-      roadRouteCount +
-      " routed on roads, " +
-      fallbackRouteCount +
-      " fallback line" +
-      (fallbackRouteCount === 1 ? "" : "s") +
-      "."
-  );
+  map.on("moveend", function () {
+    window.clearTimeout(reloadTimer);
+    reloadTimer = window.setTimeout(loadVisibleRides, 150);
+  });
+  await loadVisibleRides();
 }
 
 document.addEventListener("DOMContentLoaded", function () {
   initSearchHints();
+  initSearchSuggestions();
   initFaqAccordion();
   initAddRideForm();
   initRideMap();